@@ -0,0 +1,331 @@
+"""
+Price alerts evaluated as observations are saved
+
+Watch rules live in the alert_rules table and are indexed in memory per
+ASIN and per search term:
+
+    below     price at or below threshold
+    drop      price at least threshold percent under the lowest price seen
+              in the last ALERT_DROP_WINDOW_DAYS
+    in_stock  a price shows up after an observation without one
+
+`below` and `drop` thresholds are kept in SortedLists, so checking an
+observation costs O(log n) plus the rules that actually fire.
+
+    python alerts.py add below --asin B07XYZ1234 --threshold 999
+    python alerts.py add drop --term "dog food" --threshold 20
+    python alerts.py list
+    python alerts.py remove 12
+    python alerts.py receive --port 8765    # webhook stand-in that prints what it gets
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+from sortedcontainers import SortedList
+
+from amazon_config import ALERT_LOG, ALERT_WEBHOOK_URL, ALERT_COOLDOWN, ALERT_DROP_WINDOW_DAYS
+from storage import (db, product_key, to_price, add_alert_rule, set_alert_rule_active, load_alert_rules,
+                     alert_rules_version, mark_alerts_fired, price_history_before, run_term, normalize_term,
+                     asin_terms)
+
+RULE_KINDS = ('below', 'drop', 'in_stock')
+
+
+class FileSink:
+    """Append each alert as a JSON line"""
+
+    def __init__(self, path=ALERT_LOG):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(alert, ensure_ascii=False) + '\n')
+
+
+class WebhookSink:
+    """POST each alert as JSON from a background thread so ingest never waits on the network"""
+
+    def __init__(self, url=ALERT_WEBHOOK_URL, timeout=5, max_pending=1000):
+        self.url = url
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._deliver, daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            print(f"Webhook queue full, dropping alert for rule {alert['rule_id']}")
+
+    def _deliver(self):
+        while True:
+            alert = self._queue.get()
+            try:
+                requests.post(self.url, json=alert, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Webhook delivery failed: {e}")
+
+
+def default_sinks():
+    sinks = [FileSink()]
+    if ALERT_WEBHOOK_URL:
+        sinks.append(WebhookSink())
+    return sinks
+
+
+class AlertIndex:
+    """Active rules keyed by ('asin', ASIN) or ('term', search term)"""
+
+    def __init__(self, rules=()):
+        self.rules = {}
+        self.below = defaultdict(SortedList)
+        self.drop = defaultdict(SortedList)
+        self.in_stock = defaultdict(set)
+        self.term_rules = 0
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        return len(self.rules)
+
+    @staticmethod
+    def rule_key(rule):
+        return ('asin', rule['asin']) if rule['asin'] else ('term', normalize_term(rule['term']))
+
+    def add(self, rule):
+        self.rules[rule['id']] = rule
+        key = self.rule_key(rule)
+        if key[0] == 'term':
+            self.term_rules += 1
+        if rule['kind'] == 'below':
+            self.below[key].add((rule['threshold'], rule['id']))
+        elif rule['kind'] == 'drop':
+            self.drop[key].add((rule['threshold'], rule['id']))
+        else:
+            self.in_stock[key].add(rule['id'])
+
+    def has_terms(self):
+        return self.term_rules > 0
+
+    def needs_history(self, keys):
+        """Whether drop or in_stock rules need this product's earlier prices"""
+        return any(key in self.drop or key in self.in_stock for key in keys)
+
+    def match_below(self, keys, price):
+        """Rules whose threshold is at or above the price"""
+        matches = []
+        for key in keys:
+            if key in self.below:
+                matches.extend(rule_id for _, rule_id in self.below[key].irange((price, 0)))
+        return matches
+
+    def match_drop(self, keys, percent):
+        """Rules asking for a drop of at most this percent"""
+        matches = []
+        for key in keys:
+            if key in self.drop:
+                matches.extend(rule_id for _, rule_id in self.drop[key].irange(maximum=(percent, float('inf'))))
+        return matches
+
+    def match_in_stock(self, keys):
+        return [rule_id for key in keys for rule_id in self.in_stock.get(key, ())]
+
+
+class AlertEngine:
+    def __init__(self, database=db, sinks=None, cooldown=ALERT_COOLDOWN, window_days=ALERT_DROP_WINDOW_DAYS):
+        self.db = database
+        self.sinks = default_sinks() if sinks is None else sinks
+        self.cooldown = cooldown
+        self.window = window_days * 86400
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.stats = {'checked': 0, 'fired': 0, 'check_seconds': 0.0}
+
+    def attach(self, database=None):
+        """Check every batch saved through the database from now on"""
+        (database or self.db).add_listener(self.on_ingest)
+
+    def refresh(self, force=False):
+        """Reload rules when another process (or the CLI) changed them"""
+        with self.db.reader() as conn:
+            version = alert_rules_version(conn)
+            with self._lock:
+                if force or self._index is None or version != self._version:
+                    self._index = AlertIndex(load_alert_rules(conn))
+                    self._version = version
+                return self._index
+
+    def add_rule(self, kind, asin=None, term=None, threshold=None):
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Unknown rule kind {kind}")
+        if not asin and not term:
+            raise ValueError("A rule needs an ASIN or a search term")
+        if kind != 'in_stock' and threshold is None:
+            raise ValueError(f"A {kind} rule needs a threshold")
+        with self.db.writer() as conn:
+            rule_id = add_alert_rule(conn, kind, asin, term, threshold)
+        self.refresh()
+        return rule_id
+
+    def remove_rule(self, rule_id):
+        with self.db.writer() as conn:
+            removed = set_alert_rule_active(conn, rule_id, False)
+        self.refresh()
+        return removed
+
+    def rules(self):
+        return list(self.refresh().rules.values())
+
+    def on_ingest(self, products, run_id, ts):
+        index = self.refresh()
+        if not index:
+            return []
+        started = time.time()
+        fired = []
+        with self.db.reader() as conn:
+            run_terms = set()
+            terms_by_asin = {}
+            if index.has_terms():
+                # Term rules cover every product a search for the term has found, including
+                # observations from ASIN-only refreshes whose runs carry no term
+                term = run_term(conn, run_id) if run_id else None
+                if term:
+                    run_terms.add(normalize_term(term))
+                terms_by_asin = asin_terms(conn, {product_key(p) for p in products})
+            for product in products:
+                terms = run_terms | terms_by_asin.get(product_key(product), set())
+                fired.extend(self.check(conn, index, product, terms, ts))
+        self.stats['checked'] += len(products)
+        self.stats['check_seconds'] += time.time() - started
+        if fired:
+            with self.db.writer() as conn:
+                mark_alerts_fired(conn, [alert['rule_id'] for alert in fired], ts)
+            self.stats['fired'] += len(fired)
+            for alert in fired:
+                for sink in self.sinks:
+                    try:
+                        sink.send(alert)
+                    except Exception as e:
+                        print(f"Alert sink {type(sink).__name__} failed: {e}")
+        return fired
+
+    def check(self, conn, index, product, terms, ts):
+        """Alerts fired by one observation"""
+        price = to_price(product.get('current_price'))
+        if price is None:
+            return []
+        asin = product_key(product)
+        keys = [('asin', asin)] + [('term', term) for term in sorted(terms)]
+        matches = [(rule_id, None) for rule_id in index.match_below(keys, price)]
+        if index.needs_history(keys):
+            low, last_price, seen = price_history_before(conn, asin, ts, ts - self.window)
+            if low and price < low:
+                matches.extend((rule_id, low) for rule_id in index.match_drop(keys, (low - price) / low * 100))
+            if seen and last_price is None:
+                matches.extend((rule_id, None) for rule_id in index.match_in_stock(keys))
+        alerts = []
+        for rule_id, reference in matches:
+            rule = index.rules[rule_id]
+            if rule['last_fired'] and ts - rule['last_fired'] < self.cooldown:
+                continue
+            rule['last_fired'] = ts
+            alerts.append(self.build_alert(rule, product, asin, price, reference, ts))
+        return alerts
+
+    @staticmethod
+    def build_alert(rule, product, asin, price, reference, ts):
+        name = product.get('product_name') or asin
+        if rule['kind'] == 'below':
+            message = f"{name} is {price:g}, at or below {rule['threshold']:g}"
+        elif rule['kind'] == 'drop':
+            message = f"{name} dropped to {price:g} from a {ALERT_DROP_WINDOW_DAYS}-day low of {reference:g}"
+        else:
+            message = f"{name} is back in stock at {price:g}"
+        return {
+            'rule_id': rule['id'],
+            'kind': rule['kind'],
+            'asin': asin,
+            'term': rule['term'],
+            'threshold': rule['threshold'],
+            'product_name': product.get('product_name'),
+            'price': price,
+            'reference_price': reference,
+            'message': message,
+            'ts': ts
+        }
+
+
+# Global engine; app.py and the Scrapy pipeline attach it to the shared database
+alert_engine = AlertEngine()
+
+
+class _ReceiverHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            print(json.loads(body).get('message'))
+        except ValueError:
+            print(body)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def receive(port):
+    """Local stand-in for a webhook endpoint"""
+    print(f"Listening for alerts on http://127.0.0.1:{port}/")
+    HTTPServer(('127.0.0.1', port), _ReceiverHandler).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage price alert rules')
+    sub = parser.add_subparsers(dest='command', required=True)
+    add = sub.add_parser('add', help='add a watch rule')
+    add.add_argument('kind', choices=RULE_KINDS)
+    add.add_argument('--asin')
+    add.add_argument('--term')
+    add.add_argument('--threshold', type=float, help='price for below, percent for drop')
+    sub.add_parser('list', help='show active rules')
+    remove = sub.add_parser('remove', help='deactivate a rule')
+    remove.add_argument('rule_id', type=int)
+    recv = sub.add_parser('receive', help='run a local webhook stand-in')
+    recv.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        try:
+            rule_id = alert_engine.add_rule(args.kind, args.asin, args.term, args.threshold)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Added rule {rule_id}")
+    elif args.command == 'list':
+        for rule in alert_engine.rules():
+            target = rule['asin'] or f"term '{rule['term']}'"
+            threshold = '' if rule['threshold'] is None else f" {rule['threshold']:g}"
+            print(f"{rule['id']}: {rule['kind']}{threshold} for {target}")
+    elif args.command == 'remove':
+        print("Removed" if alert_engine.remove_rule(args.rule_id) else "No such rule")
+    else:
+        receive(args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
 from selenium import webdriver
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.service import Service
+from functools import lru_cache
+import os
 
 DIRECTORY = 'reports'
+# Absolute so the Flask app and the Scrapy pipeline always share one database
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'products_new.db')
+DB_READ_POOL_SIZE = 8  # Pooled read-only connections kept open
+
+# Append-only report history under DIRECTORY/<name>/
+REPORT_SEGMENT_BYTES = 1024 * 1024  # New reports are appended to segments of about this size
+REPORT_ARCHIVE_BYTES = 64 * 1024 * 1024  # Compaction packs small segments into archives of this size
+REPORT_COMPACT_SEGMENTS = 16  # Compact once this many small segments pile up
 NAME = 'book'
 CURRENCY = '₹'
 MIN_PRICE = '200'
@@ -13,10 +23,102 @@ FILTERS = {
 }
 BASE_URL = 'https://www.amazon.in/'
 ALLOWED_SELLERS = ['Kennel Kitchen', 'Purina', 'Pedigree', 'Royal Canin', 'Drools', 'Whiskas', 'Purepet', 'Farmina', 'Chip chops']
+FILTER_BY_SELLER = False  # Drop search cards whose brand is not in ALLOWED_SELLERS
+
+# Warm Chrome driver pool shared by the app, scheduler and tracker
+DRIVER_POOL_SIZE = 2
+DRIVER_MAX_PAGES = 50  # Recycle a browser after this many page loads
+DRIVER_LEASE_TIMEOUT = 300  # Seconds to wait for a free browser
+
+# Background scrape jobs behind the Flask /run endpoint
+JOB_WORKERS = 2
+JOB_QUEUE_LIMIT = 20  # Reject new jobs once this many are queued or running
+JOB_HISTORY = 100  # Finished jobs kept for status polling
+
+# In-process Scrapy service used for the Scrapy fallback
+CRAWL_CONCURRENCY = 2  # Crawls running at once on the shared reactor
+CRAWL_TIMEOUT = 900  # Seconds a caller waits for a crawl's items
+CRAWL_OUTPUT_DIR = os.path.join(DIRECTORY, 'crawls')  # Per-crawl NDJSON, removed once the crawl finishes
+
+# Price alerts checked against every saved observation
+ALERT_LOG = os.path.join(DIRECTORY, 'alerts.jsonl')  # FileSink output
+ALERT_WEBHOOK_URL = None  # POST fired alerts here as JSON, e.g. http://127.0.0.1:8765/
+ALERT_COOLDOWN = 12 * 3600  # Seconds before the same rule may fire again
+ALERT_DROP_WINDOW_DAYS = 30  # "drop" rules compare against the lowest price in this window
+
+# Search result pages fetched in parallel by AmazonAPI
+SEARCH_PAGES = 3
+SEARCH_LEASE_TIMEOUT = 5  # Seconds to wait for an extra browser before reusing our own
+MAX_PRODUCT_PAGES = 5  # Product pages visited per run to avoid blocking
+
+# One request budget per host, shared by every process and engine on this machine
+RATE_LIMIT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rate_limits.db')
+RATE_LIMITS = {
+    'amazon.in': (0.5, 3),  # (requests per second across all workers, burst)
+}
+RATE_LIMIT_DEFAULT = None  # Budget for hosts not listed above; None leaves them unlimited
+RATE_LIMIT_JITTER = 1.0  # Up to this many extra random seconds after each acquire
+RATE_LIMIT_TIMEOUT = 300  # Give up waiting for a token after this many seconds
+
+# Direct refresh of known ASINs (refresh.py): product pages only, no search
+REFRESH_BATCH_SIZE = 10  # ASINs fetched per browser lease and saved per transaction
+REFRESH_WORKERS = DRIVER_POOL_SIZE  # Batches fetched in parallel, one pooled browser each
+REFRESH_ENGINE = 'selenium'  # or 'scrapy'
+
+# Checkpointed search runs (tracker.py): each product is saved as it arrives and the ASIN frontier is journaled
+CHECKPOINT_ENABLED = True
+CHECKPOINT_RESUME_WINDOW = 6 * 3600  # An unfinished run of the same search younger than this is resumed, not restarted
+CHECKPOINT_STALE = 600  # Seconds without a checkpoint before a 'running' run counts as abandoned
+
+# Multi-term watchlist runner (watchlist.py)
+WATCHLIST_FILE = 'watchlist.jsonl'  # {"term": ..., "min": ..., "max": ...} per line, or CSV term,min,max
+WATCHLIST_WORKERS = 2  # Worker processes, each with its own browser (or Scrapy reactor)
+WATCHLIST_BROWSERS = 1  # Browsers per worker process
+WATCHLIST_ENGINE = 'selenium'  # or 'scrapy'
+
+# Shared work queue (work_queue.py): /run and the scheduler enqueue, `python work_queue.py worker` processes
+WORK_QUEUE_ENABLED = False  # Off: scrapes run in the process that asked for them
+WORK_QUEUE_BACKEND = 'sqlite'  # or 'memory', an in-process stand-in served by local worker threads
+WORK_QUEUE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'work_queue.db')
+WORK_QUEUE_LEASE = 300  # Seconds a claimed item stays invisible to other workers without a heartbeat
+WORK_QUEUE_MAX_ATTEMPTS = 5  # Then the item is dead-lettered
+WORK_QUEUE_BACKOFF = 30  # Seconds before the first retry, doubling per attempt...
+WORK_QUEUE_BACKOFF_MAX = 3600  # ...up to this
+WORK_QUEUE_POLL = 5  # Seconds an idle worker sleeps between claims
+WORK_QUEUE_LOCAL_WORKERS = 2  # Worker threads the app starts for the memory backend
+WORK_QUEUE_WAIT_TIMEOUT = 3600  # Seconds a /run job follows its queued item before failing
+
+# Adaptive scheduler (scheduler.py): volatile products and ones near an alert are refreshed more often
+SCHEDULE_TERMS = [NAME]  # Searched again every SCHEDULE_TERM_INTERVAL to discover new products
+SCHEDULE_TERM_INTERVAL = 7 * 24 * 3600
+SCHEDULE_BASE_INTERVAL = 24 * 3600  # Refresh interval for a product with a flat price
+SCHEDULE_MIN_INTERVAL = 3600
+SCHEDULE_MAX_INTERVAL = 7 * 24 * 3600
+SCHEDULE_CV_REF = 0.05  # Price std dev / mean at which a product is refreshed twice as often
+SCHEDULE_ALERT_NEAR = 0.10  # Within this fraction of an alert threshold the interval shrinks...
+SCHEDULE_ALERT_MIN_FACTOR = 0.25  # ...down to this share of its usual length
+SCHEDULE_HOURLY_BUDGET = 120  # Page requests per hour the scheduler may spend
+SCHEDULE_BATCH = REFRESH_BATCH_SIZE * REFRESH_WORKERS  # Due ASINs refreshed together
+SCHEDULE_REPLAN = 900  # Seconds between full re-plans from the database
+
+# Engine selection: order Selenium/Scrapy by expected time-to-result from recent runs
+ENGINE_PRIOR_SECONDS = {'selenium': 90, 'scrapy': 120}  # Assumed run time before any runs are observed
+ENGINE_PRIOR_WEIGHT = 2  # Pseudo-runs (half successes) blended into the observed stats
+ENGINE_HALF_LIFE = 6 * 3600  # Seconds for an observed run to count half; old failures fade back to the prior
+ENGINE_WINDOW = 100  # Runs kept per engine
+ENGINE_HEDGE = True  # Start the next engine when the first is slower than usual; first result wins
+ENGINE_HEDGE_PERCENTILE = 90  # ...where "slower than usual" is this percentile of its successful runs
+ENGINE_HEDGE_MIN_SAMPLES = 5  # Successful runs needed before the percentile is trusted
+ENGINE_HEDGE_DEFAULT_SECONDS = 240  # Hedge delay until then
+
 
+@lru_cache(maxsize=None)
+def get_chromedriver_path():
+    # Resolve the driver binary once per process instead of on every browser start
+    return ChromeDriverManager().install()
 
 def get_chrome_driver(options):
-    service = Service(ChromeDriverManager().install())
+    service = Service(get_chromedriver_path())
     return webdriver.Chrome(service=service, options=options)
 
 def get_chrome_options():
@@ -0,0 +1,177 @@
+"""
+Long-lived Scrapy service for callers outside Scrapy (the Flask app, scheduler)
+
+Twisted's reactor can only be started once per process, so instead of a new
+CrawlerProcess per call, one reactor runs in a daemon thread and crawls are
+queued onto it. Up to CRAWL_CONCURRENCY crawls run at once; items are
+collected through the item_scraped signal and handed straight back to the
+caller through a Future.
+
+    from amazon_scraper.crawler_service import crawler_service
+    items = crawler_service.crawl(search_term='dog food', min_price='200', max_price='2000')
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+# Settings come from the module, not from a scrapy.cfg in the working directory
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'amazon_scraper.settings')
+
+from scrapy import signals
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+
+from amazon_config import CRAWL_CONCURRENCY, CRAWL_TIMEOUT, CRAWL_OUTPUT_DIR
+
+
+class CrawlJob:
+    def __init__(self, spider_cls, kwargs, settings=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.spider_cls = spider_cls
+        self.kwargs = kwargs
+        self.settings = settings or {}
+        self.items = []
+        # Streamed by the pipeline while the crawl runs, so a crash still leaves the items on disk
+        self.ndjson_path = os.path.join(CRAWL_OUTPUT_DIR, f'{self.id}.jsonl')
+        self.future = Future()
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.stats = None
+        self.crawler = None
+
+
+class CrawlerService:
+    def __init__(self, max_concurrent=CRAWL_CONCURRENCY, settings=None):
+        self.max_concurrent = max_concurrent
+        self.settings = settings
+        self.runner = None
+        self.reactor = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Only touched from the reactor thread
+        self._pending = deque()
+        self._running = {}
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def start(self):
+        """Start the reactor thread once; later calls are no-ops"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            settings = self.settings or get_project_settings()
+            reactor_path = settings.get('TWISTED_REACTOR')
+            if reactor_path:
+                install_reactor(reactor_path)
+            from twisted.internet import reactor
+            from scrapy.crawler import CrawlerRunner
+            self.reactor = reactor
+            self.runner = CrawlerRunner(settings)
+            self._thread = threading.Thread(target=reactor.run, kwargs={'installSignalHandlers': False},
+                                            name='scrapy-reactor', daemon=True)
+            self._thread.start()
+
+    def submit(self, spider_cls=None, settings=None, **kwargs):
+        """Queue a crawl; the Future resolves to the list of scraped items
+
+        settings override the project and spider settings for this crawl only.
+        """
+        return self._submit(spider_cls, kwargs, settings).future
+
+    def _submit(self, spider_cls, kwargs, settings=None):
+        if spider_cls is None:
+            from amazon_scraper.spiders.amazon_spider import AmazonSpider
+            spider_cls = AmazonSpider
+        self.start()
+        job = CrawlJob(spider_cls, kwargs, settings)
+        self.reactor.callFromThread(self._enqueue, job)
+        return job
+
+    def crawl(self, spider_cls=None, timeout=CRAWL_TIMEOUT, settings=None, **kwargs):
+        job = self._submit(spider_cls, kwargs, settings)
+        try:
+            return job.future.result(timeout)
+        except FutureTimeout:
+            # Nobody will read these items any more, so stop spending requests on them
+            self.reactor.callFromThread(self._cancel, job)
+            raise
+
+    def _cancel(self, job):
+        self.timed_out += 1
+        if job in self._pending:
+            self._pending.remove(job)
+            job.future.cancel()
+        elif job.id in self._running and job.crawler is not None:
+            print(f"Crawl {job.id} timed out, stopping it")
+            # stop() is deprecated from Scrapy 2.13 on; older versions only have stop()
+            if hasattr(job.crawler, 'stop_async'):
+                deferred_from_coro(job.crawler.stop_async())
+            else:
+                job.crawler.stop()
+
+    def _enqueue(self, job):
+        self._pending.append(job)
+        self._pump()
+
+    def _pump(self):
+        while self._pending and len(self._running) < self.max_concurrent:
+            job = self._pending.popleft()
+            if job.future.set_running_or_notify_cancel():
+                self._start(job)
+
+    def _start(self, job):
+        job.started_at = time.time()
+        crawler = self.runner.create_crawler(job.spider_cls)
+        # Items come back through the Future; a shared feed file would be clobbered by concurrent crawls
+        crawler.settings.set('FEEDS', {}, priority='cmdline')
+        crawler.settings.setdict(job.settings, priority='cmdline')
+        job.crawler = crawler
+        crawler.signals.connect(lambda item, response, spider: job.items.append(dict(item)),
+                                signal=signals.item_scraped, weak=False)
+        self._running[job.id] = job
+        deferred = self.runner.crawl(crawler, ndjson_path=job.ndjson_path, **job.kwargs)
+        deferred.addCallbacks(lambda _: self._finish(job, crawler), lambda failure: self._fail(job, failure))
+
+    def _finish(self, job, crawler):
+        self._running.pop(job.id, None)
+        job.stats = crawler.stats.get_stats() if crawler.stats else None
+        self.completed += 1
+        if os.path.exists(job.ndjson_path):
+            os.remove(job.ndjson_path)
+        job.future.set_result(job.items)
+        self._pump()
+
+    def _fail(self, job, failure):
+        self._running.pop(job.id, None)
+        self.failed += 1
+        job.future.set_exception(failure.value)
+        self._pump()
+
+    def get_stats(self):
+        return {
+            'running': len(self._running),
+            'pending': len(self._pending),
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'max_concurrent': self.max_concurrent
+        }
+
+    def stop(self, timeout=30):
+        if self._thread is None:
+            return
+        self.reactor.callFromThread(self._stop)
+        self._thread.join(timeout)
+
+    def _stop(self):
+        d = self.runner.stop()
+        d.addBoth(lambda _: self.reactor.stop())
+
+
+# Global service shared by the app and the scheduler
+crawler_service = CrawlerService()
@@ -0,0 +1,175 @@
+"""
+AIMD throttle: adapts per-domain concurrency and delay to what the target tolerates
+
+Healthy responses (fast, not throttled) first shave the download delay and
+then add one concurrent request per window of successes. A 403/429/503, a
+download error or a rising error rate halves concurrency and doubles the
+delay (at most once per cooldown, so a burst of errors counts as one
+signal). Retry-After is respected.
+
+Throttle events arrive on the `request_throttled` signal, which
+CustomRetryMiddleware sends for blocking responses and download errors;
+latency and successes come from `response_downloaded`.
+
+Settings: AIMD_ENABLED, AIMD_MIN_CONCURRENCY, AIMD_MAX_CONCURRENCY,
+AIMD_MIN_DELAY, AIMD_MAX_DELAY, AIMD_START_DELAY, AIMD_DELAY_STEP,
+AIMD_DECREASE_FACTOR, AIMD_TARGET_LATENCY, AIMD_ERROR_RATE, AIMD_WINDOW,
+AIMD_COOLDOWN, AIMD_DEBUG; THROTTLE_HTTP_CODES is shared with the retry
+middleware.
+"""
+import logging
+import time
+from collections import deque
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+# Sent with (request, spider, reason, response=None, retry_after=None)
+request_throttled = object()
+
+# Default for the THROTTLE_HTTP_CODES setting, shared with CustomRetryMiddleware
+THROTTLE_STATUSES = (403, 429, 503)
+
+
+def throttle_statuses(settings):
+    return {int(code) for code in settings.getlist('THROTTLE_HTTP_CODES', THROTTLE_STATUSES)}
+
+
+class SlotState:
+    def __init__(self, slot, window):
+        self.slot = slot
+        self.outcomes = deque(maxlen=window)  # (ok, latency) per response
+        self.streak = 0
+        self.last_decrease = 0.0
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for ok, _ in self.outcomes if not ok) / len(self.outcomes)
+
+    def avg_latency(self):
+        latencies = [latency for ok, latency in self.outcomes if ok and latency is not None]
+        return sum(latencies) / len(latencies) if latencies else None
+
+
+class AimdThrottle:
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('AIMD_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.min_concurrency = settings.getint('AIMD_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('AIMD_MAX_CONCURRENCY', 8)
+        self.min_delay = settings.getfloat('AIMD_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('AIMD_MAX_DELAY', 60)
+        self.start_delay = settings.getfloat('AIMD_START_DELAY', settings.getfloat('DOWNLOAD_DELAY'))
+        self.delay_step = settings.getfloat('AIMD_DELAY_STEP', 0.25)
+        self.decrease_factor = settings.getfloat('AIMD_DECREASE_FACTOR', 0.5)
+        self.target_latency = settings.getfloat('AIMD_TARGET_LATENCY', 2.0)
+        self.max_error_rate = settings.getfloat('AIMD_ERROR_RATE', 0.2)
+        self.window = settings.getint('AIMD_WINDOW', 20)
+        self.cooldown = settings.getfloat('AIMD_COOLDOWN', 5.0)
+        self.debug = settings.getbool('AIMD_DEBUG')
+        self.throttle_statuses = throttle_statuses(settings)
+        self.states = {}
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.request_throttled, signal=request_throttled)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _slot(self, request):
+        key = request.meta.get('download_slot')
+        if key is None:
+            return None, None, None
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return key, None, None
+        state = self.states.get(key)
+        # Idle slots are garbage collected by the downloader and come back with the defaults
+        if state is None or state.slot is not slot:
+            state = self.states[key] = SlotState(slot, self.window)
+            slot.delay = min(max(self.start_delay, self.min_delay), self.max_delay)
+            slot.concurrency = min(max(slot.concurrency, self.min_concurrency), self.max_concurrency)
+        return key, slot, state
+
+    def response_downloaded(self, response, request, spider):
+        if response.status in self.throttle_statuses:
+            # Counted once, through request_throttled from the retry middleware
+            return
+        key, slot, state = self._slot(request)
+        if slot is None:
+            return
+        latency = request.meta.get('download_latency')
+        state.outcomes.append((response.status < 500, latency))
+        if state.error_rate() > self.max_error_rate and len(state.outcomes) >= self.window // 2:
+            self.decrease(key, slot, state, spider, f"error rate {state.error_rate():.0%}")
+            return
+        avg = state.avg_latency()
+        if avg is not None and avg > 2 * self.target_latency:
+            self.decrease(key, slot, state, spider, f"latency {avg:.2f}s")
+            return
+        state.streak += 1
+        # One step per "round trip": as many successes as requests in flight
+        if state.streak >= slot.concurrency and (avg is None or avg <= self.target_latency):
+            state.streak = 0
+            self.increase(key, slot, state, spider)
+
+    def request_throttled(self, request, spider, reason, response=None, retry_after=None):
+        key, slot, state = self._slot(request)
+        if slot is None:
+            return
+        state.outcomes.append((False, None))
+        self.decrease(key, slot, state, spider, reason, retry_after)
+
+    def increase(self, key, slot, state, spider):
+        old = (slot.concurrency, slot.delay)
+        # Spend the headroom on the delay first, then add parallel requests
+        if slot.delay > self.min_delay:
+            slot.delay = max(self.min_delay, slot.delay - self.delay_step)
+        elif slot.concurrency < self.max_concurrency:
+            slot.concurrency += 1
+        else:
+            return
+        self.crawler.stats.inc_value('aimd/increases')
+        self._record(slot)
+        self._log(key, 'increase', old, slot, spider, f"avg latency {state.avg_latency() or 0:.2f}s")
+
+    def decrease(self, key, slot, state, spider, reason, retry_after=None):
+        now = time.time()
+        state.streak = 0
+        if now - state.last_decrease < self.cooldown and not retry_after:
+            return
+        state.last_decrease = now
+        # Judge the new setting on fresh responses only
+        state.outcomes.clear()
+        old = (slot.concurrency, slot.delay)
+        slot.concurrency = max(self.min_concurrency, int(slot.concurrency * self.decrease_factor))
+        slot.delay = min(self.max_delay, max(slot.delay / self.decrease_factor, self.delay_step, retry_after or 0))
+        self.crawler.stats.inc_value('aimd/decreases')
+        self._record(slot)
+        self._log(key, 'decrease', old, slot, spider, reason, logging.WARNING)
+
+    def _record(self, slot):
+        stats = self.crawler.stats
+        stats.set_value('aimd/concurrency', slot.concurrency)
+        stats.set_value('aimd/delay', round(slot.delay, 3))
+        stats.max_value('aimd/concurrency_max', slot.concurrency)
+
+    def _log(self, key, action, old, slot, spider, reason, level=logging.INFO):
+        if action == 'increase' and not self.debug:
+            return
+        logger.log(level, "AIMD %s %s: concurrency %d -> %d, delay %.2fs -> %.2fs (%s)",
+                   key, action, old[0], slot.concurrency, old[1], slot.delay, reason,
+                   extra={'spider': spider})
+
+    def spider_closed(self, spider):
+        for key in self.states:
+            slot = self.crawler.engine.downloader.slots.get(key)
+            if slot is not None:
+                logger.info("AIMD %s finished at concurrency %d, delay %.2fs", key, slot.concurrency, slot.delay,
+                            extra={'spider': spider})
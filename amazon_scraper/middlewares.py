@@ -3,17 +3,86 @@ Custom middleware for handling anti-bot detection
 """
 import random
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
 from scrapy.downloadermiddlewares.useragent import UserAgentMiddleware
-from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.downloadermiddlewares.retry import RetryMiddleware, get_retry_request
+from scrapy.utils.defer import maybe_deferred_to_future
 from scrapy.utils.response import response_status_message
+from twisted.internet.task import deferLater
+from amazon_scraper.extensions import request_throttled, throttle_statuses
 
 class CustomRetryMiddleware(RetryMiddleware):
+    """Retry blocking responses and tell the AIMD throttle about them"""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        # Same codes the throttle treats as throttling, so a 403 is never also counted as a success
+        self.throttle_codes = throttle_statuses(settings)
+
     def process_response(self, request, response, spider):
-        if response.status in [403, 503]:
+        if request.meta.get('dont_retry', False):
+            return response
+        if response.status in self.throttle_codes:
             spider.logger.warning(f'Retrying {request} due to {response.status}')
-            return self._retry(request, response.status, spider) or response
+            self.crawler.signals.send_catch_log(
+                request_throttled, request=request, spider=spider, reason=f'HTTP {response.status}',
+                response=response, retry_after=_retry_after(response)
+            )
+            return self._retry_request(request, response_status_message(response.status), spider) or response
+        if response.status in self.retry_http_codes:
+            return self._retry_request(request, response_status_message(response.status), spider) or response
         return response
 
+    def process_exception(self, request, exception, spider):
+        if isinstance(exception, self.exceptions_to_retry) and not request.meta.get('dont_retry', False):
+            self.crawler.signals.send_catch_log(
+                request_throttled, request=request, spider=spider, reason=type(exception).__name__
+            )
+            return self._retry_request(request, exception, spider)
+        return None
+
+    def _retry_request(self, request, reason, spider):
+        return get_retry_request(
+            request, spider=spider, reason=reason,
+            max_retry_times=request.meta.get('max_retry_times', self.max_retry_times),
+            priority_adjust=request.meta.get('priority_adjust', self.priority_adjust)
+        )
+
+def _retry_after(response):
+    """Seconds from a numeric Retry-After header, or None"""
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+class SharedRateLimitMiddleware:
+    """Draw every download from the per-host budget shared with Selenium jobs and other crawls"""
+
+    def __init__(self, limiter, stats):
+        self.limiter = limiter
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('SHARED_RATE_LIMIT_ENABLED'):
+            raise NotConfigured
+        from rate_limit import rate_limiter
+        return cls(rate_limiter, crawler.stats)
+
+    async def process_request(self, request, spider):
+        # Only the short reservation runs here; the wait is a reactor timer, so no
+        # thread-pool thread (which DNS lookups share) sleeps through it
+        from twisted.internet import reactor
+        waited = self.limiter.reservation(request.url)
+        if waited:
+            await maybe_deferred_to_future(deferLater(reactor, waited, lambda: None))
+        self.stats.inc_value('rate_limit/acquired')
+        if waited:
+            self.stats.inc_value('rate_limit/waited')
+            self.stats.inc_value('rate_limit/wait_seconds', waited)
+        return None
+
 class RotateHeadersMiddleware:
     """Rotate headers and add random viewport sizes"""
     
@@ -1,52 +1,129 @@
 from scrapy import signals
 from itemadapter import is_item, ItemAdapter
+from twisted.internet import task
 import json
+import os
+import time
 
 class AmazonScraperPipeline:
-    def __init__(self):
-        self.items = []
+    """Stream items to NDJSON and to SQLite in batches as the crawl runs
 
-    def process_item(self, item, spider):
-        self.items.append(item)
-        return item
+    Memory stays flat however long the crawl is, and a crash or an early
+    CloseSpider loses at most one unflushed batch.
+    """
 
-    def close_spider(self, spider):
-        # Save to JSON file
-        with open('latest_data.json', 'w', encoding='utf-8') as f:
-            json.dump(self.items, f, ensure_ascii=False, indent=2)
-        
+    def __init__(self, batch_size=50, flush_seconds=10, output='latest_data.jsonl', stats=None):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.output = output
+        self.stats = stats
+        self.batch = []
+        self.file = None
+        self.path = None
+        self.run_id = None
+        self.db = None
+        self.timer = None
+        self.count = 0
+        self.saved = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            batch_size=settings.getint('PIPELINE_BATCH_SIZE', 50),
+            flush_seconds=settings.getfloat('PIPELINE_FLUSH_SECONDS', 10),
+            output=settings.get('PIPELINE_NDJSON', 'latest_data.jsonl'),
+            stats=crawler.stats
+        )
+
+    def open_spider(self, spider):
+        self.started = time.time()
+        # The crawler service gives each crawl its own file; standalone crawls use the shared one
+        self.path = getattr(spider, 'ndjson_path', None) or self.output
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'w', encoding='utf-8')
         # Save to SQLite if available
         try:
-            import sqlite3
-            from datetime import datetime
-            
-            conn = sqlite3.connect('products_new.db')
-            c = conn.cursor()
-            
-            # Create table if it doesn't exist
-            c.execute('''CREATE TABLE IF NOT EXISTS products
-                         (id INTEGER PRIMARY KEY, product_name TEXT, type_of_product TEXT, 
-                          weight TEXT, current_price TEXT, pet TEXT, seller TEXT, date TEXT)''')
-            
-            # Insert items
-            date = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-            for item in self.items:
-                c.execute("""
-                    INSERT INTO products 
-                    (product_name, type_of_product, weight, current_price, pet, seller, date) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    item.get('product_name'),
-                    'Generic',  # type_of_product
-                    item.get('weight', 'N/A'),
-                    str(item.get('current_price')),
-                    'N/A',  # pet
-                    item.get('seller', 'Unknown'),
-                    date
-                ))
-            
-            conn.commit()
-            conn.close()
-            
+            from storage import db
+            from alerts import alert_engine
+
+            # Check watch rules against the new prices as they are saved
+            alert_engine.attach(db)
+            self.run_id = db.start_run(
+                getattr(spider, 'search_term', None),
+                getattr(spider, 'min_price', None),
+                getattr(spider, 'max_price', None),
+                'scrapy'
+            )
+            self.db = db
         except Exception as e:
-            print(f"Error saving to database: {e}")
+            print(f"Error opening database: {e}")
+        # Flush on a timer too, so a slow crawl doesn't sit on a half-full batch
+        self.timer = task.LoopingCall(self.flush, spider)
+        self.timer.start(self.flush_seconds, now=False)
+
+    def process_item(self, item, spider):
+        row = dict(ItemAdapter(item).asdict(), type_of_product='Generic')
+        self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.batch.append(row)
+        self.count += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush(spider)
+        return item
+
+    def flush(self, spider=None):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        started = time.time()
+        os.fsync(self.file.fileno())
+        if self.db is not None:
+            try:
+                self.db.save_products(batch, self.run_id)
+                self.saved += len(batch)
+            except Exception as e:
+                print(f"Error saving to database: {e}")
+        elapsed = time.time() - started
+        self.flushes += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+        if self.stats is not None:
+            self.stats.set_value('pipeline/items_saved', self.saved)
+            self.stats.set_value('pipeline/flushes', self.flushes)
+            self.stats.set_value('pipeline/flush_seconds_max', round(self.flush_seconds_max, 4))
+            self.stats.set_value('pipeline/items_per_second', round(self.items_per_second(), 2))
+
+    def items_per_second(self):
+        elapsed = time.time() - self.started if self.started else 0
+        return self.count / elapsed if elapsed else 0.0
+
+    def close_spider(self, spider):
+        if self.timer and self.timer.running:
+            self.timer.stop()
+        self.flush(spider)
+        self.file.close()
+        if self.db is not None and self.run_id:
+            try:
+                self.db.finish_run(self.run_id, self.saved)
+            except Exception as e:
+                print(f"Error saving to database: {e}")
+        if self.path == self.output:
+            # Standalone crawls still leave latest_data.json behind; rebuilt one line at a time
+            self.write_json_array('latest_data.json')
+        avg = self.flush_seconds_total / self.flushes if self.flushes else 0
+        print(f"Pipeline stored {self.saved} of {self.count} items at {self.items_per_second():.1f} items/s; "
+              f"{self.flushes} flushes, avg {avg * 1000:.0f} ms, max {self.flush_seconds_max * 1000:.0f} ms")
+
+    def write_json_array(self, path):
+        tmp_path = path + '.tmp'
+        with open(self.path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+            dst.write('[')
+            for i, line in enumerate(src):
+                dst.write((',\n' if i else '\n') + line.rstrip('\n'))
+            dst.write('\n]\n')
+        os.replace(tmp_path, path)
@@ -13,16 +13,38 @@ USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = False
 
-# Configure maximum concurrent requests performing at the same time
-CONCURRENT_REQUESTS = 1
+# Concurrency per domain starts at 1 and is tuned by the AIMD throttle below;
+# CONCURRENT_REQUESTS only caps the total
+CONCURRENT_REQUESTS = 8
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
-CONCURRENT_REQUESTS_PER_IP = 1
 
-# Configure delays and randomization
+# Configure delays and randomization (DOWNLOAD_DELAY is the starting delay)
 DOWNLOAD_DELAY = 3
 RANDOMIZE_DOWNLOAD_DELAY = True
 DOWNLOAD_TIMEOUT = 15
 
+# AIMD throttle: halve concurrency and double the delay on 403/429/503/errors,
+# ramp back up one step per window of fast, healthy responses
+EXTENSIONS = {
+    'amazon_scraper.extensions.AimdThrottle': 500,
+}
+AIMD_ENABLED = True
+AIMD_MIN_CONCURRENCY = 1
+AIMD_MAX_CONCURRENCY = 8
+AIMD_MIN_DELAY = 0.05  # Small floor: with no delay at all Scrapy can burst past the slot concurrency
+AIMD_MAX_DELAY = 60
+AIMD_DELAY_STEP = 0.25
+AIMD_DECREASE_FACTOR = 0.5
+AIMD_TARGET_LATENCY = 2.0  # Seconds; slower than twice this counts as congestion
+AIMD_ERROR_RATE = 0.2  # Share of failures in the window that triggers a decrease
+AIMD_WINDOW = 20  # Responses per slot used for error rate and latency
+AIMD_COOLDOWN = 5.0  # Seconds between decreases, so one burst of errors counts once
+AIMD_DEBUG = False  # Also log every increase
+
+# Hard per-host ceiling shared with the Selenium engine and other processes
+# (RATE_LIMITS in amazon_config); AIMD only adapts below it
+SHARED_RATE_LIMIT_ENABLED = True
+
 # Enable and configure cookies
 COOKIES_ENABLED = True
 COOKIES_DEBUG = False
@@ -46,6 +68,7 @@ DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
     'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
     'amazon_scraper.middlewares.CustomRetryMiddleware': 550,
+    'amazon_scraper.middlewares.SharedRateLimitMiddleware': 590,
     'amazon_scraper.middlewares.CustomUserAgentMiddleware': 400,
     'amazon_scraper.middlewares.RotateHeadersMiddleware': 410,
     'scrapy_proxy_pool.middlewares.ProxyPoolMiddleware': 610,
@@ -64,13 +87,20 @@ CUSTOM_PROXY_UPDATE_INTERVAL = 3600  # 1 hour in seconds
 # Configure retry settings
 RETRY_ENABLED = True
 RETRY_TIMES = 5
-RETRY_HTTP_CODES = [500, 502, 503, 504, 400, 403, 404, 408]
+RETRY_HTTP_CODES = [500, 502, 503, 504, 400, 403, 404, 408, 429]
+# Responses that mean "slow down": retried, and reported to the AIMD throttle as throttling, not errors
+THROTTLE_HTTP_CODES = [403, 429, 503]
 
 # Configure item pipelines
 ITEM_PIPELINES = {
     'amazon_scraper.pipelines.AmazonScraperPipeline': 300,
 }
 
+# The pipeline streams items: NDJSON as they arrive, SQLite every N items or T seconds
+PIPELINE_BATCH_SIZE = 50
+PIPELINE_FLUSH_SECONDS = 10
+PIPELINE_NDJSON = 'latest_data.jsonl'
+
 # Enable and configure HTTP caching
 HTTPCACHE_ENABLED = True
 HTTPCACHE_EXPIRATION_SECS = 0
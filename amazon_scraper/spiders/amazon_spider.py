@@ -3,17 +3,19 @@ from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
 from scrapy.exceptions import CloseSpider
 import json
-import re
+from page_analyzer import analyze_product_page, detect_block, extract_search_links, parse_search_cards
+from prefilter import CardFilter
+from amazon_urls import build_search_url, extract_asin, canonical_product_url, is_valid_asin
 
 class AmazonSpider(CrawlSpider):
     name = 'amazon'
     allowed_domains = ['amazon.in']
+    base_url = 'https://www.amazon.in/'
     
     # Custom settings for the spider
     custom_settings = {
         'ROBOTSTXT_OBEY': False,
-        'CONCURRENT_REQUESTS': 2,  # Limit concurrent requests
-        'DOWNLOAD_DELAY': 2,  # Add delay between requests
+        # Concurrency and delay are left to the AIMD throttle in settings.py
         'COOKIES_ENABLED': True,
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
         'FEEDS': {
@@ -26,94 +28,142 @@ class AmazonSpider(CrawlSpider):
         },
         'DOWNLOADER_MIDDLEWARES': {
             'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
+            'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+            # Feeds 403/429/503 and download errors to the AIMD throttle
+            'amazon_scraper.middlewares.CustomRetryMiddleware': 550,
+            # Same per-host budget as the Selenium engine (rate_limit.py)
+            'amazon_scraper.middlewares.SharedRateLimitMiddleware': 590,
             'scrapy_user_agents.middlewares.RandomUserAgentMiddleware': 400,
             'scrapy_proxy_pool.middlewares.ProxyPoolMiddleware': 610,
             'scrapy_proxy_pool.middlewares.BanDetectionMiddleware': 620,
         }
     }
 
-    def __init__(self, search_term=None, min_price=None, max_price=None, max_pages=5, *args, **kwargs):
+    def __init__(self, search_term=None, min_price=None, max_price=None, max_pages=5,
+                 search_only=False, need_seller=False, allowed_sellers=None, asins=None, *args, **kwargs):
         super(AmazonSpider, self).__init__(*args, **kwargs)
-        self.search_term = search_term.replace(' ', '+')
+        self.search_term = search_term
         self.min_price = min_price
         self.max_price = max_price
         self.max_pages = int(max_pages)
-        self.current_page = 1
+        # Spider arguments arrive as strings from the command line
+        self.search_only = str(search_only).lower() in ('1', 'true', 'yes')
+        self.need_seller = str(need_seller).lower() in ('1', 'true', 'yes')
+        # ASINs already scheduled or yielded, so sponsored repeats are never fetched twice
+        self.seen_asins = set()
+        if isinstance(allowed_sellers, str):
+            allowed_sellers = [s.strip() for s in allowed_sellers.split(',') if s.strip()]
+        self.card_filter = CardFilter(allowed_sellers, min_price, max_price)
+        # Refresh mode: fetch these product pages directly and skip the search
+        if isinstance(asins, str):
+            asins = asins.split(',')
+        self.asins = [asin.strip().upper() for asin in asins or [] if is_valid_asin(asin.strip().upper())]
         
-        # Construct the start URL
-        base_url = f'https://www.amazon.in/s?k={self.search_term}'
-        if min_price and max_price:
-            base_url += f'&rh=p_36%3A{min_price}00-{max_price}00'
-        self.start_urls = [base_url]
+        # Construct every result page URL up front so pages are fetched concurrently
+        filters = {'min': min_price, 'max': max_price}
+        self.start_urls = [
+            build_search_url(self.base_url, self.search_term, filters, page)
+            for page in range(1, self.max_pages + 1)
+        ]
 
-    def extract_price(self, response):
-        price = None
-        price_whole = response.css('span.a-price-whole::text').get()
-        price_fraction = response.css('span.a-price-fraction::text').get()
-        
-        if price_whole:
-            price = price_whole.strip().replace(',', '')
-            if price_fraction:
-                price = float(f"{price}.{price_fraction}")
-            else:
-                price = float(price)
-        return price
+    async def start(self):
+        # Scrapy 2.13+ entry point; older versions call start_requests directly
+        for request in self.start_requests():
+            yield request
 
-    def extract_weight(self, title):
-        if not title:
-            return 'N/A'
-        match = re.search(r'(\d+(?:\.\d+)?)\s*kg', title, re.IGNORECASE)
-        if match:
-            return match.group(1) + 'kg'
-        return 'N/A'
+    def start_requests(self):
+        if self.asins:
+            for asin in self.asins:
+                if asin not in self.seen_asins:
+                    self.seen_asins.add(asin)
+                    yield scrapy.Request(canonical_product_url(self.base_url, asin), callback=self.parse_product,
+                                         cb_kwargs={'search_page_url': None, 'asin': asin})
+            return
+        for url in self.start_urls:
+            yield scrapy.Request(url, callback=self.parse_start_url)
 
     def parse_start_url(self, response):
         # Check for captcha/blocking
-        if 'Robot Check' in response.text or 'Sorry' in response.text:
+        if detect_block(response.text):
             raise CloseSpider('Detected anti-bot page')
 
-        # Extract product links from search results
-        products = response.css('div[data-component-type="s-search-result"]')
-        
-        for product in products:
-            product_url = product.css('h2 a::attr(href)').get()
-            if product_url and '/dp/' in product_url:
-                yield response.follow(
-                    product_url,
-                    callback=self.parse_product,
-                    cb_kwargs={'search_page_url': response.url}
-                )
+        if self.search_only:
+            yield from self.parse_search_cards(response)
+            return
+
+        # Prefilter result cards by brand and price before scheduling product pages
+        cards = parse_search_cards(response.text, self.base_url)
+        if cards:
+            links = [card.url for card in self.filter_cards(cards)]
+        else:
+            links = extract_search_links(response.text, response.url)
+        for product_url in links:
+            asin = self.claim_asin(product_url)
+            if asin:
+                yield self.product_request(response, asin)
+
+    def filter_cards(self, cards):
+        kept = self.card_filter.apply(cards)
+        self.crawler.stats.set_value('prefilter/saved_fetches', self.card_filter.saved_fetches)
+        self.logger.info(self.card_filter.summary())
+        return kept
 
-        # Handle pagination
-        if self.current_page < self.max_pages:
-            next_page = response.css('a.s-pagination-next::attr(href)').get()
-            if next_page:
-                self.current_page += 1
-                yield response.follow(next_page, callback=self.parse_start_url)
+    def parse_search_cards(self, response):
+        """Yield items straight from result cards; follow product pages only when a card falls short"""
+        for card in self.filter_cards(parse_search_cards(response.text, self.base_url)):
+            if card.asin:
+                if card.asin in self.seen_asins:
+                    continue
+                self.seen_asins.add(card.asin)
+            product = None if self.need_seller else card.to_product()
+            if product:
+                self.crawler.stats.inc_value('search_cards/items')
+                yield {
+                    'product_name': product['product_name'],
+                    'current_price': product['current_price'],
+                    'seller': product['seller'],
+                    'weight': product['weight'],
+                    'pet': product['pet'],
+                    'asin': card.asin,
+                    'product_url': canonical_product_url(self.base_url, card.asin) if card.asin else card.url,
+                    'search_url': response.url
+                }
+            elif card.asin:
+                self.crawler.stats.inc_value('search_cards/deep_fetches')
+                yield self.product_request(response, card.asin)
 
-    def parse_product(self, response, search_page_url):
+    def claim_asin(self, url):
+        """Return the link's ASIN the first time it is seen, otherwise None"""
+        asin = extract_asin(url)
+        if not asin or asin in self.seen_asins:
+            self.crawler.stats.inc_value('dedup/skipped_links')
+            return None
+        self.seen_asins.add(asin)
+        return asin
+
+    def product_request(self, response, asin):
+        return response.follow(
+            canonical_product_url(self.base_url, asin),
+            callback=self.parse_product,
+            cb_kwargs={'search_page_url': response.url, 'asin': asin}
+        )
+
+    def parse_product(self, response, search_page_url, asin=None):
+        analysis = analyze_product_page(response.text, url=response.url)
         # Check for anti-bot detection
-        if 'Robot Check' in response.text:
+        if analysis.blocked:
             raise CloseSpider('Detected anti-bot page')
+        self.crawler.stats.inc_value('analyzer/parse_ms', int(analysis.parse_seconds * 1000))
 
-        title = response.css('#productTitle::text').get()
-        if title:
-            title = title.strip()
-        
-        price = self.extract_price(response)
-        seller = response.css('#sellerProfile span::text').get()
-        if not seller:
-            seller = response.css('#merchant-info a::text').get()
-        if not seller:
-            seller = 'Amazon'
-
-        # Only yield if we have at least title and price
-        if title and price:
+        # Only yield if we have a title and a price (or an out-of-stock notice) from an allowed seller
+        if analysis.to_product() and self.card_filter.seller_allowed(analysis.seller, analysis.title):
             yield {
-                'product_name': title,
-                'current_price': price,
-                'seller': seller.strip() if seller else 'Unknown',
-                'weight': self.extract_weight(title),
+                'product_name': analysis.title,
+                'current_price': analysis.price or None,
+                'seller': analysis.seller or 'Amazon',
+                'weight': analysis.weight,
+                'pet': analysis.pet,
+                'asin': asin or extract_asin(response.url),
                 'product_url': response.url,
                 'search_url': search_page_url
             }
@@ -0,0 +1,203 @@
+"""
+Local stand-in for the target site, for exercising the crawler without touching Amazon
+
+Serves search result and product pages in the markup page_analyzer expects
+and misbehaves the way a real site does under load:
+
+  - more than --capacity requests in flight: 503
+  - more than --rate requests per second: 429 with Retry-After
+  - --error-rate of the remaining requests: 500
+  - latency grows with the number of requests in flight
+
+    python -m amazon_scraper.standin_server --port 8800 --capacity 4 --rate 8
+    python -m amazon_scraper.standin_server --trial --pages 10    # crawl it with the AIMD throttle and report
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CARDS_PER_PAGE = 16
+
+
+def fake_asin(term, page, index):
+    return 'B0' + hashlib.sha1(f'{term}:{page}:{index}'.encode()).hexdigest()[:8].upper()
+
+
+def fake_price(asin):
+    return 200 + int(asin[2:], 16) % 5000
+
+
+def search_page(term, page):
+    cards = []
+    for i in range(CARDS_PER_PAGE):
+        asin = fake_asin(term, page, i)
+        cards.append(f'''
+        <div data-component-type="s-search-result" data-asin="{asin}">
+          <div data-cy="title-recipe"><span class="a-size-base-plus">Standin</span>
+            <h2><a href="/Standin-{term}-{i}/dp/{asin}/ref=sr_1_{i}"><span>Standin {term} {i} Adult Dog Food 3 kg</span></a></h2>
+          </div>
+          <span class="a-price"><span class="a-offscreen">₹{fake_price(asin):,}</span></span>
+        </div>''')
+    return f'<html><body>{"".join(cards)}</body></html>'
+
+
+def product_page(asin):
+    return f'''<html><body>
+    <span id="productTitle">Standin {asin} Adult Dog Food 3 kg</span>
+    <a id="bylineInfo">Visit the Standin Store</a>
+    <span class="a-price-whole">{fake_price(asin):,}</span><span class="a-price-fraction">00</span>
+    </body></html>'''
+
+
+class StandinState:
+    def __init__(self, capacity, rate, error_rate, latency, latency_per_request):
+        self.capacity = capacity
+        self.rate = rate
+        self.error_rate = error_rate
+        self.latency = latency
+        self.latency_per_request = latency_per_request
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.tokens = float(rate)
+        self.refilled = time.monotonic()
+        self.counts = {}
+
+    def admit(self):
+        """Status to fail the request with, or None to serve it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            self.inflight += 1
+            if self.inflight > self.capacity:
+                return 503
+            if self.tokens < 1:
+                return 429
+            self.tokens -= 1
+        if random.random() < self.error_rate:
+            return 500
+        return None
+
+    def done(self, status):
+        with self.lock:
+            self.inflight -= 1
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = state.admit()
+            try:
+                time.sleep(state.latency + state.latency_per_request * state.inflight)
+                url = urlparse(self.path)
+                if status:
+                    body = f'<html><body>Error {status}</body></html>'
+                elif url.path == '/s':
+                    query = parse_qs(url.query)
+                    body = search_page(query.get('k', [''])[0], int(query.get('page', ['1'])[0]))
+                elif '/dp/' in url.path:
+                    body = product_page(url.path.split('/dp/')[1].split('/')[0])
+                else:
+                    status, body = 404, '<html><body>Not found</body></html>'
+                data = body.encode('utf-8')
+                self.send_response(status or 200)
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            finally:
+                state.done(status or 200)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8800, capacity=4, rate=8, error_rate=0.02, latency=0.2, latency_per_request=0.05):
+    """Start the stand-in in a daemon thread; returns (server, state)"""
+    state = StandinState(capacity, rate, error_rate, latency, latency_per_request)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def standin_spider(port):
+    """The project spider pointed at the stand-in, with only the retry and throttle machinery around it"""
+    from amazon_scraper.spiders.amazon_spider import AmazonSpider
+
+    class StandinSpider(AmazonSpider):
+        name = 'amazon_standin'
+        allowed_domains = ['127.0.0.1']
+        base_url = f'http://127.0.0.1:{port}/'
+        custom_settings = {
+            'DOWNLOADER_MIDDLEWARES': {
+                'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+                'amazon_scraper.middlewares.CustomRetryMiddleware': 550,
+            },
+            'ITEM_PIPELINES': {},
+            'HTTPCACHE_ENABLED': False,
+            'RETRY_TIMES': 10,
+            'LOG_LEVEL': 'INFO',
+        }
+
+    return StandinSpider
+
+
+def trial(port, pages, state):
+    """Crawl the stand-in with the project settings and report what the throttle settled on"""
+    import os
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'amazon_scraper.settings')
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(standin_spider(port))
+    started = time.time()
+    process.crawl(crawler, search_term='dog food', max_pages=pages)
+    process.start()
+    elapsed = time.time() - started
+    stats = crawler.stats.get_stats()
+    items = stats.get('item_scraped_count', 0)
+    print(f"\n{items} items in {elapsed:.1f}s ({items / elapsed:.1f} items/s)")
+    print(f"AIMD: {stats.get('aimd/decreases', 0)} decreases, {stats.get('aimd/increases', 0)} increases, "
+          f"final concurrency {stats.get('aimd/concurrency')}, delay {stats.get('aimd/delay')}s, "
+          f"peak concurrency {stats.get('aimd/concurrency_max')}")
+    print(f"Server responses: {dict(sorted(state.counts.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in site with injected throttling and errors')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--capacity', type=int, default=4, help='requests in flight before 503s')
+    parser.add_argument('--rate', type=float, default=8, help='requests per second before 429s')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='share of random 500s')
+    parser.add_argument('--latency', type=float, default=0.2, help='base response time in seconds')
+    parser.add_argument('--trial', action='store_true', help='crawl the stand-in once and report throughput')
+    parser.add_argument('--pages', type=int, default=5, help='search pages to crawl in a trial')
+    args = parser.parse_args()
+
+    server, state = serve(args.port, args.capacity, args.rate, args.error_rate, args.latency)
+    print(f"Stand-in site on http://127.0.0.1:{args.port}/ (capacity {args.capacity}, {args.rate:g} req/s, "
+          f"{args.error_rate:.0%} errors)")
+    if args.trial:
+        trial(args.port, args.pages, state)
+        server.shutdown()
+    else:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
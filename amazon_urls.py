@@ -0,0 +1,57 @@
+"""
+Helpers for building and normalizing Amazon URLs
+"""
+import re
+from urllib.parse import urlencode, urlparse, parse_qs, unquote
+
+ASIN_RE = re.compile(r'^[A-Z0-9]{10}$')
+# Product paths seen on search pages: /Name/dp/ASIN/ref=..., /gp/product/ASIN, /gp/aw/d/ASIN
+ASIN_PATH_RE = re.compile(r'/(?:dp|gp/product|gp/aw/d|product)/([A-Za-z0-9]{10})(?=[/?#]|$)')
+
+
+def build_search_url(base_url, search_term, filters=None, page=1):
+    """Filtered search results URL, same shape the Scrapy spider requests"""
+    params = {'k': search_term}
+    if filters and filters.get('min') and filters.get('max'):
+        # Amazon's price refinement is expressed in paise
+        params['rh'] = f"p_36:{filters['min']}00-{filters['max']}00"
+    if page > 1:
+        params['page'] = page
+    return f"{base_url.rstrip('/')}/s?{urlencode(params)}"
+
+
+def is_valid_asin(asin):
+    return bool(asin) and bool(ASIN_RE.match(asin))
+
+
+def extract_asin(url):
+    """ASIN from any product link, including sponsored /sspa/click redirects, or None"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if '/sspa/click' in parsed.path:
+        # Sponsored listings wrap the real product path in the url= parameter
+        inner = parse_qs(parsed.query).get('url')
+        if inner:
+            parsed = urlparse(unquote(inner[0]))
+    match = ASIN_PATH_RE.search(parsed.path)
+    if not match:
+        return None
+    asin = match.group(1).upper()
+    return asin if is_valid_asin(asin) else None
+
+
+def canonical_product_url(base_url, asin):
+    """Short product URL with no tracking parameters"""
+    return f"{base_url.rstrip('/')}/dp/{asin}"
+
+
+def normalize_product_url(url, base_url):
+    asin = extract_asin(url)
+    return canonical_product_url(base_url, asin) if asin else None
+
+
+def unique_asins(urls):
+    """Valid ASINs from a list of links, first occurrence wins, order kept"""
+    seen = dict.fromkeys(asin for asin in map(extract_asin, urls) if asin)
+    return list(seen)
@@ -1,137 +1,295 @@
-from flask import Flask, request, render_template, send_from_directory, jsonify
+from flask import Flask, request, render_template, send_from_directory, jsonify, Response
 import webbrowser
-import sqlite3
-import threading
 import time
-import random
-from datetime import datetime
-from tracker import AmazonAPI
+import json
+import base64
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from driver_pool import driver_pool
+from jobs import JobManager, JobQueueFull
 import amazon_config
+from storage import db, OBSERVATION_SORTS
+from alerts import alert_engine
+from engine_selector import engine_selector
+from work_queue import work_queue, start_workers
+from scrape import scrape_term
 
 app = Flask(__name__)
 
-def init_db():
-    conn = sqlite3.connect('products_new.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS products
-                 (id INTEGER PRIMARY KEY, product_name TEXT, type_of_product TEXT, weight TEXT, current_price TEXT, pet TEXT, seller TEXT, date TEXT)''')
-    conn.commit()
-    conn.close()
-
-def save_products(products, date):
-    conn = sqlite3.connect('products_new.db')
-    c = conn.cursor()
-    for product in products:
-        c.execute("INSERT INTO products (product_name, type_of_product, weight, current_price, pet, seller, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                  (product.get('product_name'), product.get('type_of_product'), product.get('weight'), product.get('current_price'), product.get('pet'), product.get('seller'), date))
-    conn.commit()
-    conn.close()
-
-init_db()
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+SEARCH_PAGE_SIZE = 20
+GZIP_MIN_BYTES = 1024
+
+# Every saved batch is checked against the price alert rules
+alert_engine.attach(db)
 
 @app.route('/')
 def index():
     return render_template('form.html')
 
-def scrape_with_selenium(name, min_price, max_price):
-    """Try scraping with Selenium first"""
-    amazon = AmazonAPI(name, {'min': min_price, 'max': max_price}, amazon_config.BASE_URL, amazon_config.CURRENCY)
-    return amazon.run()
+def run_tracking_job(job):
+    """Scrape here, or hand the term to the shared work queue and follow it until a worker finishes"""
+    if amazon_config.WORK_QUEUE_ENABLED:
+        return wait_for_queued(job)
+    return scrape_term(job)
 
-def scrape_with_scrapy(name, min_price, max_price):
-    """Fall back to Scrapy if Selenium fails"""
-    from amazon_scraper.run_spider import run_spider
-    try:
-        run_spider(
-            search_term=name,
-            min_price=min_price,
-            max_price=max_price,
-            max_pages=5
-        )
-        # Read the results from the JSON file
-        with open('latest_data.json', 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Scrapy scraping failed: {e}")
-        return None
+def wait_for_queued(job):
+    item_id = work_queue.enqueue('term', job.config)
+    job.report(f"Queued as work item {item_id}, waiting for a worker...", stage='queue', work_item=item_id)
+    progress, attempts = None, 0
+    deadline = time.time() + amazon_config.WORK_QUEUE_WAIT_TIMEOUT
+    while True:
+        item = work_queue.get(item_id)
+        if item['attempts'] != attempts:
+            attempts = item['attempts']
+            job.report(f"Worker {item['lease_owner']} started attempt {attempts}", stage='queue')
+        if item['progress'] and item['progress'] != progress:
+            progress = item['progress']
+            job.report(progress, stage='worker')
+        if item['status'] == 'done':
+            return item['result'] or []
+        if item['status'] == 'dead':
+            raise RuntimeError(f"Work item {item_id} failed after {attempts} attempts: {item['last_error']}")
+        if time.time() > deadline:
+            # The item stays queued; a worker may still finish it and save its products
+            raise TimeoutError(f"Work item {item_id} still {item['status']} after "
+                               f"{amazon_config.WORK_QUEUE_WAIT_TIMEOUT}s (attempt {attempts})")
+        time.sleep(1)
+
+job_manager = JobManager(run_tracking_job)
+
+if amazon_config.WORK_QUEUE_ENABLED and amazon_config.WORK_QUEUE_BACKEND == 'memory':
+    # Nothing outside this process can reach an in-memory queue
+    start_workers(work_queue, amazon_config.WORK_QUEUE_LOCAL_WORKERS)
+
+def wants_json():
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return request.is_json or best == 'application/json'
 
 @app.route('/run', methods=['POST'])
 def run():
-    name = request.form['name'].replace(' ', '_')
-    min_price = request.form['min']
-    max_price = request.form['max']
-    amazon_config.NAME = name
-    amazon_config.MIN_PRICE = min_price
-    amazon_config.MAX_PRICE = max_price
-    amazon_config.FILTERS = {'min': min_price, 'max': max_price}
-    
-    print("Starting data fetch...")
-    data = None
-    
-    # Try Selenium first
-    print("Attempting to scrape with Selenium...")
-    max_attempts = 2
-    for attempt in range(max_attempts):
-        try:
-            data = scrape_with_selenium(name, min_price, max_price)
-            if data:
-                print("Successfully scraped with Selenium")
-                break
-        except Exception as e:
-            print(f"Selenium attempt {attempt + 1} failed: {str(e)}")
-            if attempt < max_attempts - 1:
-                time.sleep(random.uniform(2, 4))
-    
-    # If Selenium failed, try Scrapy
-    if not data:
-        print("Selenium failed, attempting to scrape with Scrapy...")
-        try:
-            data = scrape_with_scrapy(name, min_price, max_price)
-            if data:
-                print("Successfully scraped with Scrapy")
-        except Exception as e:
-            print(f"Scrapy scraping failed: {str(e)}")
-    
-    if data is None:
-        data = []
-        print("All scraping attempts failed.")
-    print(f"Data fetch complete. Scraped {len(data)} products")
-    # Always save to JSON file for display
-    import json
-    print(f"Saving data to JSON: {data}")
-    with open('latest_data.json', 'w') as f:
-        json.dump(data, f, indent=2)
-    print("JSON file saved")
-    if data:
-        date = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        save_products(data, date)
-        print("Data saved to SQLite database and JSON file")
-    else:
-        print("No products found to save")
+    form = request.get_json(silent=True) or request.form
+    config = {
+        'name': form['name'].replace(' ', '_'),
+        'min': form['min'],
+        'max': form['max'],
+        'search_only': str(form.get('search_only', '')).lower() in ('1', 'on', 'true'),
+        'allowed_sellers': amazon_config.ALLOWED_SELLERS if str(form.get('brands_only', '')).lower() in ('1', 'on', 'true') else None
+    }
+    try:
+        job = job_manager.submit(config)
+    except JobQueueFull as e:
+        if wants_json():
+            return jsonify({'error': str(e)}), 503
+        return f"<h1>Too many tracking jobs running</h1><p>{e}. Please try again shortly.</p><a href=\"/\">Back to form</a>", 503
+    if wants_json():
+        return jsonify({
+            'job_id': job.id,
+            'status_url': f'/jobs/{job.id}',
+            'events_url': f'/jobs/{job.id}/events'
+        }), 202
+    return render_template('loading.html', job_id=job.id), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    try:
+        since = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        since = 0
+    return Response(job_manager.stream(job, since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not job.finished:
+        return jsonify(job.to_dict()), 202
+    return jsonify(job.result or [])
+
+@app.route('/data')
+def data_page():
     return render_template('data.html')
 
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort):
+    """Keyset values from a cursor; ValueError unless it matches the sort's key columns"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    columns = OBSERVATION_SORTS[sort][2]
+    if not isinstance(key, list) or len(key) != len(columns) or \
+            not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in key):
+        raise ValueError(f'cursor does not fit sort {sort}')
+    return key
+
+def parse_date_arg(name, end_of_day=False):
+    value = request.args.get(name)
+    if not value:
+        return None
+    day = datetime.strptime(value, '%Y-%m-%d')
+    if end_of_day:
+        day = day.replace(hour=23, minute=59, second=59)
+    return int(day.timestamp())
+
+def parse_float_arg(name):
+    value = request.args.get(name)
+    return float(value) if value not in (None, '') else None
+
 @app.route('/api/products')
 def get_products():
-    conn = sqlite3.connect('products_new.db')
-    c = conn.cursor()
-    c.execute("SELECT product_name, type_of_product, weight, current_price, pet, seller FROM products ORDER BY id DESC LIMIT 100")
-    rows = c.fetchall()
-    conn.close()
-    products = [dict(zip(['product_name', 'type_of_product', 'weight', 'current_price', 'pet', 'seller'], row)) for row in rows]
-    return jsonify(products)
+    """Filtered, keyset-paginated price observations
+
+    Query args: term, q, seller, pet, min_price, max_price, since, until (YYYY-MM-DD),
+    sort (newest|oldest|price_asc|price_desc), limit and the cursor from the previous page.
+    """
+    sort = request.args.get('sort', 'newest')
+    if sort not in OBSERVATION_SORTS:
+        return jsonify({'error': f'Unknown sort {sort}'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+        filters = {
+            'term': request.args.get('term'),
+            'q': request.args.get('q'),
+            'seller': request.args.get('seller'),
+            'pet': request.args.get('pet'),
+            'min_price': parse_float_arg('min_price'),
+            'max_price': parse_float_arg('max_price'),
+            'since': parse_date_arg('since'),
+            'until': parse_date_arg('until', end_of_day=True),
+        }
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, sort) if cursor else None
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Bad query: {e}'}), 400
+
+    # Any new or discarded observation changes the ETag, so unchanged pages are answered without a query
+    last_id, last_ts, discarded = db.observations_version()
+    etag = hashlib.sha1(f'{last_id}:{discarded}:{request.query_string.decode()}'.encode()).hexdigest()
+    last_ts = max(last_ts, discarded)
+    last_modified = datetime.fromtimestamp(last_ts, timezone.utc) if last_ts else None
+    if request.if_none_match.contains(etag) or (
+            not request.if_none_match and last_modified and request.if_modified_since
+            and last_modified.replace(microsecond=0) <= request.if_modified_since):
+        response = Response(status=304)
+    else:
+        items, next_key = db.query_observations(filters, sort, limit, after)
+        response = jsonify({
+            'items': items,
+            'next_cursor': encode_cursor(next_key) if next_key else None,
+            'limit': limit,
+            'sort': sort
+        })
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/search')
+def search_products():
+    """Ranked full-text product search with highlighted snippets
+
+    Query args: q (words; the last word and any word ending in * match as prefixes),
+    limit and offset.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'error': 'Missing q'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError as e:
+        return jsonify({'error': f'Bad query: {e}'}), 400
+    started = time.time()
+    items = db.search_products(text, limit, offset)
+    return jsonify({
+        'items': items,
+        'q': text,
+        'limit': limit,
+        'offset': offset,
+        'took_ms': round((time.time() - started) * 1000, 2)
+    })
+
+@app.route('/api/products/<asin>/stats')
+def product_stats(asin):
+    """Running price stats and daily OHLC for one product, read from the aggregate tables"""
+    stats = db.product_stats(asin)
+    if stats is None:
+        return jsonify({'error': 'Unknown product'}), 404
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 365)
+    except ValueError as e:
+        return jsonify({'error': f'Bad query: {e}'}), 400
+    stats['daily'] = db.daily_ohlc(asin, days)
+    return jsonify(stats)
+
+@app.route('/api/best/<term>')
+def best_item(term):
+    """Cheapest product from the newest run for a search term"""
+    best = db.term_best(term)
+    if best is None:
+        return jsonify({'error': 'No priced products for this term'}), 404
+    return jsonify(best)
+
+@app.route('/results')
+def results():
+    return render_template('results.html')
+
+@app.after_request
+def compress_response(response):
+    """gzip JSON and HTML bodies for clients that accept it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in ('application/json', 'text/html')
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = len(response.get_data())
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/status')
 def status():
     try:
-        conn = sqlite3.connect('products_new.db')
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM products")
-        count = c.fetchone()[0]
-        conn.close()
+        counts = db.table_counts()
+        pool = driver_pool.get_stats()
+        engines = engine_selector.get_stats()
+        engine_rows = ''
+        for name, e in engines['engines'].items():
+            latency = f"{e['latency_p']:.0f}s" if e['latency_p'] is not None else '-'
+            engine_rows += (f"<p>{name}: {e['succeeded']} ok / {e['failed']} failed / {e['cancelled']} cancelled, "
+                            f"{e['wins']} wins | success {e['success_rate']:.0%} | mean {e['mean_seconds']:.0f}s | "
+                            f"expected {e['expected_seconds']:.0f}s | p{engines['hedge_percentile']} {latency}</p>")
         return f"""
         <h1>Database Status</h1>
         <p style="color: green;">✅ SQLite database is active</p>
-        <p>Total products stored: {count}</p>
+        <p>Total price observations stored: {counts.get('price_observations', 0)}</p>
+        <p>Products tracked: {counts.get('products', 0)} | Search runs: {counts.get('search_runs', 0)}</p>
+        <h2>Browser Pool</h2>
+        <p>{pool['in_use']} in use, {pool['idle']} idle of {pool['size']} |
+           avg wait {pool['wait_seconds_avg']:.2f}s | avg lease {pool['lease_seconds_avg']:.1f}s |
+           recycled {pool['recycled']}</p>
+        <h2>Engines</h2>
+        {engine_rows}
         <a href="/">Back to form</a> | <a href="/debug">View debug data</a>
         """
     except Exception as e:
@@ -142,20 +300,23 @@ def status():
         <a href="/">Back to form</a>
         """
 
+@app.route('/api/pool')
+def pool_stats():
+    return jsonify(driver_pool.get_stats())
+
+@app.route('/api/engines')
+def engine_stats():
+    return jsonify(engine_selector.get_stats())
+
 @app.route('/debug')
 def debug():
     try:
-        conn = sqlite3.connect('products_new.db')
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM products")
-        count = c.fetchone()[0]
-        c.execute("SELECT * FROM products ORDER BY id DESC LIMIT 10")
-        rows = c.fetchall()
-        conn.close()
+        count = db.count_observations()
+        rows = db.latest_observations(10)
         return f"""
         <h1>Debug Info</h1>
-        <p>Total products in database: {count}</p>
-        <h2>Latest 10 products:</h2>
+        <p>Total price observations in database: {count}</p>
+        <h2>Latest 10 observations:</h2>
         <pre>{rows}</pre>
         <a href="/">Back to form</a>
         """
@@ -0,0 +1,204 @@
+"""
+Pool of warm Chrome drivers shared across tracker runs
+"""
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from amazon_config import (
+    get_chrome_options,
+    get_chrome_driver,
+    set_ignore_certificate_error,
+    set_browser_as_incognito,
+    DRIVER_POOL_SIZE,
+    DRIVER_MAX_PAGES,
+    DRIVER_LEASE_TIMEOUT
+)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
+
+STEALTH_JS = """
+    // Overwrite the 'navigator.webdriver' property
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => false
+    });
+
+    // Add regular browser features
+    window.chrome = {
+        runtime: {}
+    };
+
+    // Add regular plugins array
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5]
+    });
+
+    // Add regular languages
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['en-US', 'en']
+    });
+"""
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def create_driver():
+    """Start a Chrome instance with the stealth setup applied once"""
+    options = get_chrome_options()
+    set_ignore_certificate_error(options)
+    set_browser_as_incognito(options)
+
+    driver = get_chrome_driver(options)
+
+    # Set CDP parameters for stealth
+    driver.execute_cdp_cmd('Network.setUserAgentOverride', {
+        "userAgent": USER_AGENT,
+        "platform": "Windows",
+        "acceptLanguage": "en-US,en;q=0.9"
+    })
+    # Register the stealth script for every new document so it survives navigation and reuse
+    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': STEALTH_JS})
+    return driver
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.time()
+        self.leased_at = None
+
+
+class DriverPool:
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES, factory=create_driver):
+        self.size = size
+        self.max_pages = max_pages
+        self.factory = factory
+        # LIFO so the most recently used (warmest) browser is handed out first
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {
+            'leases': 0,
+            'in_use': 0,
+            'created': 0,
+            'recycled': 0,
+            'health_failures': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'lease_seconds_total': 0.0,
+            'lease_seconds_max': 0.0,
+        }
+
+    def acquire(self, timeout=DRIVER_LEASE_TIMEOUT):
+        started = time.time()
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"No browser free after {timeout}s")
+        try:
+            item = self._take_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+        waited = time.time() - started
+        item.leased_at = time.time()
+        with self._lock:
+            self.stats['leases'] += 1
+            self.stats['in_use'] += 1
+            self.stats['wait_seconds_total'] += waited
+            self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+        return item
+
+    def release(self, item):
+        held = time.time() - (item.leased_at or time.time())
+        with self._lock:
+            self.stats['in_use'] -= 1
+            self.stats['lease_seconds_total'] += held
+            self.stats['lease_seconds_max'] = max(self.stats['lease_seconds_max'], held)
+        try:
+            if self._closed or item.pages >= self.max_pages:
+                if not self._closed:
+                    print(f"Recycling browser after {item.pages} pages")
+                    with self._lock:
+                        self.stats['recycled'] += 1
+                self._quit(item)
+            elif self._reset(item):
+                self._idle.put(item)
+            else:
+                self._quit(item)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def lease(self, timeout=DRIVER_LEASE_TIMEOUT):
+        item = self.acquire(timeout)
+        try:
+            yield item
+        finally:
+            self.release(item)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        leases = stats['leases'] or 1
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / leases
+        stats['lease_seconds_avg'] = stats['lease_seconds_total'] / leases
+        return stats
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def _take_healthy(self):
+        while True:
+            try:
+                item = self._idle.get_nowait()
+            except queue.Empty:
+                item = PooledDriver(self.factory())
+                with self._lock:
+                    self.stats['created'] += 1
+                return item
+            if self._is_healthy(item):
+                return item
+            with self._lock:
+                self.stats['health_failures'] += 1
+            self._quit(item)
+
+    def _is_healthy(self, item):
+        try:
+            return item.driver.execute_script('return 1') == 1
+        except Exception as e:
+            print(f"Pooled browser failed health check: {e}")
+            return False
+
+    def _reset(self, item):
+        """Clear cookies and storage so the next lease starts clean"""
+        try:
+            item.driver.delete_all_cookies()
+            item.driver.execute_script('try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}')
+            item.driver.get('about:blank')
+            return True
+        except Exception as e:
+            print(f"Could not reset pooled browser: {e}")
+            return False
+
+    def _quit(self, item):
+        try:
+            item.driver.quit()
+        except Exception:
+            pass
+
+
+# Global driver pool instance
+driver_pool = DriverPool()
+atexit.register(driver_pool.close)
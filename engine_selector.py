@@ -0,0 +1,216 @@
+"""
+Pick the scraping engine from how the engines have actually been doing
+
+Every run records (ok, seconds) for its engine. Engines are tried in order
+of expected time-to-result, mean run time / success rate, which is the
+order that minimises the expected wait when each is tried once in turn.
+Observations decay with ENGINE_HALF_LIFE and are blended with a prior, so
+an engine that failed for hours drifts back to the prior and gets retried
+instead of being written off for good.
+
+With ENGINE_HEDGE on, the next engine also starts once the current one
+runs past its usual (ENGINE_HEDGE_PERCENTILE) run time; the first
+non-empty result wins and the other run is cancelled where possible.
+"""
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+from amazon_config import (ENGINE_PRIOR_SECONDS, ENGINE_PRIOR_WEIGHT, ENGINE_HALF_LIFE, ENGINE_WINDOW, ENGINE_HEDGE,
+                           ENGINE_HEDGE_PERCENTILE, ENGINE_HEDGE_MIN_SAMPLES, ENGINE_HEDGE_DEFAULT_SECONDS)
+
+
+class EngineCancelled(Exception):
+    """Raised inside a losing run once the other engine has delivered"""
+    pass
+
+
+class EngineStats:
+    def __init__(self, name, prior_seconds, window):
+        self.name = name
+        self.prior_seconds = prior_seconds
+        self.runs = deque(maxlen=window)  # (finished_at, ok, seconds)
+        self.started = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.wins = 0
+
+    def record(self, ok, seconds):
+        self.runs.append((time.time(), ok, seconds))
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    def estimate(self, half_life, prior_weight):
+        """(success rate, mean run seconds) from decayed observations plus the prior"""
+        now = time.time()
+        weight = ok_weight = seconds = 0.0
+        for finished_at, ok, run_seconds in self.runs:
+            w = 0.5 ** ((now - finished_at) / half_life)
+            weight += w
+            ok_weight += w if ok else 0.0
+            seconds += w * run_seconds
+        total = weight + prior_weight
+        success_rate = (ok_weight + prior_weight / 2) / total
+        mean_seconds = (seconds + prior_weight * self.prior_seconds) / total
+        return success_rate, mean_seconds
+
+    def percentile(self, pct):
+        """Nearest-rank percentile of successful run times, or None without data"""
+        times = sorted(seconds for _, ok, seconds in self.runs if ok)
+        if not times:
+            return None
+        return times[max(0, math.ceil(pct / 100 * len(times)) - 1)], len(times)
+
+
+class EngineSelector:
+    def __init__(self, prior_seconds=ENGINE_PRIOR_SECONDS, prior_weight=ENGINE_PRIOR_WEIGHT,
+                 half_life=ENGINE_HALF_LIFE, window=ENGINE_WINDOW, hedge=ENGINE_HEDGE,
+                 hedge_percentile=ENGINE_HEDGE_PERCENTILE, hedge_min_samples=ENGINE_HEDGE_MIN_SAMPLES,
+                 hedge_default_seconds=ENGINE_HEDGE_DEFAULT_SECONDS):
+        self.prior_weight = prior_weight
+        self.half_life = half_life
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_seconds = hedge_default_seconds
+        self.engines = {name: EngineStats(name, seconds, window) for name, seconds in prior_seconds.items()}
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def _engine(self, name):
+        if name not in self.engines:
+            self.engines[name] = EngineStats(name, max(ENGINE_PRIOR_SECONDS.values()), ENGINE_WINDOW)
+        return self.engines[name]
+
+    def record(self, name, ok, seconds):
+        with self._lock:
+            self._engine(name).record(ok, seconds)
+
+    def expected_seconds(self, name):
+        """Expected time until this engine returns a result, retrying it on failure"""
+        with self._lock:
+            success_rate, mean_seconds = self._engine(name).estimate(self.half_life, self.prior_weight)
+        return mean_seconds / success_rate
+
+    def rank(self, names=None):
+        names = list(names or self.engines)
+        return sorted(names, key=self.expected_seconds)
+
+    def hedge_delay(self, name):
+        """Seconds to give this engine before starting the next one alongside it"""
+        with self._lock:
+            found = self._engine(name).percentile(self.hedge_percentile)
+        if found is None or found[1] < self.hedge_min_samples:
+            return self.hedge_default_seconds
+        return found[0]
+
+    def run(self, runners, report=None):
+        """Run engines in ranked order, hedging if enabled; returns (engine, data) or (None, None)
+
+        runners maps an engine name to fn(cancel) -> data; fn should stop
+        early once the threading.Event cancel is set. Empty data counts as
+        a failure.
+        """
+        if report is None:
+            def report(message, **extra):
+                print(message)
+        order = self.rank(runners)
+        cancel = threading.Event()
+        pending = {}
+        started = time.time()
+        primary = None
+
+        def start(name):
+            nonlocal primary, started
+            primary, started = name, time.time()
+            pending[self._start(name, runners[name], cancel)] = name
+
+        report(f"Engine order: {', '.join(f'{n} (~{self.expected_seconds(n):.0f}s)' for n in order)}",
+               stage='engine')
+        start(order.pop(0))
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and order:
+                    timeout = max(0.0, self.hedge_delay(primary) - (time.time() - started))
+                done, _ = wait(pending, timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    report(f"{primary} is slower than usual, also starting {order[0]}", stage='engine')
+                    with self._lock:
+                        self.hedges += 1
+                    start(order.pop(0))
+                    continue
+                for future in done:
+                    name = pending.pop(future)
+                    data = future.result()
+                    if data:
+                        with self._lock:
+                            self.engines[name].wins += 1
+                        return name, data
+                    report(f"{name} returned no data", stage='engine')
+                if order and not pending:
+                    start(order.pop(0))
+            return None, None
+        finally:
+            # Losing runs stop at their next checkpoint; their results are ignored
+            cancel.set()
+
+    def _start(self, name, fn, cancel):
+        future = Future()
+        stats = self._engine(name)
+        with self._lock:
+            stats.started += 1
+        deadline = self.hedge_delay(name)
+
+        def target():
+            started = time.time()
+            try:
+                data = fn(cancel)
+            except EngineCancelled:
+                data = None
+            except Exception as e:
+                print(f"{name} run failed: {e}")
+                data = None
+            with self._lock:
+                elapsed = time.time() - started
+                if cancel.is_set():
+                    stats.cancelled += 1
+                    # Lost a race it was already too slow for: a miss, or hedged runs never count against it
+                    if elapsed >= deadline:
+                        stats.record(False, elapsed)
+                else:
+                    stats.record(bool(data), elapsed)
+            future.set_result(data)
+
+        threading.Thread(target=target, name=f'engine-{name}', daemon=True).start()
+        return future
+
+    def get_stats(self):
+        engines = {}
+        for name in self.rank():
+            stats = self.engines[name]
+            with self._lock:
+                success_rate, mean_seconds = stats.estimate(self.half_life, self.prior_weight)
+                found = stats.percentile(self.hedge_percentile)
+                engines[name] = {
+                    'started': stats.started,
+                    'succeeded': stats.succeeded,
+                    'failed': stats.failed,
+                    'cancelled': stats.cancelled,
+                    'wins': stats.wins,
+                    'success_rate': round(success_rate, 3),
+                    'mean_seconds': round(mean_seconds, 1),
+                    'expected_seconds': round(mean_seconds / success_rate, 1),
+                    'latency_p': round(found[0], 1) if found else None
+                }
+        return {'order': list(engines), 'hedge': self.hedge, 'hedge_percentile': self.hedge_percentile,
+                'hedges': self.hedges, 'engines': engines}
+
+
+# Global selector shared by the app's jobs
+engine_selector = EngineSelector()
@@ -0,0 +1,126 @@
+"""
+Background scrape jobs for the Flask app
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from amazon_config import JOB_WORKERS, JOB_QUEUE_LIMIT, JOB_HISTORY
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, config):
+        self.id = uuid.uuid4().hex
+        # Per-job settings (name, min, max, ...) so concurrent jobs never share globals
+        self.config = config
+        self.status = 'queued'
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._changed = threading.Condition()
+
+    def report(self, message, **extra):
+        print(f"[job {self.id[:8]}] {message}")
+        self._add_event('progress', dict(message=message, **extra))
+
+    def set_status(self, status, **extra):
+        self.status = status
+        if status == 'running':
+            self.started_at = time.time()
+        elif status in ('done', 'failed'):
+            self.finished_at = time.time()
+        self._add_event('status', dict(status=status, **extra))
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def _add_event(self, kind, data):
+        with self._changed:
+            self.events.append({'id': len(self.events), 'event': kind, 'data': data, 'ts': time.time()})
+            self._changed.notify_all()
+
+    def wait_for_events(self, since, timeout):
+        """Block until there are events after `since` or the job finishes"""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > since or self.finished, timeout)
+            return self.events[since:]
+
+    def to_dict(self):
+        last = self.events[-1]['data'] if self.events else {}
+        return {
+            'id': self.id,
+            'status': self.status,
+            'config': self.config,
+            'message': last.get('message'),
+            'events': len(self.events),
+            'product_count': len(self.result) if self.result else 0,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, runner, max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_LIMIT, history=JOB_HISTORY):
+        self.runner = runner
+        self.max_pending = max_pending
+        self.history = history
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scrape-job')
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, config):
+        job = Job(config)
+        with self._lock:
+            pending = sum(1 for j in self.jobs.values() if not j.finished)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs already waiting")
+            self.jobs[job.id] = job
+            self._prune()
+        job.set_status('queued')
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def stream(self, job, since=0, keepalive=15):
+        """Yield Server-Sent Events for a job until it finishes"""
+        while True:
+            events = job.wait_for_events(since, keepalive)
+            if not events and not job.finished:
+                yield ': keepalive\n\n'
+                continue
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+            since += len(events)
+            if job.finished and since >= len(job.events):
+                return
+
+    def _run(self, job):
+        job.set_status('running')
+        try:
+            job.result = self.runner(job)
+            job.set_status('done', product_count=len(job.result or []))
+        except Exception as e:
+            job.error = str(e)
+            job.set_status('failed', error=job.error)
+
+    def _prune(self):
+        # Drop the oldest finished jobs once history is full
+        finished = [job_id for job_id, j in self.jobs.items() if j.finished]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
@@ -1,25 +1,38 @@
-import json
+import argparse
 import csv
+import json
 import os
-from amazon_config import DIRECTORY, NAME
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from amazon_config import DIRECTORY, NAME, REPORT_ARCHIVE_BYTES
+from report_store import ReportStore, is_store, LEGACY_DATE_FORMAT, SEGMENT_NAME, INDEX_NAME
 
-def json_to_csv():
-    json_file = f'{DIRECTORY}/{NAME}.json'
-    if not os.path.exists(json_file):
-        print("JSON file not found")
-        return
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
-    with open(json_file, 'r') as f:
-        temp = json.load(f)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
-    if 'reports' in temp:
-        data = temp
-    else:
-        # Old format
-        data = {'reports': [temp]}
+FIELDS = ['term', 'report_date', 'product_name', 'type_of_product', 'weight', 'current_price', 'pet', 'seller', 'asin', 'rating']
+PARQUET_BATCH_ROWS = 10000
+
+def json_to_csv():
+    if not os.path.exists(os.path.join(DIRECTORY, NAME)) and not os.path.exists(f'{DIRECTORY}/{NAME}.json'):
+        print("Report history not found")
+        return
 
-    reports = data.get('reports', [])
-    products = reports[-1].get('products', []) if reports else []
+    # Only the latest report is read, not the whole history
+    latest = ReportStore(DIRECTORY, NAME).latest()
+    products = latest.get('products') if latest else None
     if not products:
         print("No products in JSON")
         return
@@ -32,5 +45,180 @@ def json_to_csv():
 
     print(f"CSV generated: {csv_file}")
 
+def iter_legacy_reports(path):
+    """Reports from an unconverted reports/<name>.json, streamed when ijson is available"""
+    with open(path, 'rb') as f:
+        if ijson:
+            found = False
+            for report in ijson.items(f, 'reports.item', use_float=True):
+                found = True
+                yield report
+            if found:
+                return
+            f.seek(0)
+        temp = json.load(f)
+    # Old format had a single report at the top level
+    yield from (temp['reports'] if 'reports' in temp else [temp])
+
+def iter_reports(directory=DIRECTORY, terms=None, since=None, until=None):
+    """(term, report) for every report in every history under directory, one at a time"""
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        term = entry[:-5] if entry.endswith('.json') else entry
+        if terms and term not in terms:
+            continue
+        if os.path.isdir(path) and is_store(path):
+            # The index narrows the date range without reading other reports
+            store = ReportStore(directory, term, convert_legacy=False)
+            for report in store.between(since, until):
+                yield term, report
+        elif entry.endswith('.json') and os.path.isfile(path):
+            for report in iter_legacy_reports(path):
+                date = parse_report_date(report.get('date'))
+                if since and (date is None or date < since):
+                    continue
+                if until and (date is None or date > until):
+                    continue
+                yield term, report
+
+def iter_products(reports):
+    for term, report in reports:
+        for product in report.get('products') or []:
+            row = dict(product)
+            row['term'] = term
+            row['report_date'] = report.get('date')
+            yield row
+
+def parse_report_date(value):
+    try:
+        return datetime.strptime(value, LEGACY_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+def write_csv(rows, output):
+    count = 0
+    with open(output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, delimiter='|', extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def write_jsonl(rows, output):
+    count = 0
+    with open(output, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+def write_parquet(rows, output):
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    schema = pa.schema([(field, pa.float64() if field in ('current_price', 'rating') else pa.string()) for field in FIELDS])
+    count = 0
+    batch = []
+    with pq.ParquetWriter(output, schema) as writer:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(_parquet_table(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(_parquet_table(batch, schema))
+            count += len(batch)
+    return count
+
+def _parquet_table(batch, schema):
+    columns = {}
+    for field in schema:
+        values = [row.get(field.name) for row in batch]
+        if pa.types.is_floating(field.type):
+            values = [_to_float(v) for v in values]
+        else:
+            values = [None if v is None else str(v) for v in values]
+        columns[field.name] = values
+    return pa.table(columns, schema=schema)
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'parquet': write_parquet}
+
+def export(output, fmt='csv', directory=DIRECTORY, terms=None, since=None, until=None):
+    rows = iter_products(iter_reports(directory, terms, since, until))
+    count = WRITERS[fmt](rows, output)
+    print(f"Exported {count} products to {output}")
+    return count
+
+def write_synthetic_history(path, report, count, segment_bytes=REPORT_ARCHIVE_BYTES):
+    """Lay out archive segments and their index directly, in the layout ReportStore reads
+
+    Appending report by report fsyncs twice per report, which would make
+    building a multi-GB history take far longer than the export being timed.
+    """
+    os.makedirs(path, exist_ok=True)
+    segment, out = 0, None
+    with open(os.path.join(path, INDEX_NAME), 'w', encoding='utf-8') as index:
+        for i in range(count):
+            ts = 1700000000 + i * 3600
+            report['date'] = datetime.fromtimestamp(ts).strftime(LEGACY_DATE_FORMAT)
+            line = (json.dumps(report, ensure_ascii=False) + '\n').encode('utf-8')
+            if out is None or out.tell() + len(line) > segment_bytes:
+                if out:
+                    out.close()
+                segment += 1
+                out = open(os.path.join(path, SEGMENT_NAME.format(segment)), 'wb')
+            index.write(json.dumps({'ts': ts, 'segment': segment, 'offset': out.tell(), 'length': len(line)}) + '\n')
+            out.write(line)
+    if out:
+        out.close()
+
+def benchmark(size_mb, fmt='csv'):
+    """Build a synthetic history of about size_mb and time a full export"""
+    workdir = tempfile.mkdtemp(prefix='export-bench-')
+    try:
+        product = {'product_name': 'Pedigree Adult Dry Dog Food, Chicken & Vegetables, 10 kg Pack', 'type_of_product': 'Generic',
+                   'weight': '10kg', 'current_price': 1299.0, 'pet': 'Dog', 'seller': 'Pedigree', 'asin': 'B07XYZ1234'}
+        report = {'title': 'bench', 'currency': '₹', 'filters': {'min': '200', 'max': '10000'},
+                  'base_link': 'https://www.amazon.in/', 'products': [product] * 48}
+        report_bytes = len(json.dumps(report))
+        count = int(size_mb * 1024 * 1024 / report_bytes) + 1
+        print(f"Writing {count} reports ({size_mb} MB) to {workdir}...")
+        write_synthetic_history(os.path.join(workdir, 'bench'), report, count)
+        started = time.time()
+        rows = export(os.path.join(workdir, f'bench.{fmt}'), fmt, directory=workdir)
+        elapsed = time.time() - started
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        print(f"{rows} rows in {elapsed:.1f}s ({size_mb / elapsed:.1f} MB/s, {rows / elapsed:.0f} rows/s), peak RSS {peak:.0f} MB")
+    finally:
+        shutil.rmtree(workdir)
+
+def main():
+    parser = argparse.ArgumentParser(description='Export tracked products from report history')
+    parser.add_argument('--all', action='store_true', help='stream every report in every history under DIRECTORY')
+    parser.add_argument('--term', action='append', help='only this search term (repeatable)')
+    parser.add_argument('--since', help='first report date, dd/mm/YYYY')
+    parser.add_argument('--until', help='last report date, dd/mm/YYYY')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--output', help='output file (default: reports/export.<format>)')
+    parser.add_argument('--benchmark', type=float, metavar='MB', help='time an export of a synthetic history of this size')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.format)
+    elif args.all or args.term or args.since or args.until or args.format != 'csv':
+        since = datetime.strptime(args.since, '%d/%m/%Y') if args.since else None
+        until = datetime.strptime(args.until + ' 23:59:59', LEGACY_DATE_FORMAT) if args.until else None
+        export(args.output or f'{DIRECTORY}/export.{args.format}', args.format, terms=args.term, since=since, until=until)
+    else:
+        json_to_csv()
+
 if __name__ == "__main__":
-    json_to_csv()
\ No newline at end of file
+    main()
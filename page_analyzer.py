@@ -0,0 +1,251 @@
+"""
+Single-pass analysis of Amazon product pages.
+
+The analyzer works on raw HTML so the same code can run on a Selenium
+`page_source`, a Scrapy `response.text` or a saved fixture.
+"""
+import re
+import time
+from urllib.parse import urljoin
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from lxml import html as lxml_html
+
+from amazon_urls import extract_asin, is_valid_asin
+
+
+BLOCKED_INDICATORS = [
+    'Sorry, we just need to make sure you',
+    'Enter the characters you see below',
+    'To discuss automated access to Amazon data',
+    'Bot Check',
+    'Robot Check',
+    'Type the characters you see in this image',
+    'Your browser is not accepting cookies'
+]
+
+# One compiled alternation so the page is scanned once, not once per indicator
+BLOCKED_RE = re.compile('|'.join(re.escape(i) for i in BLOCKED_INDICATORS), re.IGNORECASE)
+WEIGHT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*kg', re.IGNORECASE)
+PRICE_RE = re.compile(r'[^0-9.]')
+OUT_OF_STOCK_RE = re.compile(r'currently unavailable|out of stock', re.IGNORECASE)
+
+TITLE_XPATH = 'string(//*[@id="productTitle"])'
+SELLER_XPATHS = [
+    'string(//*[@id="bylineInfo"])',
+    'string(//*[@id="sellerProfile"]//span)',
+    'string(//*[@id="merchant-info"]//a)',
+]
+PRICE_WHOLE_XPATH = 'string((//span[contains(concat(" ", normalize-space(@class), " "), " a-price-whole ")])[1])'
+PRICE_FRACTION_XPATH = 'string((//span[contains(concat(" ", normalize-space(@class), " "), " a-price-fraction ")])[1])'
+PRICE_OFFSCREEN_XPATH = 'string((//*[@data-a-color="price"]//*[contains(concat(" ", normalize-space(@class), " "), " a-offscreen ")])[1])'
+AVAILABILITY_XPATH = 'string(//*[@id="availability"] | //*[@id="outOfStock"])'
+RATING_RE = re.compile(r'(\d+(?:\.\d+)?) out of 5')
+
+CARD_XPATH = '//div[@data-component-type="s-search-result"]'
+CARD_TITLE_XPATH = 'string(.//h2)'
+CARD_LINK_XPATH = '(.//h2//a/@href | .//a[.//h2]/@href)[1]'
+CARD_PRICE_XPATH = 'string((.//span[contains(concat(" ", normalize-space(@class), " "), " a-price ") and not(contains(@class, "a-text-price"))]//span[@class="a-offscreen"])[1])'
+CARD_RATING_XPATH = 'string((.//span[contains(@class, "a-icon-alt")])[1])'
+CARD_BRAND_XPATH = 'string((.//div[@data-cy="title-recipe"]//span[contains(@class, "a-size-base-plus") and not(ancestor::h2)])[1])'
+SEARCH_LINK_XPATHS = [
+    '//div[@data-component-type="s-search-result"]//h2//a/@href',
+    '//div[@data-component-type="s-search-result"]//a[.//h2]/@href',
+    '//div[contains(@class, "s-result-item")]//h2//a/@href',
+    '//div[@data-component-type="s-search-result"]//a[contains(@class, "s-no-outline")]/@href',
+]
+
+
+@dataclass
+class ProductPage:
+    """Everything we need from one product page"""
+    url: Optional[str]
+    blocked: bool
+    block_reason: Optional[str]
+    title: Optional[str]
+    price: Optional[float]
+    seller: Optional[str]
+    weight: str
+    pet: str
+    parse_seconds: float
+    out_of_stock: bool = False
+
+    def to_product(self):
+        """Convert to the product dict used by reports and the database
+
+        An out-of-stock page gives a product without a price, so the
+        history shows the gap and in_stock alerts can fire when it ends.
+        """
+        if not (self.title and (self.price or self.out_of_stock)):
+            return None
+        return {
+            'product_name': self.title,
+            'type_of_product': 'Generic',
+            'weight': self.weight,
+            'current_price': self.price or None,
+            'pet': self.pet,
+            'seller': self.seller if self.seller else 'Amazon'
+        }
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class SearchCard:
+    """One product card on a search results page"""
+    asin: Optional[str]
+    url: Optional[str]
+    title: Optional[str]
+    price: Optional[float]
+    rating: Optional[float]
+    brand: Optional[str]
+
+    def to_product(self):
+        """Product dict straight from the card, or None if a product page visit is needed"""
+        if not (self.title and self.price):
+            return None
+        return {
+            'product_name': self.title,
+            'type_of_product': 'Generic',
+            'weight': extract_weight(self.title),
+            'current_price': self.price,
+            'pet': extract_pet(self.title),
+            'seller': self.brand if self.brand else 'N/A',
+            'rating': self.rating,
+            'asin': self.asin
+        }
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def extract_weight(title):
+    if not title:
+        return 'N/A'
+    match = WEIGHT_RE.search(title)
+    if match:
+        return match.group(1) + 'kg'
+    return 'N/A'
+
+
+def extract_pet(title):
+    if not title:
+        return 'N/A'
+    if 'dog' in title.lower():
+        return 'Dog'
+    elif 'cat' in title.lower():
+        return 'Cat'
+    return 'N/A'
+
+
+def convert_price(price):
+    if not price:
+        return None
+    # Remove currency symbol and any other non-numeric characters except dots
+    price = PRICE_RE.sub('', price).strip('.')
+    try:
+        return float(price)
+    except (ValueError, TypeError):
+        return None
+
+
+def detect_block(page_html):
+    """Return the matching anti-bot indicator or None"""
+    match = BLOCKED_RE.search(page_html or '')
+    return match.group(0) if match else None
+
+
+def parse_html(page_html):
+    return lxml_html.fromstring(page_html or '<html></html>')
+
+
+def _text(tree, xpath):
+    value = tree.xpath(xpath)
+    value = ' '.join(value.split()) if value else ''
+    return value or None
+
+
+def extract_price(tree):
+    whole = _text(tree, PRICE_WHOLE_XPATH)
+    if whole:
+        whole = whole.rstrip('.')
+        fraction = _text(tree, PRICE_FRACTION_XPATH)
+        return convert_price(f"{whole}.{fraction}" if fraction else whole)
+    return convert_price(_text(tree, PRICE_OFFSCREEN_XPATH))
+
+
+def extract_seller(tree):
+    for xpath in SELLER_XPATHS:
+        seller = _text(tree, xpath)
+        if seller:
+            return seller
+    return None
+
+
+def analyze_product_page(page_html, url=None):
+    """Detect blocks and extract product fields from raw HTML in one pass"""
+    started = time.perf_counter()
+    reason = detect_block(page_html)
+    title = price = seller = None
+    out_of_stock = False
+    if not reason:
+        tree = parse_html(page_html)
+        title = _text(tree, TITLE_XPATH)
+        price = extract_price(tree)
+        seller = extract_seller(tree)
+        out_of_stock = not price and bool(OUT_OF_STOCK_RE.search(_text(tree, AVAILABILITY_XPATH) or ''))
+    return ProductPage(
+        url=url,
+        blocked=reason is not None,
+        block_reason=reason,
+        title=title,
+        price=price,
+        seller=seller,
+        weight=extract_weight(title),
+        pet=extract_pet(title),
+        parse_seconds=time.perf_counter() - started,
+        out_of_stock=out_of_stock
+    )
+
+
+def extract_search_links(page_html, base_url=None):
+    """Product links from a search results page, in page order"""
+    tree = parse_html(page_html)
+    for xpath in SEARCH_LINK_XPATHS:
+        hrefs = [href for href in tree.xpath(xpath) if extract_asin(href)]
+        if hrefs:
+            return [urljoin(base_url, href) if base_url else href for href in hrefs]
+    return []
+
+
+def parse_search_cards(page_html, base_url=None):
+    """Every result card on a search page, parsed in one pass"""
+    tree = parse_html(page_html)
+    cards = []
+    for node in tree.xpath(CARD_XPATH):
+        link = node.xpath(CARD_LINK_XPATH)
+        link = link[0] if link else None
+        if link and base_url:
+            link = urljoin(base_url, link)
+        rating = RATING_RE.search(_text(node, CARD_RATING_XPATH) or '')
+        asin = (node.get('data-asin') or '').upper() or extract_asin(link)
+        cards.append(SearchCard(
+            asin=asin if is_valid_asin(asin) else None,
+            url=link,
+            title=_text(node, CARD_TITLE_XPATH),
+            price=convert_price(_text(node, CARD_PRICE_XPATH)),
+            rating=float(rating.group(1)) if rating else None,
+            brand=_text(node, CARD_BRAND_XPATH)
+        ))
+    return cards
+
+
+if __name__ == "__main__":
+    import sys
+    # Analyze saved fixtures: python page_analyzer.py page1.html page2.html
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding='utf-8') as f:
+            result = analyze_product_page(f.read(), url=path)
+        print(result.as_dict())
@@ -0,0 +1,75 @@
+"""
+Drop search cards before their product pages are fetched
+"""
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CardFilter:
+    def __init__(self, allowed_sellers=None, min_price=None, max_price=None):
+        self.allowed_sellers = [s.lower() for s in allowed_sellers] if allowed_sellers else None
+        self.min_price = _to_float(min_price)
+        self.max_price = _to_float(max_price)
+        self.stats = {
+            'seen': 0,
+            'kept': 0,
+            'dropped_seller': 0,
+            'dropped_price': 0,
+        }
+
+    @property
+    def saved_fetches(self):
+        return self.stats['dropped_seller'] + self.stats['dropped_price']
+
+    def seller_allowed(self, *names):
+        """True if any name mentions an allowed seller; unknown names are let through"""
+        if not self.allowed_sellers:
+            return True
+        names = [n.lower() for n in names if n]
+        if not names:
+            return True
+        return any(allowed in name for name in names for allowed in self.allowed_sellers)
+
+    def price_allowed(self, price):
+        if price is None:
+            return True
+        if self.min_price is not None and price < self.min_price:
+            return False
+        if self.max_price is not None and price > self.max_price:
+            return False
+        return True
+
+    def check(self, card):
+        """Reason the card is dropped, or None to keep it"""
+        # Titles usually start with the brand, so they count when the byline is missing
+        if not self.seller_allowed(card.brand, card.title):
+            return 'seller'
+        if not self.price_allowed(card.price):
+            return 'price'
+        return None
+
+    def apply(self, cards):
+        kept = []
+        for card in cards:
+            self.stats['seen'] += 1
+            reason = self.check(card)
+            if reason:
+                self.stats[f'dropped_{reason}'] += 1
+            else:
+                self.stats['kept'] += 1
+                kept.append(card)
+        return kept
+
+    def allows_product(self, product):
+        """Post-fetch check for products whose seller was only known from the product page"""
+        return self.seller_allowed(product.get('seller'), product.get('product_name'))
+
+    def summary(self):
+        return (f"Prefilter kept {self.stats['kept']} of {self.stats['seen']} cards "
+                f"({self.stats['dropped_seller']} by seller, {self.stats['dropped_price']} by price), "
+                f"saving {self.saved_fetches} product fetches")
@@ -0,0 +1,121 @@
+"""
+Token-bucket rate limiter shared by every process on this machine
+
+Buckets live in a small SQLite file keyed by host, so Flask jobs, the
+scheduler, Selenium workers and Scrapy crawls all draw from one budget
+per site. acquire() reserves the next free slot in one short
+transaction and sleeps outside it, so waiters line up in order instead
+of polling, and adding workers never raises the aggregate request rate.
+"""
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from amazon_config import RATE_LIMIT_DB, RATE_LIMITS, RATE_LIMIT_DEFAULT, RATE_LIMIT_JITTER, RATE_LIMIT_TIMEOUT
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+def host_key(url_or_host):
+    """Bucket name for a URL or host: hostname without a leading www."""
+    host = urlparse(url_or_host).hostname if '://' in url_or_host else url_or_host
+    host = (host or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class RateLimiter:
+    def __init__(self, path=RATE_LIMIT_DB, limits=RATE_LIMITS, default=RATE_LIMIT_DEFAULT,
+                 jitter=RATE_LIMIT_JITTER):
+        self.path = path
+        self.limits = limits
+        self.default = default
+        self.jitter = jitter
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'timeouts': 0}
+
+    def _conn(self):
+        # sqlite3 connections stay on the thread that made them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                         'updated REAL NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def limit_for(self, host):
+        return self.limits.get(host, self.default)
+
+    def reserve(self, host, tokens=1, max_wait=None):
+        """Take tokens now and return how long to wait before using them
+
+        The bucket may go negative: that is the queue of callers already
+        holding a future slot. Returns None, taking nothing, if the wait
+        would exceed max_wait.
+        """
+        limit = self.limit_for(host)
+        if limit is None:
+            return 0.0
+        rate, burst = limit
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE host = ?', (host,)).fetchone()
+            available = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            available -= tokens
+            wait = 0.0 if available >= 0 else -available / rate
+            if max_wait is not None and wait > max_wait:
+                conn.execute('ROLLBACK')
+                return None
+            conn.execute('INSERT OR REPLACE INTO buckets (host, tokens, updated) VALUES (?, ?, ?)',
+                         (host, available, now))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire(self, url_or_host, timeout=RATE_LIMIT_TIMEOUT):
+        """Block until a request to this host fits the shared budget; returns seconds waited"""
+        wait = self.reservation(url_or_host, timeout)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def reservation(self, url_or_host, timeout=RATE_LIMIT_TIMEOUT):
+        """Reserve a slot without sleeping; returns the seconds to wait before sending
+
+        For callers that must not block a thread, e.g. the Scrapy reactor.
+        """
+        host = host_key(url_or_host)
+        wait = self.reserve(host, max_wait=timeout)
+        if wait is None:
+            with self._stats_lock:
+                self.stats['timeouts'] += 1
+            raise RateLimitTimeout(f"No request budget for {host} within {timeout}s")
+        if wait and self.jitter:
+            # Irregular spacing on top of the budget so requests don't tick like a clock
+            wait += random.uniform(0, self.jitter)
+        with self._stats_lock:
+            self.stats['acquired'] += 1
+            if wait:
+                self.stats['waited'] += 1
+                self.stats['wait_seconds'] += wait
+        return wait
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['wait_seconds_avg'] = stats['wait_seconds'] / stats['waited'] if stats['waited'] else 0.0
+        return stats
+
+
+# Global limiter used by AmazonAPI and the Scrapy middleware
+rate_limiter = RateLimiter()
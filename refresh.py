@@ -0,0 +1,209 @@
+"""
+Refresh prices for known ASINs without searching again
+
+A scheduled run over a watchlist only needs each product page, so this
+skips the keyword search entirely: one request per ASIN, fetched in
+parallel batches on pooled browsers (or one Scrapy crawl), with each
+batch written straight to the price history.
+
+    python refresh.py                        # every ASIN in the database, stalest first
+    python refresh.py --term "dog food"      # only ASINs found by that search
+    python refresh.py --file watchlist.txt   # ASINs or product URLs, one per line (or JSONL / a JSON array)
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from amazon_config import BASE_URL, REFRESH_BATCH_SIZE, REFRESH_WORKERS, REFRESH_ENGINE
+from amazon_urls import canonical_product_url, extract_asin, is_valid_asin
+from driver_pool import driver_pool, PoolTimeout
+from page_analyzer import analyze_product_page
+from rate_limit import rate_limiter
+from storage import db
+
+PRICE_SELECTOR = '.a-price, #priceblock_ourprice, #priceblock_dealprice, .price-large'
+
+
+def asin_from_value(value):
+    """ASIN from a bare ASIN, a product URL, or a dict with asin/product_url/url"""
+    if isinstance(value, dict):
+        return asin_from_value(value.get('asin') or value.get('product_url') or value.get('url'))
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if is_valid_asin(value.upper()):
+        return value.upper()
+    return extract_asin(value)
+
+
+def load_asins(path):
+    """Unique ASINs from a text, JSONL or JSON array file, first occurrence wins"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        values = json.loads(text)
+    else:
+        values = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            values.append(json.loads(line) if line.startswith('{') else line)
+    return list(dict.fromkeys(asin for asin in map(asin_from_value, values) if asin))
+
+
+def fetch_product(driver, asin, base_url=BASE_URL):
+    """(product, analysis) for one product page; product is None when blocked or incomplete"""
+    url = f'{canonical_product_url(base_url, asin)}?language=en_IN&_={int(time.time())}'
+    rate_limiter.acquire(url)
+    driver.get(url)
+    try:
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, PRICE_SELECTOR)))
+    except Exception as e:
+        print(f"{asin}: price did not load ({type(e).__name__})")
+    analysis = analyze_product_page(driver.page_source, url=url)
+    product = None if analysis.blocked else analysis.to_product()
+    if product:
+        product['asin'] = asin
+        product['product_url'] = canonical_product_url(base_url, asin)
+    return product, analysis
+
+
+class Refresher:
+    def __init__(self, batch_size=REFRESH_BATCH_SIZE, workers=REFRESH_WORKERS, base_url=BASE_URL, pool=None,
+                 database=db, progress=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.base_url = base_url
+        self.pool = pool or driver_pool
+        self.db = database
+        self.progress = progress
+        self.blocked = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {'asins': 0, 'fetched': 0, 'saved': 0, 'missing': 0, 'skipped': 0, 'batches': 0}
+
+    def report(self, message, **extra):
+        if self.progress:
+            self.progress(message, **extra)
+        else:
+            print(message)
+
+    def run(self, asins, term=None, engine=REFRESH_ENGINE):
+        """Fetch and store current prices for these ASINs; returns the products found"""
+        asins = list(dict.fromkeys(asins))
+        self.stats['asins'] = len(asins)
+        if not asins:
+            self.report("No ASINs to refresh")
+            return []
+        started = time.time()
+        if engine == 'scrapy':
+            products = self.run_scrapy(asins, term)
+        else:
+            products = self.run_selenium(asins, term)
+        elapsed = max(time.time() - started, 0.001)
+        note = " - stopped early, blocked" if self.blocked.is_set() else ""
+        self.report(f"Refreshed {len(products)} of {len(asins)} ASINs in {elapsed:.1f}s "
+                    f"({len(asins) / elapsed:.2f} pages/s){note}", **self.stats)
+        return products
+
+    def run_selenium(self, asins, term=None):
+        run_id = self.db.start_run(term, engine='selenium')
+        batches = [asins[i:i + self.batch_size] for i in range(0, len(asins), self.batch_size)]
+        products = []
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(batches)))) as executor:
+                for batch_products in executor.map(self.refresh_batch, batches, [run_id] * len(batches)):
+                    products.extend(batch_products)
+        finally:
+            # Batches save as they go, so close the run over whatever made it in
+            self.db.finish_run(run_id, len(products))
+        return products
+
+    def refresh_batch(self, asins, run_id):
+        """One browser lease, one page per ASIN, one write for the whole batch"""
+        if self.blocked.is_set():
+            self._count('skipped', len(asins))
+            return []
+        products = []
+        try:
+            lease = self.pool.acquire()
+        except PoolTimeout:
+            print(f"No browser free for a batch of {len(asins)} ASINs, skipping it")
+            self._count('skipped', len(asins))
+            return []
+        try:
+            for i, asin in enumerate(asins):
+                if self.blocked.is_set():
+                    self._count('skipped', len(asins) - i)
+                    break
+                try:
+                    product, analysis = fetch_product(lease.driver, asin, self.base_url)
+                except Exception as e:
+                    print(f"{asin}: {e}")
+                    product, analysis = None, None
+                lease.pages += 1
+                self._count('fetched')
+                if analysis is not None and analysis.blocked:
+                    print(f"Access blocked by Amazon: {analysis.block_reason}")
+                    self.blocked.set()
+                elif product:
+                    products.append(product)
+                else:
+                    self._count('missing')
+        finally:
+            self.pool.release(lease)
+        if products:
+            self.db.save_products(products, run_id)
+            self._count('saved', len(products))
+        self._count('batches')
+        self.report(f"Refreshed {self.stats['fetched']} of {self.stats['asins']} ASINs",
+                    done=self.stats['fetched'], total=self.stats['asins'])
+        return products
+
+    def run_scrapy(self, asins, term=None):
+        # The spider's pipeline saves the items as they arrive
+        from amazon_scraper.crawler_service import crawler_service
+        # Product URLs repeat on every refresh, and the project's HTTP cache never expires
+        items = crawler_service.crawl(search_term=term, asins=asins, settings={'HTTPCACHE_ENABLED': False}) or []
+        self.stats['fetched'] = self.stats['saved'] = len(items)
+        self.stats['missing'] = len(asins) - len(items)
+        return items
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+
+def refresh_known(term=None, limit=None, engine=REFRESH_ENGINE, progress=None):
+    """Refresh every ASIN already in the database (or found by `term`), stalest first"""
+    return Refresher(progress=progress).run(db.tracked_asins(term, limit), term, engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh prices of known ASINs without searching')
+    parser.add_argument('--file', help='ASINs or product URLs: text lines, JSONL or a JSON array')
+    parser.add_argument('--term', help='only ASINs found by this search term')
+    parser.add_argument('--limit', type=int, help='refresh at most this many ASINs')
+    parser.add_argument('--engine', choices=['selenium', 'scrapy'], default=REFRESH_ENGINE)
+    parser.add_argument('--batch-size', type=int, default=REFRESH_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=REFRESH_WORKERS)
+    args = parser.parse_args()
+
+    asins = load_asins(args.file) if args.file else db.tracked_asins(args.term, args.limit)
+    if args.file and args.limit:
+        asins = asins[:args.limit]
+    print(f"Refreshing {len(asins)} ASINs with {args.engine}...")
+    try:
+        Refresher(args.batch_size, args.workers).run(asins, args.term, args.engine)
+    finally:
+        driver_pool.close()
+
+
+if __name__ == "__main__":
+    main()
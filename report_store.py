@@ -0,0 +1,256 @@
+"""
+Append-only report history
+
+Each search term gets a directory of JSONL segments plus a small index of
+(timestamp, segment, offset, length) so the latest report or a date range
+can be read without parsing the whole history:
+
+    reports/<name>/segment-00001.jsonl
+    reports/<name>/index.jsonl
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+from amazon_config import REPORT_SEGMENT_BYTES, REPORT_ARCHIVE_BYTES, REPORT_COMPACT_SEGMENTS
+
+LEGACY_DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+SEGMENT_NAME = 'segment-{:05d}.jsonl'
+INDEX_NAME = 'index.jsonl'
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class ReportStore:
+    def __init__(self, directory, name, segment_bytes=REPORT_SEGMENT_BYTES, archive_bytes=REPORT_ARCHIVE_BYTES,
+                 compact_segments=REPORT_COMPACT_SEGMENTS, convert_legacy=True):
+        self.directory = directory
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self.index_path = os.path.join(self.path, INDEX_NAME)
+        # New reports go to small segments; compaction packs those into archive segments
+        self.segment_bytes = segment_bytes
+        self.archive_bytes = archive_bytes
+        self.compact_segments = compact_segments
+        with _locks_guard:
+            self._lock = _locks.setdefault(self.path, threading.Lock())
+        os.makedirs(self.path, exist_ok=True)
+        if convert_legacy:
+            self.import_legacy()
+
+    @contextmanager
+    def _locked(self):
+        """Serialize writers across threads and, where supported, processes"""
+        with self._lock:
+            with open(os.path.join(self.path, '.lock'), 'w') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _segment_path(self, number):
+        return os.path.join(self.path, SEGMENT_NAME.format(number))
+
+    def _segment_sizes(self):
+        sizes = {}
+        for file_name in os.listdir(self.path):
+            if file_name.startswith('segment-') and file_name.endswith('.jsonl'):
+                sizes[int(file_name[8:-6])] = os.path.getsize(os.path.join(self.path, file_name))
+        return sizes
+
+    def _segment_size(self, segment):
+        path = self._segment_path(segment)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _parse_entry(self, line, sizes):
+        """Index entry from one line, or None for a torn line or one pointing past its segment's data"""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        segment = entry['segment']
+        if segment not in sizes:
+            sizes[segment] = self._segment_size(segment)
+        return entry if entry['offset'] + entry['length'] <= sizes[segment] else None
+
+    def entries(self):
+        """Index entries in append order, skipping a torn last line or data lost in a crash"""
+        entries = []
+        sizes = {}
+        if not os.path.exists(self.index_path):
+            return entries
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = self._parse_entry(line, sizes)
+                if entry:
+                    entries.append(entry)
+        return entries
+
+    def last_entry(self, chunk=4096):
+        """Newest valid index entry, read backwards from the end so the cost does not grow with history"""
+        if not os.path.exists(self.index_path):
+            return None
+        sizes = {}
+        with open(self.index_path, 'rb') as f:
+            pos = f.seek(0, os.SEEK_END)
+            tail = b''
+            while pos > 0:
+                step = min(chunk, pos)
+                pos -= step
+                f.seek(pos)
+                lines = (f.read(step) + tail).split(b'\n')
+                # The first piece may be the end of a line that starts in the previous chunk
+                tail = lines.pop(0) if pos else b''
+                for line in reversed(lines):
+                    entry = self._parse_entry(line, sizes) if line.strip() else None
+                    if entry:
+                        return entry
+        return None
+
+    def _read(self, entry):
+        with open(self._segment_path(entry['segment']), 'rb') as f:
+            f.seek(entry['offset'])
+            return json.loads(f.read(entry['length']))
+
+    def append(self, report, ts=None):
+        line = (json.dumps(report, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._locked():
+            last = self.last_entry()
+            segment = last['segment'] if last else 1
+            size = self._segment_size(segment)
+            rolled = size and size + len(line) > self.segment_bytes
+            if rolled:
+                segment = max(self._segment_sizes(), default=segment) + 1
+            # Data first, then the index entry pointing at it
+            with open(self._segment_path(segment), 'ab') as f:
+                offset = f.tell()
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            entry = {'ts': ts or time.time(), 'segment': segment, 'offset': offset, 'length': len(line)}
+            with open(self.index_path, 'ab') as f:
+                # Start on a fresh line if a crash left a torn entry behind
+                prefix = b'\n' if f.tell() and not self._index_ends_with_newline() else b''
+                f.write(prefix + (json.dumps(entry) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            # Small segments only accumulate when one fills up, so that is the only time to check
+            if rolled:
+                self._compact(self.entries())
+        return entry
+
+    def _index_ends_with_newline(self):
+        with open(self.index_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def latest(self):
+        entry = self.last_entry()
+        return self._read(entry) if entry else None
+
+    def between(self, start=None, end=None):
+        """Reports appended between two datetimes or epoch timestamps"""
+        entries = self.entries()
+        keys = [e['ts'] for e in entries]
+        lo = bisect.bisect_left(keys, _to_ts(start)) if start is not None else 0
+        hi = bisect.bisect_right(keys, _to_ts(end)) if end is not None else len(entries)
+        for entry in entries[lo:hi]:
+            yield self._read(entry)
+
+    def __iter__(self):
+        return self.between()
+
+    def __len__(self):
+        return len(self.entries())
+
+    def compact(self):
+        with self._locked():
+            self._compact(self.entries(), force=True)
+
+    def _compact(self, entries, force=False):
+        """Pack small segments into archive segments once there are too many of them"""
+        sizes = self._segment_sizes()
+        small = {seg for seg, size in sizes.items() if size < self.archive_bytes}
+        if not force and len(small) <= self.compact_segments:
+            return
+        print(f"Compacting report history for {self.name}...")
+        next_segment = max(sizes, default=0) + 1
+        new_entries = []
+        out = None
+        try:
+            for entry in entries:
+                if entry['segment'] not in small:
+                    new_entries.append(entry)
+                    continue
+                with open(self._segment_path(entry['segment']), 'rb') as f:
+                    f.seek(entry['offset'])
+                    data = f.read(entry['length'])
+                if out is None or out.tell() + len(data) > self.archive_bytes:
+                    if out:
+                        out.flush()
+                        os.fsync(out.fileno())
+                        out.close()
+                    segment = next_segment
+                    next_segment += 1
+                    out = open(self._segment_path(segment), 'wb')
+                new_entries.append({'ts': entry['ts'], 'segment': segment, 'offset': out.tell(), 'length': len(data)})
+                out.write(data)
+            if out:
+                out.flush()
+                os.fsync(out.fileno())
+        finally:
+            if out:
+                out.close()
+        # Swap the index atomically before removing anything it no longer points at;
+        # bytes orphaned by a crash are dropped along with the old segments
+        tmp_index = self.index_path + '.tmp'
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            for entry in new_entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index, self.index_path)
+        for seg in small:
+            os.remove(self._segment_path(seg))
+
+    def import_legacy(self):
+        """Convert reports/<name>.json (either format) into segments once"""
+        legacy_path = os.path.join(self.directory, f'{self.name}.json')
+        if not os.path.exists(legacy_path):
+            return
+        with open(legacy_path, 'r') as f:
+            temp = json.load(f)
+        # Old format had a single report at the top level
+        reports = temp['reports'] if 'reports' in temp else [temp]
+        print(f"Converting {len(reports)} reports from {legacy_path}...")
+        for report in reports:
+            self.append(report, ts=_to_ts(report.get('date')) or time.time())
+        os.replace(legacy_path, legacy_path + '.migrated')
+
+
+def is_store(path):
+    return os.path.exists(os.path.join(path, INDEX_NAME))
+
+
+def _to_ts(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.strptime(value, LEGACY_DATE_FORMAT).timestamp()
+    except ValueError:
+        return None
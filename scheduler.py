@@ -1,22 +1,244 @@
-import schedule
+"""
+Adaptive refresh scheduler
+
+Keeps every tracked ASIN and each SCHEDULE_TERMS search in one priority
+queue ordered by next-due time. A product's interval shrinks with its
+price volatility (std dev / mean from product_stats) and again as its
+price nears an alert threshold, within SCHEDULE_MIN/MAX_INTERVAL, so
+fetches go where prices actually move. Searches only rediscover products
+and run every SCHEDULE_TERM_INTERVAL. Work is spent against a global
+SCHEDULE_HOURLY_BUDGET of page requests.
+
+    python scheduler.py            # run forever
+    python scheduler.py --once     # do whatever is due now, then exit
+    python scheduler.py --plan 20  # show the next 20 items and why
+"""
+import argparse
+import heapq
 import time
+from collections import deque
+from datetime import datetime
+
 from tracker import AmazonAPI, GenerateReport
-from amazon_config import FILTERS, BASE_URL, CURRENCY, NAME
+from refresh import Refresher
+from storage import db
+from work_queue import work_queue
+from amazon_config import (FILTERS, BASE_URL, CURRENCY, ALLOWED_SELLERS, FILTER_BY_SELLER, SEARCH_PAGES,
+                           MAX_PRODUCT_PAGES, REFRESH_ENGINE, ALERT_DROP_WINDOW_DAYS, SCHEDULE_TERMS,
+                           SCHEDULE_TERM_INTERVAL, SCHEDULE_BASE_INTERVAL, SCHEDULE_MIN_INTERVAL,
+                           SCHEDULE_MAX_INTERVAL, SCHEDULE_CV_REF, SCHEDULE_ALERT_NEAR, SCHEDULE_ALERT_MIN_FACTOR,
+                           SCHEDULE_HOURLY_BUDGET, SCHEDULE_BATCH, SCHEDULE_REPLAN, WORK_QUEUE_ENABLED)
+
+# Page requests one search costs: result pages plus the product pages it visits
+SEARCH_COST = SEARCH_PAGES + MAX_PRODUCT_PAGES
+
+
+def refresh_interval(stats, rules=()):
+    """(seconds until the next refresh, reason) for one product's schedule_stats row and its alert rules"""
+    interval = SCHEDULE_BASE_INTERVAL
+    reason = 'no price history'
+    if stats['price_n'] >= 2 and stats['avg_price']:
+        cv = stats['stddev_price'] / stats['avg_price']
+        interval /= 1 + cv / SCHEDULE_CV_REF
+        reason = f'cv {cv:.3f}'
+    factor = 1.0
+    price = stats['last_price']
+    for rule in rules:
+        if rule['kind'] == 'in_stock':
+            rule_factor = SCHEDULE_ALERT_MIN_FACTOR
+        elif price is None:
+            continue
+        else:
+            if rule['kind'] == 'below':
+                target = rule['threshold']
+            elif stats['window_low'] is not None:
+                target = stats['window_low'] * (1 - rule['threshold'] / 100)
+            else:
+                continue
+            # Share of the current price still to fall before the rule fires
+            distance = max(price - target, 0) / price
+            rule_factor = min(max(distance / SCHEDULE_ALERT_NEAR, SCHEDULE_ALERT_MIN_FACTOR), 1.0)
+        if rule_factor < factor:
+            factor = rule_factor
+            reason += f", {rule['kind']} rule {rule['id']} near"
+    interval = min(max(interval * factor, SCHEDULE_MIN_INTERVAL), SCHEDULE_MAX_INTERVAL)
+    return interval, reason
+
+
+class AdaptiveScheduler:
+    def __init__(self, database=db, terms=SCHEDULE_TERMS, hourly_budget=SCHEDULE_HOURLY_BUDGET,
+                 batch_size=SCHEDULE_BATCH, engine=REFRESH_ENGINE):
+        self.db = database
+        self.terms = list(terms)
+        self.hourly_budget = hourly_budget
+        self.batch_size = batch_size
+        self.engine = engine
+        self._heap = []  # (due, key); superseded entries are skipped when popped
+        self._due = {}  # key -> (due, interval, reason)
+        self._attempted = {}  # key -> last time we fetched it, whether or not a price came back
+        self._spent = deque()  # (ts, requests) within the last hour
+        self.planned_at = 0
+        self.stats = {'refreshed': 0, 'searches': 0, 'requests': 0, 'cycles': 0}
+
+    def plan(self, asins=None, now=None):
+        """Recompute next-due times from the database, for all items or just these ASINs"""
+        now = now or time.time()
+        rules_by_asin = {}
+        for rule in self.db.load_alert_rules():
+            targets = [rule['asin']] if rule['asin'] else self.db.tracked_asins(rule['term'])
+            for asin in targets:
+                rules_by_asin.setdefault(asin, []).append(rule)
+        for stats in self.db.schedule_stats(now - ALERT_DROP_WINDOW_DAYS * 86400, asins):
+            key = ('asin', stats['asin'])
+            interval, reason = refresh_interval(stats, rules_by_asin.get(stats['asin'], ()))
+            last = max(stats['last_ts'] or 0, self._attempted.get(key, 0))
+            self._push(key, last + interval, interval, reason)
+        if asins is None:
+            last_runs = self.db.last_search_times(self.terms)
+            for term in self.terms:
+                key = ('term', term)
+                last = max(last_runs.get(term) or 0, self._attempted.get(key, 0))
+                self._push(key, last + SCHEDULE_TERM_INTERVAL, SCHEDULE_TERM_INTERVAL, 'discovery search')
+            self.planned_at = now
+
+    def _push(self, key, due, interval, reason):
+        self._due[key] = (due, interval, reason)
+        heapq.heappush(self._heap, (due, key))
+
+    def _peek(self):
+        while self._heap:
+            due, key = self._heap[0]
+            if key in self._due and self._due[key][0] == due:
+                return due, key
+            heapq.heappop(self._heap)
+        return None
+
+    def budget_left(self, now=None):
+        now = now or time.time()
+        while self._spent and self._spent[0][0] <= now - 3600:
+            self._spent.popleft()
+        return self.hourly_budget - sum(n for _, n in self._spent)
+
+    def spend(self, requests, now=None):
+        self._spent.append((now or time.time(), requests))
+        self.stats['requests'] += requests
+
+    def take_due(self, now=None):
+        """Pop due items, most overdue first, that fit the hourly budget: ([asins], [terms])"""
+        now = now or time.time()
+        budget = self.budget_left(now)
+        asins, terms, skipped = [], [], []
+        while len(asins) < self.batch_size and budget >= 1:
+            top = self._peek()
+            if top is None or top[0] > now:
+                break
+            heapq.heappop(self._heap)
+            key = top[1]
+            cost = SEARCH_COST if key[0] == 'term' else 1
+            if cost > budget:
+                # Still due; an expensive search must not hold back cheaper refreshes behind it
+                skipped.append(top)
+                continue
+            del self._due[key]
+            budget -= cost
+            (terms if key[0] == 'term' else asins).append(key[1])
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        return asins, terms
+
+    def next_wake(self, now=None):
+        """Seconds to sleep before something is due and affordable (capped by the re-plan period)"""
+        now = now or time.time()
+        wait = SCHEDULE_REPLAN - (now - self.planned_at)
+        top = self._peek()
+        if top is not None:
+            wait = min(wait, top[0] - now)
+        if self._spent and self.budget_left(now) < 1:
+            wait = max(wait, self._spent[0][0] + 3600 - now)
+        return max(wait, 1)
+
+    def run_once(self, now=None):
+        """Plan if stale, then fetch whatever is due; returns the number of requests spent"""
+        now = now or time.time()
+        if now - self.planned_at >= SCHEDULE_REPLAN:
+            self.plan(now=now)
+        asins, terms = self.take_due(now)
+        if not (asins or terms):
+            return 0
+        self.stats['cycles'] += 1
+        for term in terms:
+            self.search(term)
+        if asins:
+            self.refresh(asins)
+        return len(asins) + len(terms) * SEARCH_COST
+
+    def refresh(self, asins):
+        self.spend(len(asins))
+        if WORK_QUEUE_ENABLED:
+            item_id = work_queue.enqueue('asins', {'asins': asins, 'engine': self.engine})
+            print(f"Queued {len(asins)} due products as work item {item_id}")
+        else:
+            print(f"Refreshing {len(asins)} due products...")
+            products = Refresher(database=self.db).run(asins, engine=self.engine)
+            self.stats['refreshed'] += len(products)
+        now = time.time()
+        for asin in asins:
+            self._attempted[('asin', asin)] = now
+        # Their stats just changed, so their next slot does too
+        self.plan(asins, now)
+
+    def search(self, term):
+        self.spend(SEARCH_COST)
+        self._attempted[('term', term)] = time.time()
+        if WORK_QUEUE_ENABLED:
+            # The worker saves the run; its products join the queue at the next re-plan
+            item_id = work_queue.enqueue('term', {'name': term, 'min': FILTERS['min'], 'max': FILTERS['max']})
+            print(f"Queued search '{term}' as work item {item_id}")
+            return
+        print(f"Searching '{term}' for new products...")
+        amazon = AmazonAPI(term, FILTERS, BASE_URL, CURRENCY, allowed_sellers=ALLOWED_SELLERS if FILTER_BY_SELLER else None,
+                           checkpoint=True, database=self.db)
+        # Saved product by product as a run of its own; an interrupted search resumes next time
+        data = amazon.run()
+        GenerateReport(term, FILTERS, BASE_URL, CURRENCY, data)
+        self.stats['searches'] += 1
+        # New ASINs from the search join the queue
+        self.plan()
+
+    def upcoming(self, limit=20):
+        """Next items by due time: (due, key, interval, reason)"""
+        items = sorted((due, key, interval, reason) for key, (due, interval, reason) in self._due.items())
+        return items[:limit]
+
+    def run_forever(self):
+        print(f"Adaptive scheduler: {len(self.terms)} search terms, budget {self.hourly_budget} requests/hour")
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Scheduled run failed: {e}")
+            time.sleep(self.next_wake())
+
 
-def job():
-    print("Running weekly tracker...")
-    amazon = AmazonAPI(NAME, FILTERS, BASE_URL, CURRENCY)
-    data = amazon.run()
-    GenerateReport(NAME, FILTERS, BASE_URL, CURRENCY, data)
-    print("Tracker completed.")
+def main():
+    parser = argparse.ArgumentParser(description='Refresh tracked products more often where prices move')
+    parser.add_argument('--once', action='store_true', help='run whatever is due now and exit')
+    parser.add_argument('--plan', type=int, nargs='?', const=20, help='print the next N scheduled items and exit')
+    args = parser.parse_args()
 
-# Schedule to run every week
-schedule.every().week.do(job)
+    scheduler = AdaptiveScheduler()
+    if args.plan:
+        scheduler.plan()
+        now = time.time()
+        for due, (kind, name), interval, reason in scheduler.upcoming(args.plan):
+            when = 'now' if due <= now else datetime.fromtimestamp(due).strftime('%d/%m/%Y %H:%M')
+            print(f"{when:>16}  {kind:<5} {name:<24} every {interval / 3600:6.1f}h  ({reason})")
+    elif args.once:
+        spent = scheduler.run_once()
+        print(f"Spent {spent} requests; {scheduler.budget_left()} left this hour")
+    else:
+        scheduler.run_forever()
 
-# Run immediately for testing
-job()
 
-# Keep running
-while True:
-    schedule.run_pending()
-    time.sleep(60)  # Check every minute
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Scrape one search term, the same way for a /run job and a queue worker
+
+The Flask app calls scrape_term() in-process; work_queue.py calls it
+for queued 'term' items without importing the app.
+"""
+import json
+import os
+import threading
+import time
+
+import amazon_config
+from tracker import AmazonAPI
+from storage import db
+from engine_selector import engine_selector, EngineCancelled
+
+
+def save_products(products, term=None, filters=None, engine=None):
+    """Record one search run and its price observations in a single batch"""
+    return db.save_run(products, term, filters, engine)
+
+def scrape_with_selenium(name, min_price, max_price, progress=None, search_only=False, allowed_sellers=None,
+                         cancel=None):
+    """Try scraping with Selenium first; a run cancelled because another engine won leaves nothing saved"""
+    amazon = AmazonAPI(name, {'min': min_price, 'max': max_price}, amazon_config.BASE_URL, amazon_config.CURRENCY,
+                       progress=progress, search_only=search_only, allowed_sellers=allowed_sellers)
+    started = int(time.time())
+    data = amazon.run()
+    if cancel is not None and cancel.is_set() and amazon.run_id:
+        # The winner saved its own run; checkpointed products from this one would double every observation
+        dropped = db.discard_run(amazon.run_id, started)
+        print(f"Discarded {dropped} observations from losing Selenium run {amazon.run_id}")
+        return None
+    return data
+
+def scrape_with_scrapy(name, min_price, max_price, search_only=False, allowed_sellers=None):
+    """Fall back to Scrapy if Selenium fails"""
+    from amazon_scraper.run_spider import run_spider
+    try:
+        # Items come straight back from the shared crawler service
+        return run_spider(
+            search_term=name,
+            min_price=min_price,
+            max_price=max_price,
+            max_pages=5,
+            search_only=search_only,
+            allowed_sellers=allowed_sellers
+        )
+    except Exception as e:
+        print(f"Scrapy scraping failed: {e}")
+        return None
+
+def write_latest_data(data):
+    # Write to a temp file and swap it in so concurrent jobs never leave a torn file
+    tmp_path = f'latest_data.json.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, 'latest_data.json')
+
+def scrape_term(job):
+    """Scrape one search term using only the job's own config"""
+    name = job.config['name']
+    min_price = job.config['min']
+    max_price = job.config['max']
+    search_only = job.config.get('search_only', False)
+    allowed_sellers = job.config.get('allowed_sellers')
+
+    def selenium(cancel):
+        def progress(message, **extra):
+            if cancel.is_set():
+                raise EngineCancelled()
+            job.report(message, **extra)
+        return scrape_with_selenium(name, min_price, max_price, progress=progress, search_only=search_only,
+                                    allowed_sellers=allowed_sellers, cancel=cancel)
+
+    def scrapy(cancel):
+        return scrape_with_scrapy(name, min_price, max_price, search_only=search_only, allowed_sellers=allowed_sellers)
+
+    # Fastest expected engine first, the other as fallback or hedge
+    engine, data = engine_selector.run({'selenium': selenium, 'scrapy': scrapy}, report=job.report)
+    if engine:
+        job.report(f"Successfully scraped with {engine.capitalize()}", stage=engine)
+
+    if data is None:
+        data = []
+        job.report("All scraping attempts failed.", stage='save')
+    job.report(f"Data fetch complete. Scraped {len(data)} products", stage='save')
+    # Always save to JSON file for display
+    write_latest_data(data)
+    if data and (engine == 'scrapy' or amazon_config.CHECKPOINT_ENABLED):
+        # The Scrapy pipeline and the checkpointing tracker both save products as they arrive
+        job.report("Data saved to SQLite database and JSON file", stage='save')
+    elif data:
+        save_products(data, name, {'min': min_price, 'max': max_price}, engine)
+        job.report("Data saved to SQLite database and JSON file", stage='save')
+    else:
+        job.report("No products found to save", stage='save')
+    return data
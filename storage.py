@@ -0,0 +1,1198 @@
+"""
+SQLite storage for tracked products and their price history
+
+Schema versions are tracked with PRAGMA user_version. Run
+`python storage.py migrate` to upgrade an existing database in place.
+"""
+import argparse
+import hashlib
+import html
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from amazon_config import DB_PATH, DB_READ_POOL_SIZE
+from amazon_urls import is_valid_asin
+from page_analyzer import convert_price
+
+LEGACY_DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+SCHEMA_V1 = """
+CREATE TABLE IF NOT EXISTS products (
+    asin TEXT PRIMARY KEY,
+    product_name TEXT,
+    type_of_product TEXT,
+    weight TEXT,
+    pet TEXT,
+    seller TEXT,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS search_runs (
+    id INTEGER PRIMARY KEY,
+    term TEXT,
+    min_price REAL,
+    max_price REAL,
+    engine TEXT,
+    started_at INTEGER NOT NULL,
+    finished_at INTEGER,
+    product_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS price_observations (
+    id INTEGER PRIMARY KEY,
+    asin TEXT NOT NULL REFERENCES products(asin),
+    run_id INTEGER REFERENCES search_runs(id),
+    price REAL,
+    ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_observations_asin_ts ON price_observations(asin, ts);
+CREATE INDEX IF NOT EXISTS idx_observations_run ON price_observations(run_id);
+CREATE INDEX IF NOT EXISTS idx_runs_term ON search_runs(term, started_at);
+"""
+
+UPSERT_PRODUCT_SQL = """
+    INSERT INTO products (asin, product_name, type_of_product, weight, pet, seller, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(asin) DO UPDATE SET
+        product_name = excluded.product_name,
+        type_of_product = excluded.type_of_product,
+        weight = excluded.weight,
+        pet = excluded.pet,
+        seller = excluded.seller,
+        last_seen = MAX(last_seen, excluded.last_seen)
+"""
+INSERT_OBSERVATION_SQL = 'INSERT INTO price_observations (asin, run_id, price, ts) VALUES (?, ?, ?, ?)'
+
+
+def _product_row(product, ts):
+    return (product_key(product), product.get('product_name'), product.get('type_of_product', 'Generic'),
+            product.get('weight', 'N/A'), product.get('pet', 'N/A'), product.get('seller'), ts, ts)
+
+
+def connect(path=DB_PATH):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
+
+
+def product_key(product):
+    """ASIN when known, otherwise a stable key derived from the product name"""
+    asin = product.get('asin')
+    if is_valid_asin(asin):
+        return asin
+    name = (product.get('product_name') or '').strip().lower()
+    return '~' + hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]
+
+
+def normalize_term(term):
+    """Search terms match case-insensitively, with '_' (as /run saves them) read as a space"""
+    return term.replace('_', ' ').strip().lower() if term else term
+
+
+# normalize_term() in SQL, for matching stored search_runs.term values (aliased r)
+NORMALIZED_TERM_SQL = "lower(trim(replace(r.term, '_', ' ')))"
+
+
+def to_price(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return convert_price(str(value))
+
+
+def parse_legacy_date(value):
+    try:
+        return int(datetime.strptime(value, LEGACY_DATE_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def run_script(conn, script):
+    """Execute a multi-statement script inside the caller's transaction
+
+    executescript() commits first, which would make a migration
+    half-applied if a later step fails.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+
+def migrate_to_v1(conn):
+    """Move the flat products table aside and convert its rows into the normalized schema"""
+    columns = _table_columns(conn, 'products')
+    if columns and 'asin' not in columns:
+        conn.execute('ALTER TABLE products RENAME TO legacy_products')
+    run_script(conn, SCHEMA_V1)
+    # Also picks up a conversion that an older, non-atomic migration left unfinished
+    converted = conn.execute("SELECT 1 FROM search_runs WHERE engine = 'legacy' LIMIT 1").fetchone()
+    if _table_columns(conn, 'legacy_products') and not converted:
+        convert_legacy_rows(conn)
+
+
+def convert_legacy_rows(conn):
+    rows = conn.execute(
+        'SELECT product_name, type_of_product, weight, current_price, pet, seller, date '
+        'FROM legacy_products ORDER BY id'
+    ).fetchall()
+    runs = {}
+    for row in rows:
+        date = row[6]
+        if date not in runs:
+            ts = parse_legacy_date(date) or int(time.time())
+            cur = conn.execute(
+                "INSERT INTO search_runs (engine, started_at, finished_at) VALUES ('legacy', ?, ?)",
+                (ts, ts)
+            )
+            runs[date] = (cur.lastrowid, ts)
+    products = []
+    for row in rows:
+        run_id, ts = runs[row[6]]
+        products.append(({
+            'product_name': row[0],
+            'type_of_product': row[1],
+            'weight': row[2],
+            'current_price': row[3],
+            'pet': row[4],
+            'seller': row[5],
+        }, run_id, ts))
+    conn.executemany(UPSERT_PRODUCT_SQL, [_product_row(p, ts) for p, run_id, ts in products])
+    conn.executemany(
+        INSERT_OBSERVATION_SQL,
+        [(product_key(p), run_id, to_price(p['current_price']), ts) for p, run_id, ts in products]
+    )
+    conn.execute(
+        'UPDATE search_runs SET product_count = '
+        '(SELECT COUNT(*) FROM price_observations o WHERE o.run_id = search_runs.id) '
+        "WHERE engine = 'legacy'"
+    )
+    print(f"Converted {len(rows)} legacy rows into {len(runs)} runs")
+
+
+def migrate_to_v2(conn):
+    """Indexes behind the filtered, keyset-paginated product browser"""
+    run_script(conn, """
+        CREATE INDEX IF NOT EXISTS idx_observations_price ON price_observations(price);
+        CREATE INDEX IF NOT EXISTS idx_observations_ts ON price_observations(ts);
+        CREATE INDEX IF NOT EXISTS idx_products_seller ON products(seller);
+        CREATE INDEX IF NOT EXISTS idx_products_pet ON products(pet);
+    """)
+
+
+SCHEMA_V3 = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    product_name, seller,
+    content='products', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, product_name, seller) VALUES (new.rowid, new.product_name, new.seller);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, product_name, seller)
+    VALUES ('delete', old.rowid, old.product_name, old.seller);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF product_name, seller ON products
+WHEN old.product_name IS NOT new.product_name OR old.seller IS NOT new.seller BEGIN
+    INSERT INTO products_fts (products_fts, rowid, product_name, seller)
+    VALUES ('delete', old.rowid, old.product_name, old.seller);
+    INSERT INTO products_fts (rowid, product_name, seller) VALUES (new.rowid, new.product_name, new.seller);
+END;
+"""
+
+
+def migrate_to_v3(conn):
+    """Full-text index over product titles and sellers, kept in sync by triggers
+
+    The index points at products by rowid, which VACUUM may renumber;
+    run `python storage.py reindex` after vacuuming.
+    """
+    run_script(conn, SCHEMA_V3)
+    reindex(conn)
+
+
+def reindex(conn):
+    """Rebuild the full-text index from the products table"""
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+
+
+SCHEMA_V4 = """
+CREATE TABLE IF NOT EXISTS product_stats (
+    asin TEXT PRIMARY KEY,
+    n INTEGER NOT NULL DEFAULT 0,
+    price_n INTEGER NOT NULL DEFAULT 0,
+    min_price REAL,
+    max_price REAL,
+    sum_price REAL NOT NULL DEFAULT 0,
+    sum_sq_price REAL NOT NULL DEFAULT 0,
+    first_ts INTEGER,
+    last_price REAL,
+    last_ts INTEGER
+);
+CREATE TABLE IF NOT EXISTS term_best (
+    term TEXT PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    asin TEXT NOT NULL,
+    price REAL NOT NULL,
+    ts INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_ohlc (
+    asin TEXT NOT NULL,
+    day TEXT NOT NULL,
+    open REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    close REAL NOT NULL,
+    open_ts INTEGER NOT NULL,
+    close_ts INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (asin, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS table_counts (
+    name TEXT PRIMARY KEY,
+    n INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS observations_stats AFTER INSERT ON price_observations BEGIN
+    INSERT INTO product_stats (asin, n, price_n, min_price, max_price, sum_price, sum_sq_price, first_ts, last_price, last_ts)
+    VALUES (new.asin, 1, new.price IS NOT NULL, new.price, new.price, IFNULL(new.price, 0), IFNULL(new.price * new.price, 0),
+            new.ts, new.price, new.ts)
+    ON CONFLICT(asin) DO UPDATE SET
+        n = n + 1,
+        price_n = price_n + (excluded.last_price IS NOT NULL),
+        min_price = IFNULL(MIN(min_price, excluded.min_price), IFNULL(min_price, excluded.min_price)),
+        max_price = IFNULL(MAX(max_price, excluded.max_price), IFNULL(max_price, excluded.max_price)),
+        sum_price = sum_price + excluded.sum_price,
+        sum_sq_price = sum_sq_price + excluded.sum_sq_price,
+        first_ts = MIN(first_ts, excluded.first_ts),
+        last_price = CASE WHEN excluded.last_ts >= last_ts AND excluded.last_price IS NOT NULL
+                          THEN excluded.last_price ELSE last_price END,
+        last_ts = MAX(last_ts, excluded.last_ts);
+
+    INSERT INTO daily_ohlc (asin, day, open, high, low, close, open_ts, close_ts, n)
+    SELECT new.asin, date(new.ts, 'unixepoch'), new.price, new.price, new.price, new.price, new.ts, new.ts, 1
+    WHERE new.price IS NOT NULL
+    ON CONFLICT(asin, day) DO UPDATE SET
+        open = CASE WHEN excluded.open_ts < open_ts THEN excluded.open ELSE open END,
+        open_ts = MIN(open_ts, excluded.open_ts),
+        high = MAX(high, excluded.high),
+        low = MIN(low, excluded.low),
+        close = CASE WHEN excluded.close_ts >= close_ts THEN excluded.close ELSE close END,
+        close_ts = MAX(close_ts, excluded.close_ts),
+        n = n + 1;
+
+    -- Cheapest item of the newest run for each term
+    INSERT INTO term_best (term, run_id, asin, price, ts)
+    SELECT r.term, new.run_id, new.asin, new.price, new.ts FROM search_runs r
+    WHERE r.id = new.run_id AND r.term IS NOT NULL AND new.price IS NOT NULL
+    ON CONFLICT(term) DO UPDATE SET
+        run_id = excluded.run_id, asin = excluded.asin, price = excluded.price, ts = excluded.ts
+    WHERE excluded.run_id > term_best.run_id
+       OR (excluded.run_id = term_best.run_id AND excluded.price < term_best.price);
+
+    UPDATE table_counts SET n = n + 1 WHERE name = 'price_observations';
+END;
+CREATE TRIGGER IF NOT EXISTS observations_count_delete AFTER DELETE ON price_observations BEGIN
+    UPDATE table_counts SET n = n - 1 WHERE name = 'price_observations';
+END;
+CREATE TRIGGER IF NOT EXISTS products_count_insert AFTER INSERT ON products BEGIN
+    UPDATE table_counts SET n = n + 1 WHERE name = 'products';
+END;
+CREATE TRIGGER IF NOT EXISTS products_count_delete AFTER DELETE ON products BEGIN
+    UPDATE table_counts SET n = n - 1 WHERE name = 'products';
+END;
+CREATE TRIGGER IF NOT EXISTS runs_count_insert AFTER INSERT ON search_runs BEGIN
+    UPDATE table_counts SET n = n + 1 WHERE name = 'search_runs';
+END;
+CREATE TRIGGER IF NOT EXISTS runs_count_delete AFTER DELETE ON search_runs BEGIN
+    UPDATE table_counts SET n = n - 1 WHERE name = 'search_runs';
+END;
+"""
+COUNTED_TABLES = ['products', 'search_runs', 'price_observations']
+
+
+def migrate_to_v4(conn):
+    """Aggregate tables maintained by triggers on every insert, so reads never rescan history"""
+    run_script(conn, SCHEMA_V4)
+    rebuild_aggregates(conn)
+
+
+def rebuild_aggregates(conn, asins=None, terms=None):
+    """Recompute the aggregate tables from the raw rows; only for `asins` and `terms` if given"""
+    if asins is None:
+        run_script(conn, """
+            DELETE FROM product_stats;
+            DELETE FROM daily_ohlc;
+            DELETE FROM term_best;
+        """)
+        conn.execute(f"DELETE FROM table_counts WHERE name IN ({', '.join('?' * len(COUNTED_TABLES))})",
+                     COUNTED_TABLES)
+        asin_filter, term_filter, asin_args, term_args = '', '', [], []
+    else:
+        asins, terms = list(asins), list(terms or [])
+        asin_filter = f"AND asin IN ({', '.join('?' * len(asins))})"
+        term_filter = f"AND r.term IN ({', '.join('?' * len(terms))})"
+        asin_args, term_args = asins, terms
+        conn.execute(f'DELETE FROM product_stats WHERE true {asin_filter}', asin_args)
+        conn.execute(f'DELETE FROM daily_ohlc WHERE true {asin_filter}', asin_args)
+        conn.execute(f"DELETE FROM term_best WHERE term IN ({', '.join('?' * len(terms))})", term_args)
+    conn.execute(f"""
+        INSERT INTO product_stats (asin, n, price_n, min_price, max_price, sum_price, sum_sq_price, first_ts, last_price, last_ts)
+        SELECT asin, COUNT(*), COUNT(price), MIN(price), MAX(price), IFNULL(SUM(price), 0), IFNULL(SUM(price * price), 0),
+               MIN(ts),
+               (SELECT l.price FROM price_observations l WHERE l.asin = o.asin AND l.price IS NOT NULL
+                ORDER BY l.ts DESC, l.id DESC LIMIT 1),
+               MAX(ts)
+        FROM price_observations o WHERE true {asin_filter} GROUP BY asin
+    """, asin_args)
+    conn.execute(f"""
+        INSERT INTO daily_ohlc (asin, day, open, high, low, close, open_ts, close_ts, n)
+        SELECT asin, day,
+               FIRST_VALUE(price) OVER (PARTITION BY asin, day ORDER BY ts, id),
+               MAX(price) OVER (PARTITION BY asin, day),
+               MIN(price) OVER (PARTITION BY asin, day),
+               FIRST_VALUE(price) OVER (PARTITION BY asin, day ORDER BY ts DESC, id DESC),
+               MIN(ts) OVER (PARTITION BY asin, day),
+               MAX(ts) OVER (PARTITION BY asin, day),
+               COUNT(*) OVER (PARTITION BY asin, day)
+        FROM (SELECT id, asin, price, ts, date(ts, 'unixepoch') AS day FROM price_observations
+              WHERE price IS NOT NULL {asin_filter})
+        WHERE true
+        ON CONFLICT(asin, day) DO NOTHING
+    """, asin_args)
+    conn.execute(f"""
+        INSERT INTO term_best (term, run_id, asin, price, ts)
+        SELECT r.term, o.run_id, o.asin, MIN(o.price), o.ts
+        FROM price_observations o JOIN search_runs r ON r.id = o.run_id
+        WHERE o.price IS NOT NULL {term_filter}
+          AND o.run_id = (SELECT MAX(r2.id) FROM search_runs r2 JOIN price_observations o2 ON o2.run_id = r2.id
+                          WHERE r2.term = r.term AND o2.price IS NOT NULL)
+        GROUP BY r.term
+    """, term_args)
+    if asins is not None:
+        # The count triggers already kept table_counts right
+        return
+    for table in COUNTED_TABLES:
+        conn.execute(f"INSERT INTO table_counts (name, n) SELECT '{table}', COUNT(*) FROM {table}")
+
+
+def migrate_to_v5(conn):
+    """Watch rules for price alerts; rev orders edits so running processes can reload"""
+    run_script(conn, """
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL CHECK (kind IN ('below', 'drop', 'in_stock')),
+            asin TEXT,
+            term TEXT,
+            threshold REAL,
+            active INTEGER NOT NULL DEFAULT 1,
+            last_fired INTEGER,
+            created_at INTEGER NOT NULL,
+            rev INTEGER NOT NULL DEFAULT 0,
+            CHECK (asin IS NOT NULL OR term IS NOT NULL)
+        );
+        CREATE INDEX IF NOT EXISTS idx_alert_rules_rev ON alert_rules(rev);
+    """)
+
+
+def migrate_to_v6(conn):
+    """Run journal: which ASINs a search run set out to fetch and which are already saved"""
+    run_script(conn, """
+        CREATE TABLE IF NOT EXISTS run_journal (
+            run_id INTEGER PRIMARY KEY REFERENCES search_runs(id),
+            mode TEXT NOT NULL,
+            status TEXT NOT NULL CHECK (status IN ('running', 'interrupted', 'done')),
+            updated_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_run_journal_status ON run_journal(status, updated_at);
+        CREATE TABLE IF NOT EXISTS run_frontier (
+            run_id INTEGER NOT NULL REFERENCES run_journal(run_id),
+            asin TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'done', 'skipped')),
+            product TEXT,
+            PRIMARY KEY (run_id, asin)
+        ) WITHOUT ROWID;
+    """)
+
+
+# (version, upgrade function) in order; user_version records the last one applied
+MIGRATIONS = [
+    (1, migrate_to_v1),
+    (2, migrate_to_v2),
+    (3, migrate_to_v3),
+    (4, migrate_to_v4),
+    (5, migrate_to_v5),
+    (6, migrate_to_v6),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for target, upgrade in MIGRATIONS:
+        if target > version:
+            print(f"Migrating database to schema v{target}...")
+            # Explicit BEGIN: sqlite3 would otherwise autocommit DDL statement by statement
+            with conn:
+                conn.execute('BEGIN')
+                upgrade(conn)
+                conn.execute(f'PRAGMA user_version = {target}')
+            version = target
+    return version
+
+
+def init_db(path=DB_PATH):
+    conn = connect(path)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+
+
+def start_run(conn, term, min_price=None, max_price=None, engine=None):
+    with conn:
+        cur = conn.execute(
+            'INSERT INTO search_runs (term, min_price, max_price, engine, started_at) VALUES (?, ?, ?, ?, ?)',
+            (term, to_price(min_price), to_price(max_price), engine, int(time.time()))
+        )
+    return cur.lastrowid
+
+
+def finish_run(conn, run_id, product_count):
+    with conn:
+        conn.execute(
+            'UPDATE search_runs SET finished_at = ?, product_count = ? WHERE id = ?',
+            (int(time.time()), product_count, run_id)
+        )
+
+
+def save_products(conn, products, run_id=None, ts=None):
+    """Batch insert products and their observations in a single transaction"""
+    ts = int(ts or time.time())
+    with conn:
+        conn.executemany(UPSERT_PRODUCT_SQL, [_product_row(p, ts) for p in products])
+        conn.executemany(
+            INSERT_OBSERVATION_SQL,
+            [(product_key(p), run_id, to_price(p.get('current_price')), ts) for p in products]
+        )
+
+
+def start_journal(conn, run_id, mode, asins):
+    """Record the ordered ASIN frontier a run is about to fetch"""
+    now = int(time.time())
+    with conn:
+        conn.execute('INSERT INTO run_journal (run_id, mode, status, updated_at) VALUES (?, ?, ?, ?)',
+                     (run_id, mode, 'running', now))
+        conn.executemany('INSERT OR IGNORE INTO run_frontier (run_id, asin, position) VALUES (?, ?, ?)',
+                         [(run_id, asin, i) for i, asin in enumerate(asins)])
+
+
+def checkpoint_products(conn, run_id, products, ts=None):
+    """Save products and mark their ASINs done in the run's frontier, in one transaction"""
+    ts = int(ts or time.time())
+    with conn:
+        conn.executemany(UPSERT_PRODUCT_SQL, [_product_row(p, ts) for p in products])
+        conn.executemany(
+            INSERT_OBSERVATION_SQL,
+            [(product_key(p), run_id, to_price(p.get('current_price')), ts) for p in products]
+        )
+        conn.executemany(
+            "UPDATE run_frontier SET status = 'done', product = ? WHERE run_id = ? AND asin = ?",
+            [(json.dumps(p), run_id, p.get('asin')) for p in products if p.get('asin')]
+        )
+        conn.execute('UPDATE search_runs SET product_count = product_count + ? WHERE id = ?', (len(products), run_id))
+        conn.execute('UPDATE run_journal SET updated_at = ? WHERE run_id = ?', (ts, run_id))
+
+
+def skip_frontier(conn, run_id, asin):
+    """An ASIN that was fetched but gave nothing to keep; a resume does not retry it"""
+    with conn:
+        conn.execute("UPDATE run_frontier SET status = 'skipped' WHERE run_id = ? AND asin = ?", (run_id, asin))
+        conn.execute('UPDATE run_journal SET updated_at = ? WHERE run_id = ?', (int(time.time()), run_id))
+
+
+def end_journal(conn, run_id):
+    """Finish the run if its frontier is exhausted, else mark it interrupted; returns the new status"""
+    now = int(time.time())
+    with conn:
+        pending, count = conn.execute(
+            """SELECT (SELECT COUNT(*) FROM run_frontier WHERE run_id = ? AND status = 'pending'), product_count
+               FROM search_runs WHERE id = ?""",
+            (run_id, run_id)
+        ).fetchone()
+        status = 'interrupted' if pending else 'done'
+        conn.execute('UPDATE run_journal SET status = ?, updated_at = ? WHERE run_id = ?', (status, now, run_id))
+        if status == 'done':
+            conn.execute('UPDATE search_runs SET finished_at = ? WHERE id = ?', (now, run_id))
+            # The observations are the record now; the frontier only mattered while it could be resumed
+            conn.execute('DELETE FROM run_frontier WHERE run_id = ?', (run_id,))
+    return status
+
+
+def discard_run(conn, run_id, since_ts=0):
+    """Drop a run's observations from `since_ts` on, e.g. a hedged run that lost the race; returns the count
+
+    The run goes too if nothing older is left in it, otherwise it is closed so
+    it is not resumed. Products only that run had seen are dropped with it.
+    """
+    with conn:
+        row = conn.execute('SELECT term FROM search_runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            return 0
+        asins = [r[0] for r in conn.execute(
+            'SELECT DISTINCT asin FROM price_observations WHERE run_id = ? AND ts >= ?', (run_id, since_ts))]
+        dropped = conn.execute('DELETE FROM price_observations WHERE run_id = ? AND ts >= ?',
+                               (run_id, since_ts)).rowcount
+        left = conn.execute('SELECT COUNT(*) FROM price_observations WHERE run_id = ?', (run_id,)).fetchone()[0]
+        conn.execute('DELETE FROM run_frontier WHERE run_id = ?', (run_id,))
+        now = int(time.time())
+        if dropped:
+            # The discard time, kept increasing, so ETags and Last-Modified move past what clients cached
+            conn.execute("""INSERT INTO table_counts (name, n) VALUES (?, ?)
+                            ON CONFLICT(name) DO UPDATE SET n = MAX(n + 1, excluded.n)""", (DISCARD_VERSION, now))
+        if left:
+            conn.execute("UPDATE run_journal SET status = 'done', updated_at = ? WHERE run_id = ?", (now, run_id))
+            conn.execute('UPDATE search_runs SET product_count = ?, finished_at = IFNULL(finished_at, ?) WHERE id = ?',
+                         (left, now, run_id))
+        else:
+            conn.execute('DELETE FROM run_journal WHERE run_id = ?', (run_id,))
+            conn.execute('DELETE FROM search_runs WHERE id = ?', (run_id,))
+        for i in range(0, len(asins), 500):
+            chunk = asins[i:i + 500]
+            conn.execute(
+                f"""DELETE FROM products WHERE asin IN ({', '.join('?' * len(chunk))})
+                    AND NOT EXISTS (SELECT 1 FROM price_observations o WHERE o.asin = products.asin)""",
+                chunk
+            )
+            rebuild_aggregates(conn, chunk, [row[0]] if row[0] else [])
+    return dropped
+
+
+# Not finished and either stopped cleanly or silent long enough that its process must be gone
+RESUMABLE_SQL = """(j.status = 'interrupted' OR (j.status = 'running' AND j.updated_at < :stale))"""
+
+
+def claim_journal(conn, run_id, stale_before):
+    """Take over an interrupted (or abandoned) run; False if it is live elsewhere or already done"""
+    with conn:
+        cur = conn.execute(
+            f"""UPDATE run_journal AS j SET status = 'running', updated_at = :now
+                WHERE run_id = :run_id AND {RESUMABLE_SQL}""",
+            {'now': int(time.time()), 'run_id': run_id, 'stale': stale_before}
+        )
+    return cur.rowcount == 1
+
+
+def find_resumable_run(conn, term, min_price, max_price, mode, since_ts, stale_before):
+    """Newest unfinished journaled run of this exact search started after since_ts, or None"""
+    row = conn.execute(
+        f"""SELECT r.id FROM search_runs r JOIN run_journal j ON j.run_id = r.id
+            WHERE r.term = :term AND r.min_price IS :min AND r.max_price IS :max AND j.mode = :mode
+              AND r.started_at >= :since AND {RESUMABLE_SQL}
+            ORDER BY r.started_at DESC LIMIT 1""",
+        {'term': term, 'min': to_price(min_price), 'max': to_price(max_price), 'mode': mode,
+         'since': since_ts, 'stale': stale_before}
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_checkpoint(conn, run_id):
+    """The journaled run: its search, the ASINs still pending and the products already saved"""
+    row = conn.execute(
+        """SELECT r.term, r.min_price, r.max_price, j.mode, j.status
+           FROM search_runs r JOIN run_journal j ON j.run_id = r.id WHERE r.id = ?""",
+        (run_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    checkpoint = dict(zip(['term', 'min_price', 'max_price', 'mode', 'status'], row), run_id=run_id,
+                      pending=[], products=[])
+    for asin, status, product in conn.execute(
+            'SELECT asin, status, product FROM run_frontier WHERE run_id = ? ORDER BY position', (run_id,)):
+        if status == 'pending':
+            checkpoint['pending'].append(asin)
+        elif product:
+            checkpoint['products'].append(json.loads(product))
+    return checkpoint
+
+
+JOURNAL_FIELDS = ['run_id', 'term', 'min_price', 'max_price', 'mode', 'status', 'started_at', 'updated_at', 'done',
+                  'pending']
+
+
+def unfinished_runs(conn, limit=20):
+    """Journaled runs that stopped before their frontier was exhausted, newest first"""
+    rows = conn.execute(
+        """SELECT r.id, r.term, r.min_price, r.max_price, j.mode, j.status, r.started_at, j.updated_at,
+                  SUM(f.status = 'done'), SUM(f.status = 'pending')
+           FROM run_journal j JOIN search_runs r ON r.id = j.run_id
+           LEFT JOIN run_frontier f ON f.run_id = j.run_id
+           WHERE j.status != 'done'
+           GROUP BY j.run_id ORDER BY r.started_at DESC LIMIT ?""",
+        (limit,)
+    ).fetchall()
+    return [dict(zip(JOURNAL_FIELDS, row)) for row in rows]
+
+
+def latest_observations(conn, limit=100):
+    rows = conn.execute(
+        """SELECT p.product_name, p.type_of_product, p.weight, o.price, p.pet, p.seller
+           FROM price_observations o JOIN products p ON p.asin = o.asin
+           ORDER BY o.id DESC LIMIT ?""",
+        (limit,)
+    ).fetchall()
+    return [dict(zip(['product_name', 'type_of_product', 'weight', 'current_price', 'pet', 'seller'], row)) for row in rows]
+
+
+OBSERVATION_FIELDS = ['id', 'asin', 'product_name', 'type_of_product', 'weight', 'current_price', 'pet', 'seller', 'observed_at']
+
+# sort name -> (ORDER BY clause, keyset condition, cursor columns)
+OBSERVATION_SORTS = {
+    'newest': ('o.id DESC', 'o.id < ?', ['id']),
+    'oldest': ('o.id ASC', 'o.id > ?', ['id']),
+    'price_asc': ('o.price ASC, o.id ASC', '(o.price, o.id) > (?, ?)', ['current_price', 'id']),
+    'price_desc': ('o.price DESC, o.id DESC', '(o.price, o.id) < (?, ?)', ['current_price', 'id']),
+}
+
+
+def query_observations(conn, filters=None, sort='newest', limit=50, after=None):
+    """One page of observations plus the cursor key for the next page (None on the last page)
+
+    filters may hold term, q, seller, pet, min_price, max_price, since and until
+    (epoch seconds). `after` is the cursor key returned with the previous page.
+    """
+    filters = filters or {}
+    order_by, keyset, cursor_columns = OBSERVATION_SORTS[sort]
+    where = []
+    params = []
+    if filters.get('term'):
+        where.append(f'o.run_id IN (SELECT r.id FROM search_runs r WHERE {NORMALIZED_TERM_SQL} = ?)')
+        params.append(normalize_term(filters['term']))
+    match = fts_query(filters.get('q'))
+    if match:
+        where.append('p.rowid IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)')
+        params.append(match)
+    if filters.get('seller'):
+        where.append('p.seller LIKE ?')
+        params.append(f"%{filters['seller']}%")
+    if filters.get('pet'):
+        where.append('p.pet = ?')
+        params.append(filters['pet'])
+    if filters.get('min_price') is not None:
+        where.append('o.price >= ?')
+        params.append(filters['min_price'])
+    if filters.get('max_price') is not None:
+        where.append('o.price <= ?')
+        params.append(filters['max_price'])
+    if filters.get('since') is not None:
+        where.append('o.ts >= ?')
+        params.append(filters['since'])
+    if filters.get('until') is not None:
+        where.append('o.ts <= ?')
+        params.append(filters['until'])
+    if sort.startswith('price'):
+        where.append('o.price IS NOT NULL')
+    if after:
+        where.append(keyset)
+        params.extend(after)
+    sql = f"""SELECT o.id, o.asin, p.product_name, p.type_of_product, p.weight, o.price, p.pet, p.seller, o.ts
+              FROM price_observations o JOIN products p ON p.asin = o.asin
+              {'WHERE ' + ' AND '.join(where) if where else ''}
+              ORDER BY {order_by} LIMIT ?"""
+    # One extra row tells us whether another page exists
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    items = [dict(zip(OBSERVATION_FIELDS, row)) for row in rows[:limit]]
+    next_key = [items[-1][c] for c in cursor_columns] if len(rows) > limit else None
+    return items, next_key
+
+
+FTS_TOKEN_RE = re.compile(r'[\w&\'-]+\*?')
+SEARCH_FIELDS = ['asin', 'product_name', 'seller', 'pet', 'weight', 'current_price', 'observed_at', 'snippet', 'score']
+# Private-use markers survive snippet() and are swapped for <mark> after escaping
+_MARK_START, _MARK_END = '\ue000', '\ue001'
+
+
+def fts_query(text, prefix=True):
+    """FTS5 MATCH expression for free text: every word must match, the last one as a prefix
+
+    Words are quoted so user input can't inject FTS syntax; a trailing * asks
+    for a prefix match on any word.
+    """
+    tokens = FTS_TOKEN_RE.findall(text or '')
+    terms = []
+    for i, token in enumerate(tokens):
+        star = token.endswith('*') or (prefix and i == len(tokens) - 1)
+        word = token.rstrip('*').replace('"', '')
+        if word:
+            terms.append(f'"{word}"' + ('*' if star else ''))
+    return ' '.join(terms)
+
+
+def _highlight(snippet):
+    return html.escape(snippet or '').replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search_products(conn, text, limit=20, offset=0, prefix=True):
+    """Products matching free text, best bm25 rank first, with their latest price
+
+    Titles weigh more than sellers. Snippets are HTML-escaped with matches
+    wrapped in <mark>.
+    """
+    match = fts_query(text, prefix)
+    if not match:
+        return []
+    rows = conn.execute(
+        """SELECT p.asin, p.product_name, p.seller, p.pet, p.weight,
+                  (SELECT o.price FROM price_observations o WHERE o.asin = p.asin ORDER BY o.ts DESC LIMIT 1),
+                  p.last_seen,
+                  snippet(products_fts, 0, ?, ?, '…', 16),
+                  bm25(products_fts, 10.0, 2.0) AS score
+           FROM products_fts JOIN products p ON p.rowid = products_fts.rowid
+           WHERE products_fts MATCH ?
+           ORDER BY score LIMIT ? OFFSET ?""",
+        (_MARK_START, _MARK_END, match, limit, offset)
+    ).fetchall()
+    results = []
+    for row in rows:
+        result = dict(zip(SEARCH_FIELDS, row))
+        result['snippet'] = _highlight(result['snippet'])
+        results.append(result)
+    return results
+
+
+# table_counts row bumped whenever observations are deleted; never reset by a rebuild
+DISCARD_VERSION = 'observations_discarded_at'
+
+
+def observations_version(conn):
+    """(last observation id, its timestamp, discard version): changes whenever prices land or are discarded
+
+    Ids of deleted observations are reused, so the last id alone could
+    come back to a value clients have already cached.
+    """
+    row = conn.execute('SELECT id, ts FROM price_observations ORDER BY id DESC LIMIT 1').fetchone()
+    discarded = conn.execute('SELECT n FROM table_counts WHERE name = ?', (DISCARD_VERSION,)).fetchone()
+    return (*(row or (0, 0)), discarded[0] if discarded else 0)
+
+
+def table_counts(conn):
+    """Row counts kept by triggers; no table scans"""
+    return dict(conn.execute('SELECT name, n FROM table_counts').fetchall())
+
+
+def count_observations(conn):
+    return table_counts(conn).get('price_observations', 0)
+
+
+STATS_FIELDS = ['asin', 'n', 'price_n', 'min_price', 'max_price', 'sum_price', 'sum_sq_price', 'first_ts', 'last_price', 'last_ts']
+
+
+def product_stats(conn, asin):
+    """Running price stats for one product, with mean and standard deviation derived from the sums"""
+    row = conn.execute(f"SELECT {', '.join(STATS_FIELDS)} FROM product_stats WHERE asin = ?", (asin,)).fetchone()
+    if not row:
+        return None
+    stats = dict(zip(STATS_FIELDS, row))
+    n = stats['price_n']
+    stats['avg_price'] = stats['sum_price'] / n if n else None
+    # Population variance from the running sums; clamp rounding noise below zero
+    stats['stddev_price'] = max(stats['sum_sq_price'] / n - stats['avg_price'] ** 2, 0) ** 0.5 if n else None
+    return stats
+
+
+def term_best(conn, term):
+    """Cheapest product of the newest run for a search term"""
+    row = conn.execute(
+        """SELECT b.term, b.run_id, b.asin, p.product_name, p.seller, b.price, b.ts
+           FROM term_best b LEFT JOIN products p ON p.asin = b.asin WHERE b.term = ?""",
+        (term,)
+    ).fetchone()
+    return dict(zip(['term', 'run_id', 'asin', 'product_name', 'seller', 'current_price', 'observed_at'], row)) if row else None
+
+
+def daily_ohlc(conn, asin, days=30):
+    rows = conn.execute(
+        'SELECT day, open, high, low, close, n FROM daily_ohlc WHERE asin = ? ORDER BY day DESC LIMIT ?',
+        (asin, days)
+    ).fetchall()
+    return [dict(zip(['day', 'open', 'high', 'low', 'close', 'n'], row)) for row in reversed(rows)]
+
+
+ALERT_RULE_FIELDS = ['id', 'kind', 'asin', 'term', 'threshold', 'active', 'last_fired', 'created_at']
+
+
+def _next_alert_rev(conn):
+    return conn.execute('SELECT IFNULL(MAX(rev), 0) + 1 FROM alert_rules').fetchone()[0]
+
+
+def add_alert_rule(conn, kind, asin=None, term=None, threshold=None):
+    with conn:
+        cur = conn.execute(
+            'INSERT INTO alert_rules (kind, asin, term, threshold, created_at, rev) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, asin, term, threshold, int(time.time()), _next_alert_rev(conn))
+        )
+    return cur.lastrowid
+
+
+def set_alert_rule_active(conn, rule_id, active):
+    with conn:
+        cur = conn.execute('UPDATE alert_rules SET active = ?, rev = ? WHERE id = ?',
+                           (int(active), _next_alert_rev(conn), rule_id))
+    return cur.rowcount > 0
+
+
+def load_alert_rules(conn, active_only=True):
+    sql = f"SELECT {', '.join(ALERT_RULE_FIELDS)} FROM alert_rules"
+    if active_only:
+        sql += ' WHERE active = 1'
+    return [dict(zip(ALERT_RULE_FIELDS, row)) for row in conn.execute(sql + ' ORDER BY id')]
+
+
+def alert_rules_version(conn):
+    return conn.execute('SELECT IFNULL(MAX(rev), 0) FROM alert_rules').fetchone()[0]
+
+
+def mark_alerts_fired(conn, rule_ids, ts):
+    # Deliberately leaves rev alone: firing is not an edit other processes must reload for
+    with conn:
+        conn.executemany('UPDATE alert_rules SET last_fired = ? WHERE id = ?', [(ts, i) for i in rule_ids])
+
+
+def price_history_before(conn, asin, before_ts, since_ts):
+    """(lowest price since since_ts, most recent price, whether any earlier observation exists)
+
+    Only observations older than before_ts count, so a batch never compares against itself.
+    """
+    low = conn.execute(
+        'SELECT MIN(price) FROM price_observations WHERE asin = ? AND ts >= ? AND ts < ?',
+        (asin, since_ts, before_ts)
+    ).fetchone()[0]
+    last = conn.execute(
+        'SELECT price FROM price_observations WHERE asin = ? AND ts < ? ORDER BY ts DESC, id DESC LIMIT 1',
+        (asin, before_ts)
+    ).fetchone()
+    return low, (last[0] if last else None), last is not None
+
+
+def asin_terms(conn, asins):
+    """ASIN -> normalized search terms whose runs have found it"""
+    terms = {}
+    asins = list(asins)
+    for i in range(0, len(asins), 500):
+        chunk = asins[i:i + 500]
+        rows = conn.execute(
+            f"""SELECT DISTINCT o.asin, {NORMALIZED_TERM_SQL} FROM price_observations o
+                JOIN search_runs r ON r.id = o.run_id
+                WHERE o.asin IN ({', '.join('?' * len(chunk))}) AND r.term IS NOT NULL""",
+            chunk
+        )
+        for asin, term in rows:
+            terms.setdefault(asin, set()).add(term)
+    return terms
+
+
+def tracked_asins(conn, term=None, limit=None):
+    """Known ASINs, least recently seen first; only those found by `term` searches if given"""
+    sql = "SELECT asin FROM products WHERE asin NOT LIKE '~%'"
+    params = []
+    if term:
+        sql += f""" AND asin IN (SELECT o.asin FROM price_observations o JOIN search_runs r ON r.id = o.run_id
+                                 WHERE {NORMALIZED_TERM_SQL} = ?)"""
+        params.append(normalize_term(term))
+    sql += ' ORDER BY last_seen, asin'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+SCHEDULE_FIELDS = ['asin', 'price_n', 'avg_price', 'stddev_price', 'last_price', 'last_ts', 'window_low']
+
+
+def schedule_stats(conn, since_ts, asins=None):
+    """Per-ASIN inputs for refresh scheduling: price spread, latest price and the low since since_ts"""
+    sql = """
+        SELECT p.asin, IFNULL(s.price_n, 0), s.sum_price, s.sum_sq_price, s.last_price, s.last_ts, w.low
+        FROM products p
+        LEFT JOIN product_stats s ON s.asin = p.asin
+        LEFT JOIN (SELECT asin, MIN(low) AS low FROM daily_ohlc WHERE day >= date(?, 'unixepoch') GROUP BY asin) w
+               ON w.asin = p.asin
+        WHERE p.asin NOT LIKE '~%'"""
+    params = [since_ts]
+    if asins is not None:
+        sql += f" AND p.asin IN ({', '.join('?' * len(asins))})"
+        params.extend(asins)
+    stats = []
+    for asin, n, total, total_sq, last_price, last_ts, low in conn.execute(sql, params):
+        avg = total / n if n else None
+        stddev = max(total_sq / n - avg ** 2, 0) ** 0.5 if n else None
+        stats.append(dict(zip(SCHEDULE_FIELDS, (asin, n, avg, stddev, last_price, last_ts, low))))
+    return stats
+
+
+def last_search_times(conn, terms):
+    """term -> start time of its newest search run"""
+    if not terms:
+        return {}
+    rows = conn.execute(
+        f"SELECT term, MAX(started_at) FROM search_runs WHERE term IN ({', '.join('?' * len(terms))}) GROUP BY term",
+        list(terms)
+    )
+    return dict(rows.fetchall())
+
+
+def run_term(conn, run_id):
+    row = conn.execute('SELECT term FROM search_runs WHERE id = ?', (run_id,)).fetchone()
+    return row[0] if row else None
+
+
+class Database:
+    """Shared access point: a pool of read connections and one serialized writer"""
+
+    def __init__(self, path=DB_PATH, readers=DB_READ_POOL_SIZE):
+        self.path = path
+        self._readers = queue.LifoQueue(maxsize=readers)
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._ready = False
+        # Called with (products, run_id, ts) after each batch of observations commits
+        self._listeners = []
+
+    def _ensure_ready(self):
+        if self._ready:
+            return
+        with self._init_lock:
+            if not self._ready:
+                init_db(self.path)
+                self._ready = True
+
+    def _open(self, read_only):
+        # Connections move between threads via the pool, never concurrently
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-16000')
+        if read_only:
+            conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    @contextmanager
+    def reader(self):
+        self._ensure_ready()
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._open(read_only=True)
+        try:
+            yield conn
+        finally:
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        """The single write connection; callers own the transaction"""
+        self._ensure_ready()
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open(read_only=False)
+            yield self._writer
+
+    def start_run(self, term, min_price=None, max_price=None, engine=None):
+        with self.writer() as conn:
+            return start_run(conn, term, min_price, max_price, engine)
+
+    def finish_run(self, run_id, product_count):
+        with self.writer() as conn:
+            finish_run(conn, run_id, product_count)
+
+    def add_listener(self, listener):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def save_products(self, products, run_id=None, ts=None):
+        if not products:
+            return
+        ts = int(ts or time.time())
+        with self.writer() as conn:
+            save_products(conn, products, run_id, ts)
+        self._notify(products, run_id, ts)
+
+    def _notify(self, products, run_id, ts):
+        for listener in self._listeners:
+            try:
+                listener(products, run_id, ts)
+            except Exception as e:
+                print(f"Ingest listener failed: {e}")
+
+    def save_run(self, products, term=None, filters=None, engine=None):
+        """Record a whole search run and its observations"""
+        filters = filters or {}
+        run_id = self.start_run(term, filters.get('min'), filters.get('max'), engine)
+        self.save_products(products, run_id)
+        self.finish_run(run_id, len(products))
+        return run_id
+
+    def start_journal(self, run_id, mode, asins):
+        with self.writer() as conn:
+            start_journal(conn, run_id, mode, asins)
+
+    def checkpoint_products(self, run_id, products, ts=None):
+        if not products:
+            return
+        ts = int(ts or time.time())
+        with self.writer() as conn:
+            checkpoint_products(conn, run_id, products, ts)
+        self._notify(products, run_id, ts)
+
+    def skip_frontier(self, run_id, asin):
+        with self.writer() as conn:
+            skip_frontier(conn, run_id, asin)
+
+    def end_journal(self, run_id):
+        with self.writer() as conn:
+            return end_journal(conn, run_id)
+
+    def discard_run(self, run_id, since_ts=0):
+        with self.writer() as conn:
+            return discard_run(conn, run_id, since_ts)
+
+    def claim_journal(self, run_id, stale_before):
+        with self.writer() as conn:
+            return claim_journal(conn, run_id, stale_before)
+
+    def find_resumable_run(self, term, min_price, max_price, mode, since_ts, stale_before):
+        with self.reader() as conn:
+            return find_resumable_run(conn, term, min_price, max_price, mode, since_ts, stale_before)
+
+    def load_checkpoint(self, run_id):
+        with self.reader() as conn:
+            return load_checkpoint(conn, run_id)
+
+    def unfinished_runs(self, limit=20):
+        with self.reader() as conn:
+            return unfinished_runs(conn, limit)
+
+    def latest_observations(self, limit=100):
+        with self.reader() as conn:
+            return latest_observations(conn, limit)
+
+    def count_observations(self):
+        with self.reader() as conn:
+            return count_observations(conn)
+
+    def table_counts(self):
+        with self.reader() as conn:
+            return table_counts(conn)
+
+    def product_stats(self, asin):
+        with self.reader() as conn:
+            return product_stats(conn, asin)
+
+    def term_best(self, term):
+        with self.reader() as conn:
+            return term_best(conn, term)
+
+    def daily_ohlc(self, asin, days=30):
+        with self.reader() as conn:
+            return daily_ohlc(conn, asin, days)
+
+    def query_observations(self, filters=None, sort='newest', limit=50, after=None):
+        with self.reader() as conn:
+            return query_observations(conn, filters, sort, limit, after)
+
+    def observations_version(self):
+        with self.reader() as conn:
+            return observations_version(conn)
+
+    def tracked_asins(self, term=None, limit=None):
+        with self.reader() as conn:
+            return tracked_asins(conn, term, limit)
+
+    def schedule_stats(self, since_ts, asins=None):
+        with self.reader() as conn:
+            return schedule_stats(conn, since_ts, asins)
+
+    def last_search_times(self, terms):
+        with self.reader() as conn:
+            return last_search_times(conn, terms)
+
+    def load_alert_rules(self):
+        with self.reader() as conn:
+            return load_alert_rules(conn)
+
+    def search_products(self, text, limit=20, offset=0, prefix=True):
+        with self.reader() as conn:
+            return search_products(conn, text, limit, offset, prefix)
+
+    def reindex(self):
+        with self.writer() as conn:
+            with conn:
+                reindex(conn)
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Global database instance shared by the app and the Scrapy pipeline
+db = Database()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the price tracker database')
+    parser.add_argument('command', choices=['migrate', 'reindex', 'rebuild-stats'])
+    parser.add_argument('--db', default=DB_PATH, help='database file (default: %(default)s)')
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    try:
+        version = migrate(conn)
+        if args.command == 'reindex':
+            started = time.time()
+            with conn:
+                reindex(conn)
+            print(f"Rebuilt the search index in {time.time() - started:.2f}s")
+        elif args.command == 'rebuild-stats':
+            started = time.time()
+            with conn:
+                rebuild_aggregates(conn)
+            print(f"Rebuilt aggregate tables in {time.time() - started:.2f}s")
+        counts = table_counts(conn)
+        print(f"{args.db} is at schema v{version}: {counts.get('products', 0)} products, "
+              f"{counts.get('price_observations', 0)} price observations")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+AIMD throttle against the local stand-in site
+
+One crawl of a stand-in that answers 503 above 1 request in flight and
+429 (Retry-After: 1) above 3 requests per second; every decrease the
+throttle considers is recorded and checked against the rules.
+
+    python -m pytest tests
+"""
+import os
+import socket
+import time
+
+import pytest
+
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'amazon_scraper.settings')
+
+from scrapy.crawler import CrawlerProcess  # noqa: E402
+from scrapy.utils.project import get_project_settings  # noqa: E402
+
+from amazon_scraper.extensions import AimdThrottle  # noqa: E402
+from amazon_scraper.standin_server import serve, standin_spider  # noqa: E402
+
+PAGES = 3
+COOLDOWN = 1.0
+MAX_DELAY = 2.0
+DECREASE_FACTOR = 0.5
+DELAY_STEP = 0.25
+MIN_CONCURRENCY = 1
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def crawl():
+    """Crawl the stand-in once; (crawler stats, server response counts, decrease decisions)"""
+    port = free_port()
+    server, state = serve(port, capacity=1, rate=3, error_rate=0, latency=0.05, latency_per_request=0.02)
+    decisions = []
+    original = AimdThrottle.decrease
+
+    def decrease(self, key, slot, slot_state, spider, reason, retry_after=None):
+        before, at = (slot.concurrency, slot.delay), time.time()
+        last = slot_state.last_decrease
+        original(self, key, slot, slot_state, spider, reason, retry_after)
+        decisions.append({
+            'key': key, 'reason': reason, 'retry_after': retry_after, 'at': at, 'before': before,
+            'after': (slot.concurrency, slot.delay), 'applied': slot_state.last_decrease != last,
+            'previous': last,
+        })
+
+    settings = get_project_settings()
+    settings.setdict({
+        'AIMD_ENABLED': True,
+        'AIMD_START_DELAY': 0.05,
+        'AIMD_MIN_CONCURRENCY': MIN_CONCURRENCY,
+        'AIMD_MAX_DELAY': MAX_DELAY,
+        'AIMD_DECREASE_FACTOR': DECREASE_FACTOR,
+        'AIMD_DELAY_STEP': DELAY_STEP,
+        'AIMD_COOLDOWN': COOLDOWN,
+        'ROBOTSTXT_OBEY': False,
+        'LOG_LEVEL': 'WARNING',
+    }, priority='cmdline')
+    AimdThrottle.decrease = decrease
+    try:
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(standin_spider(port))
+        process.crawl(crawler, search_term='dog food', max_pages=PAGES)
+        process.start()
+    finally:
+        AimdThrottle.decrease = original
+        server.shutdown()
+    return crawler.stats.get_stats(), dict(state.counts), decisions
+
+
+def applied(decisions):
+    return [d for d in decisions if d['applied']]
+
+
+def test_stand_in_throttles_the_crawl(crawl):
+    stats, counts, decisions = crawl
+    assert counts.get(429) or counts.get(503)
+    assert stats.get('item_scraped_count', 0) > 0
+    assert any(d['reason'] in ('HTTP 429', 'HTTP 503') for d in applied(decisions))
+
+
+def test_decrease_halves_concurrency_and_doubles_delay(crawl):
+    _, _, decisions = crawl
+    for d in applied(decisions):
+        concurrency, delay = d['before']
+        assert d['after'][0] == max(MIN_CONCURRENCY, int(concurrency * DECREASE_FACTOR))
+        expected = min(MAX_DELAY, max(delay / DECREASE_FACTOR, DELAY_STEP, d['retry_after'] or 0))
+        assert d['after'][1] == pytest.approx(expected)
+
+
+def test_retry_after_is_honoured(crawl):
+    _, counts, decisions = crawl
+    limited = [d for d in decisions if d['reason'] == 'HTTP 429']
+    assert limited and len(limited) == counts.get(429, 0)
+    for d in limited:
+        assert d['retry_after'] == 1
+        # Retry-After is an explicit signal: applied even inside the cooldown
+        assert d['applied']
+        assert d['after'][1] >= 1
+
+
+def test_cooldown_is_respected(crawl):
+    _, _, decisions = crawl
+    unannounced = [d for d in decisions if not d['retry_after']]
+    assert unannounced
+    for d in unannounced:
+        in_cooldown = d['at'] - d['previous'] < COOLDOWN
+        assert d['applied'] != in_cooldown
+
+
+def test_stats_are_exported(crawl):
+    stats, _, decisions = crawl
+    assert stats['aimd/decreases'] == len(applied(decisions))
+    for name in ('aimd/concurrency', 'aimd/delay', 'aimd/concurrency_max'):
+        assert name in stats
+    assert stats['aimd/concurrency'] >= MIN_CONCURRENCY
+    assert stats['aimd/concurrency_max'] >= stats['aimd/concurrency']
+    assert stats['aimd/delay'] <= MAX_DELAY
@@ -1,61 +1,44 @@
 from amazon_config import (
-    get_chrome_options,
-    get_chrome_driver,
-    set_ignore_certificate_error,
-    set_browser_as_incognito,
     NAME,
     CURRENCY,
     FILTERS,
     BASE_URL,
     DIRECTORY,
-    ALLOWED_SELLERS
+    ALLOWED_SELLERS,
+    FILTER_BY_SELLER,
+    SEARCH_PAGES,
+    SEARCH_LEASE_TIMEOUT,
+    MAX_PRODUCT_PAGES,
+    CHECKPOINT_ENABLED,
+    CHECKPOINT_RESUME_WINDOW,
+    CHECKPOINT_STALE
 )
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
-import json
 from datetime import datetime
+import argparse
 import time
-import re
-import os
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-
-
-def extract_weight(title):
-    match = re.search(r'(\d+(?:\.\d+)?)\s*kg', title, re.IGNORECASE)
-    if match:
-        return match.group(1) + 'kg'
-    return 'N/A'
-
-
-def extract_pet(title):
-    if 'dog' in title.lower():
-        return 'Dog'
-    elif 'cat' in title.lower():
-        return 'Cat'
-    return 'N/A'
+from driver_pool import driver_pool, PoolTimeout
+from rate_limit import rate_limiter
+from page_analyzer import analyze_product_page, detect_block, convert_price, extract_search_links, parse_search_cards
+from prefilter import CardFilter
+from report_store import ReportStore
+from storage import db
+from amazon_urls import build_search_url, extract_asin, canonical_product_url, unique_asins
 
 
 class GenerateReport:
     def __init__(self, file_name, filters, base_link, currency, data):
-        self.data = data
+        self.data = data or []
         self.file_name = file_name
         self.filters = filters
         self.base_link = base_link
         self.currency = currency
         self.directory = DIRECTORY
-        file_path = f'{DIRECTORY}/{file_name}.json'
-        existing = {'reports': []}
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                temp = json.load(f)
-                if 'reports' in temp:
-                    existing = temp
-                else:
-                    # Old format, convert to new
-                    existing['reports'] = [temp]
         report = {
             'title': self.file_name,
             'date': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
@@ -65,11 +48,9 @@ class GenerateReport:
             'base_link': self.base_link,
             'products': self.data
         }
-        os.makedirs(self.directory, exist_ok=True)
-        existing['reports'].append(report)
         print("Generating report...")
-        with open(file_path, 'w') as file:
-            json.dump(existing, file, indent=2)
+        # Appends one line to the report history; older reports are never rewritten
+        ReportStore(self.directory, self.file_name).append(report)
         print("Report generated successfully..")
 
     def get_best_item(self):
@@ -77,7 +58,7 @@ class GenerateReport:
             valid_products = [p for p in self.data if p.get('current_price') is not None]
             if not valid_products:
                 return None
-            return sorted(valid_products, key=lambda k: k['current_price'])[0]
+            return min(valid_products, key=lambda k: k['current_price'])
         except Exception as e:
             print(e)
             print("Problem with sorting items")
@@ -85,61 +66,56 @@ class GenerateReport:
 
 
 class AmazonAPI:
-    def __init__(self, search_term, filters, base_url, currency):
+    def __init__(self, search_term, filters, base_url, currency, pool=None, progress=None,
+                 direct_search=True, search_pages=SEARCH_PAGES, search_only=False, need_seller=False,
+                 allowed_sellers=None, checkpoint=CHECKPOINT_ENABLED, resume=True, resume_run_id=None, database=None):
         self.base_url = base_url
         self.search_term = search_term
+        self.progress = progress
+        # Open the filtered search URL directly instead of typing into the homepage
+        self.direct_search = direct_search
+        self.search_pages = search_pages
+        # Build products from search result cards; product pages only for cards that fall short
+        self.search_only = search_only
+        self.need_seller = need_seller
         
-        # Configure Chrome options
-        options = get_chrome_options()
-        set_ignore_certificate_error(options)
-        set_browser_as_incognito(options)
-        
-        self.driver = get_chrome_driver(options)
-        
-        # Set CDP parameters for stealth
-        self.driver.execute_cdp_cmd('Network.setUserAgentOverride', {
-            "userAgent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
-            "platform": "Windows",
-            "acceptLanguage": "en-US,en;q=0.9"
-        })
-        
-        # Execute stealth JavaScript
-        self.driver.execute_script("""
-            // Overwrite the 'navigator.webdriver' property
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => false
-            });
-            
-            // Add regular browser features
-            window.chrome = {
-                runtime: {}
-            };
-            
-            // Add regular plugins array
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            // Add regular languages
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['en-US', 'en']
-            });
-        """)
+        # Borrow a warm browser; stealth setup is applied once when the pool starts it
+        self.pool = pool or driver_pool
+        self.lease = self.pool.acquire()
+        self.driver = self.lease.driver
         
         self.currency = currency
+        self.filters = filters
         self.price_filter = f"&low-price={filters['min']}&high-price={filters['max']}"
+        # Drops cards by brand/price before any product page is fetched
+        self.card_filter = CardFilter(allowed_sellers, filters.get('min'), filters.get('max'))
         
-        # Randomize delays more naturally
-        self.min_delay = 3
-        self.max_delay = 7
+        # Short human-like pauses between UI actions; request pacing comes from rate_limiter
+        self.min_delay = 0.5
+        self.max_delay = 1.5
         
         # Add session cookies
-        self.driver.add_cookie({
-            'name': 'session-id',
-            'value': str(int(time.time())),
-            'domain': '.amazon.in'
-        })
+        try:
+            self.driver.add_cookie({
+                'name': 'session-id',
+                'value': str(int(time.time())),
+                'domain': '.amazon.in'
+            })
+        except Exception as e:
+            print(f"Could not set session cookie: {e}")
         
+        # Set from the last analyzed page so the product loop needs no extra page_source call
+        self.blocked = False
+        self.last_analysis = None
+
+        # Each product is saved as it arrives, against a journaled ASIN frontier that a later run can resume
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.resume_run_id = resume_run_id
+        self.db = database or db
+        self.run_id = None
+        self.products = []
+
         # Initialize retry count
         self.retry_count = 0
         self.max_retries = 3
@@ -149,69 +125,192 @@ class AmazonAPI:
         print(f'Looking for {self.search_term}....')
         
         try:
-            links = self.get_products_links()
+            checkpoint = self.load_checkpoint()
+            if checkpoint:
+                self.products = checkpoint['products']
+                self.report(f"Resuming run {self.run_id}: {len(self.products)} products already saved, "
+                            f"{len(checkpoint['pending'])} left to fetch")
+                return self.fetch_products(checkpoint['pending'])
+
+            if self.search_only:
+                return self.run_search_only()
+
+            asins = self.discover_asins()
             
             if self.check_if_blocked():
                 print("Access is being blocked by Amazon. Please try again later.")
                 return None
                 
-            if not links:
+            if not asins:
                 print("No product links found. Stopping tracker....")
                 return None
                 
-            print(f"Got {len(links)} links to products...")
+            self.report(f"Got {len(asins)} unique products to fetch...")
             print("Getting info about products...")
+            asins = asins[:MAX_PRODUCT_PAGES]  # Limit product pages to avoid blocking
+            self.start_checkpoint(asins)
+            return self.fetch_products(asins)
+            
+        except Exception as e:
+            print(f"Error during scraping: {str(e)}")
+            # Whatever was fetched before the failure is already saved; don't throw it away here either
+            return self.products
             
-            products = []
-            for i, link in enumerate(links[:5]):  # Limit to first 5 products to avoid blocking
-                if self.check_if_blocked():
-                    print("Access is being blocked by Amazon. Stopping further scraping.")
-                    break
-                    
-                asin = self.get_asin(link)
-                if asin:
-                    product = self.get_single_product_info(asin, i)
-                    if product:
-                        products.append(product)
-                self.random_delay()  # Add delay between product scrapes
+        finally:
+            self.end_checkpoint()
+            self.close()
+
+    def fetch_products(self, asins):
+        """Product page per ASIN, each kept product checkpointed before the next fetch"""
+        total = len(asins)
+        for i, asin in enumerate(asins):
+            if self.blocked:
+                self.report("Access is being blocked by Amazon. Stopping further scraping.")
+                break
                 
-            print(f"Successfully scraped {len(products)} products")
-            return products
+            self.report(f"Fetching product {i + 1} of {total}", done=i, total=total)
+            product = self.get_single_product_info(asin, i)
+            if product and self.card_filter.allows_product(product):
+                self.keep([product])
+            elif not self.blocked:
+                # A blocked fetch stays pending so a resume tries it again
+                self.skip(asin)
             
+        self.report(f"Successfully scraped {len(self.products)} products")
+        return self.products
+
+    def keep(self, products):
+        self.products.extend(products)
+        if self.run_id:
+            self.db.checkpoint_products(self.run_id, products)
+
+    def skip(self, asin):
+        if self.run_id:
+            self.db.skip_frontier(self.run_id, asin)
+
+    @property
+    def journal_mode(self):
+        return 'cards' if self.search_only else 'products'
+
+    def start_checkpoint(self, asins):
+        """Open a run and journal the ASINs it is about to fetch"""
+        if not self.checkpoint:
+            return
+        self.run_id = self.db.start_run(self.search_term, self.filters.get('min'), self.filters.get('max'), 'selenium')
+        self.db.start_journal(self.run_id, self.journal_mode, asins)
+
+    def load_checkpoint(self):
+        """Claim the requested run, or an unfinished run of this same search, and load its journal"""
+        if not self.checkpoint or not (self.resume or self.resume_run_id):
+            return None
+        now = time.time()
+        run_id = self.resume_run_id or self.db.find_resumable_run(
+            self.search_term, self.filters.get('min'), self.filters.get('max'), self.journal_mode,
+            now - CHECKPOINT_RESUME_WINDOW, now - CHECKPOINT_STALE)
+        if run_id is None:
+            return None
+        if not self.db.claim_journal(run_id, now - CHECKPOINT_STALE):
+            print(f"Run {run_id} is finished or still running elsewhere; starting a new run")
+            return None
+        self.run_id = run_id
+        return self.db.load_checkpoint(run_id)
+
+    def end_checkpoint(self):
+        if not self.run_id:
+            return
+        try:
+            if self.db.end_journal(self.run_id) == 'interrupted':
+                print(f"Run {self.run_id} stopped with products left to fetch; the next run of "
+                      f"'{self.search_term}' resumes it, or run: python tracker.py --resume {self.run_id}")
         except Exception as e:
-            print(f"Error during scraping: {str(e)}")
+            print(f"Could not close the run journal: {e}")
+
+    def discover_asins(self):
+        """Unique ASINs worth a product page visit, after the seller/price prefilter"""
+        if self.direct_search:
+            cards = self.filter_cards(self.get_search_cards())
+            return [card.asin for card in cards if card.asin]
+        # The typed search only yields links, so dedup is all we can do up front;
+        # sponsored and organic listings of one product collapse to a single ASIN
+        return unique_asins(self.get_products_links())
+
+    def filter_cards(self, cards):
+        cards = self.card_filter.apply(cards)
+        self.report(self.card_filter.summary(), saved_fetches=self.card_filter.saved_fetches)
+        return cards
+
+    def run_search_only(self):
+        """Products straight from search cards, with deep fetches only where a card falls short"""
+        cards = self.filter_cards(self.get_search_cards())
+        
+        if self.check_if_blocked():
+            print("Access is being blocked by Amazon. Please try again later.")
             return None
             
-        finally:
-            self.driver.quit()
+        if not cards:
+            print("No search result cards found. Stopping tracker....")
+            return None
+        
+        products = []
+        deep = []
+        for card in cards:
+            product = None if self.need_seller else card.to_product()
+            if product:
+                products.append(product)
+            elif card.asin:
+                deep.append(card.asin)
+        self.report(f"Got {len(products)} products from {len(cards)} search cards, {len(deep)} need a product page")
+        
+        deep = deep[:MAX_PRODUCT_PAGES]
+        self.start_checkpoint([p['asin'] for p in products if p.get('asin')] + deep)
+        if products:
+            self.keep(products)
+        return self.fetch_products(deep)
+
+    def get_search_cards(self):
+        cards = []
+        seen = set()
+        for page_html in self.fetch_search_pages():
+            for card in parse_search_cards(page_html, self.base_url):
+                # Drop sponsored repeats of a product already listed
+                if card.asin in seen:
+                    continue
+                if card.asin:
+                    seen.add(card.asin)
+                cards.append(card)
+        print(f"Found {len(cards)} unique search result cards across {self.search_pages} pages")
+        return cards
+
+    def report(self, message, **extra):
+        """Print progress and forward it to the caller, e.g. a background job"""
+        if self.progress:
+            self.progress(message, **extra)
+        else:
+            print(message)
+
+    def close(self):
+        """Hand the browser back to the pool"""
+        if self.lease:
+            self.pool.release(self.lease)
+            self.lease = None
+
+    def open_url(self, url):
+        # Every navigation draws from the budget shared with other jobs and Scrapy
+        rate_limiter.acquire(url)
+        self.driver.get(url)
+        self.lease.pages += 1
 
     def get_page_links(self):
         """Get product links from current page"""
-        links = []
         try:
             # Wait for search results to load
             WebDriverWait(self.driver, 10).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, '[data-component-type="s-search-result"]'))
             )
-            
-            selectors = [
-                'div[data-component-type="s-search-result"] h2 a',
-                'div.s-result-item h2 a',
-                'div.sg-col-inner h2 a',
-                'div[data-component-type="s-search-result"] .a-link-normal.s-no-outline'
-            ]
-            
-            for selector in selectors:
-                results = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                if results:
-                    links = [link.get_attribute('href') for link in results if link.get_attribute('href')]
-                    links = [link for link in links if '/dp/' in link]
-                    break
-            
-            return links
+            return extract_search_links(self.driver.page_source, self.base_url)
         except Exception as e:
             print(f"Error getting links from page: {e}")
-            return links
+            return []
 
     def has_next_page(self):
         """Check if there's a next page of results"""
@@ -249,9 +348,6 @@ class AmazonAPI:
             if product:
                 products.append(product)
             
-            # Add delay between product scraping
-            self.random_delay()
-            
         print(f"Successfully scraped {len(products)} products")
         return products
 
@@ -263,126 +359,67 @@ class AmazonAPI:
             
             # Add cache-busting parameter and language
             full_url = f'{product_short_url}?language=en_IN&_={int(time.time())}'
-            self.driver.get(full_url)
-            
-            # Wait for the page to load
-            self.random_delay()
-            
-            # Wait for price element to be present
-            price_wait = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, '.a-price, #priceblock_ourprice, #priceblock_dealprice, .price-large'))
-            )
+            self.open_url(full_url)
             
-            title = self.get_title()
-            print(f"Title: {title}")
-            seller = self.get_seller()
-            print(f"Seller: {seller}")
-            price = self.get_price()
-            print(f"Price: {price}")
+            # Wait for price element to be present; a captcha page never has one, so parse it anyway
+            try:
+                WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, '.a-price, #priceblock_ourprice, #priceblock_dealprice, .price-large'))
+                )
+            except Exception as e:
+                print(f"Price did not load ({type(e).__name__}), checking the page...")
             
-            if title and price:  # Make seller optional as it might not always be available
-                product_info = {
-                    'product_name': title,
-                    'type_of_product': 'Generic',  # Changed from 'Pet Food' to be more generic
-                    'weight': extract_weight(title),
-                    'current_price': price,
-                    'pet': extract_pet(title),
-                    'seller': seller if seller else 'Amazon'  # Use 'Amazon' as default seller
-                }
-                return product_info
-            else:
-                print(f"Missing required info - Title: {bool(title)}, Price: {bool(price)}")
+            analysis = analyze_product_page(self.driver.page_source, url=full_url)
+            self.last_analysis = analysis
+            if analysis.blocked:
+                self.report_block(analysis.block_reason)
                 return None
-                
-        except Exception as e:
-            print(f"Error getting product info: {str(e)}")
-            print(f"Current URL: {self.driver.current_url}")
-            return None
-
-    def get_title(self):
-        try:
-            return self.driver.find_element(By.ID, 'productTitle').text.strip()
-        except Exception as e:
-            print(f"Error getting title: {e}")
-            print(f"Can't get title of a product - {self.driver.current_url}")
-            return None
+            print(f"Title: {analysis.title}")
+            print(f"Seller: {analysis.seller}")
+            print(f"Price: {analysis.price}")
+            print(f"Parsed in {analysis.parse_seconds * 1000:.1f} ms")
 
-    def get_seller(self):
-        try:
-            return self.driver.find_element(By.ID, 'bylineInfo').text
-        except Exception as e:
-            print(e)
-            print(f"Can't get seller of a product - {self.driver.current_url}")
-            return None
+            product_info = analysis.to_product()  # Seller is optional as it might not always be available
+            if product_info:
+                product_info['asin'] = asin
+            else:
+                print(f"Missing required info - Title: {bool(analysis.title)}, Price: {bool(analysis.price)}")
+            return product_info
 
-    def get_price(self):
-        price = None
-        try:
-            # Try the primary price element
-            price_element = self.driver.find_element(By.CSS_SELECTOR, 'span.a-price-whole')
-            fraction_element = self.driver.find_element(By.CSS_SELECTOR, 'span.a-price-fraction')
-            if price_element and fraction_element:
-                price = f"{price_element.text}.{fraction_element.text}"
-                return self.convert_price(price)
-        except NoSuchElementException:
-            try:
-                # Try alternative price elements
-                price_element = self.driver.find_element(By.CSS_SELECTOR, '[data-a-color="price"] .a-offscreen')
-                if price_element:
-                    price = price_element.get_attribute('innerHTML')
-                    return self.convert_price(price)
-            except Exception as e:
-                print(f"Error getting price: {e}")
-                print(f"Can't get price of a product - {self.driver.current_url}")
-                return None
         except Exception as e:
-            print(f"Error getting price: {e}")
-            print(f"Can't get price of a product - {self.driver.current_url}")
+            print(f"Error getting product info: {str(e)}")
+            print(f"Current URL: {self.shorten_url(asin)}")
             return None
-        return price
 
     def convert_price(self, price):
-        if not price:
-            return None
-        # Remove currency symbol and any other non-numeric characters except dots
-        price = re.sub(r'[^0-9.]', '', price)
-        try:
-            return float(price)
-        except (ValueError, TypeError):
-            return None
+        return convert_price(price)
 
     def get_asins(self, links):
-        return [self.get_asin(link) for link in links]
+        return unique_asins(links)
 
     def get_asin(self, product_link):
-        return product_link[product_link.find('/dp/') + 4:product_link.find('/ref')]
+        return extract_asin(product_link)
 
     def shorten_url(self, asin):
-        return self.base_url + 'dp/' + asin
+        return canonical_product_url(self.base_url, asin)
 
     def random_delay(self):
         time.sleep(random.uniform(self.min_delay, self.max_delay))
 
     def check_if_blocked(self):
         """Check if we're being blocked by Amazon"""
-        blocked_indicators = [
-            'Sorry, we just need to make sure you',
-            'Enter the characters you see below',
-            'To discuss automated access to Amazon data',
-            'Bot Check',
-            'Type the characters you see in this image',
-            'Your browser is not accepting cookies'
-        ]
-        
-        page_source = self.driver.page_source.lower()
-        for indicator in blocked_indicators:
-            if indicator.lower() in page_source:
-                print(f"Access blocked by Amazon: {indicator}")
-                self.driver.save_screenshot('blocked.png')
-                print("Screenshot of blocked page saved as 'blocked.png'")
-                return True
+        reason = detect_block(self.driver.page_source)
+        if reason:
+            self.report_block(reason)
+            return True
         return False
 
+    def report_block(self, reason):
+        self.blocked = True
+        print(f"Access blocked by Amazon: {reason}")
+        self.driver.save_screenshot('blocked.png')
+        print("Screenshot of blocked page saved as 'blocked.png'")
+
     def verify_page_loaded(self, timeout=10):
         """Verify that the page has loaded properly"""
         try:
@@ -406,9 +443,11 @@ class AmazonAPI:
             return None
 
     def get_products_links(self):
+        if self.direct_search:
+            return self.harvest_search_links()
         try:
             # Load homepage with random delay
-            self.driver.get(self.base_url)
+            self.open_url(self.base_url)
             self.random_delay()
             
             # Wait for and interact with search box
@@ -430,49 +469,94 @@ class AmazonAPI:
             # Apply price filter
             filter_url = f'{self.driver.current_url}{self.price_filter}'
             print(f"Applying price filter: {filter_url}")
-            self.driver.get(filter_url)
+            self.open_url(filter_url)
             self.random_delay()
         except Exception as e:
             print(f"Error during search: {e}")
             return []
-            self.driver.save_screenshot('search_results.png')
-            print("Screenshot saved: search_results.png")
-            links = []
-            try:
-                # Wait for search results to load
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, '[data-component-type="s-search-result"]'))
-                )
-                
-                # Try multiple selector patterns that Amazon might use
-                selectors = [
-                    'div[data-component-type="s-search-result"] h2 a',
-                    'div.s-result-item h2 a',
-                    'div.sg-col-inner h2 a',
-                    'div[data-component-type="s-search-result"] .a-link-normal.s-no-outline'
-                ]
-                
-                for selector in selectors:
-                    results = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    if results:
-                        print(f"Found results using selector: {selector}")
-                        links = [link.get_attribute('href') for link in results if link.get_attribute('href')]
-                        # Filter out sponsored links and non-product URLs
-                        links = [link for link in links if '/dp/' in link]
-                        break
-                
-                if links:
-                    print(f"Found {len(links)} product links")
-                    for link in links:
-                        print(f"Product URL: {link}")
-                else:
-                    print("No product links found in the search results")
-                return links
-            except Exception as e:
-                print(f"Error finding products: {str(e)}")
-                print(f"Current URL: {self.driver.current_url}")
-                return links
-if __name__ == "__main__":
-    amazon = AmazonAPI(NAME, FILTERS, BASE_URL, CURRENCY)
+        links = self.get_page_links()
+        if links:
+            print(f"Found {len(links)} product links")
+        else:
+            print("No product links found in the search results")
+        return links
+
+    def harvest_search_links(self):
+        """Open the filtered search URL directly and merge links from pages 1..N"""
+        links = []
+        for page_html in self.fetch_search_pages():
+            links.extend(extract_search_links(page_html, self.base_url))
+        print(f"Found {len(links)} product links across {self.search_pages} pages")
+        return links
+
+    def fetch_search_pages(self):
+        """HTML of result pages 1..N, fetched in parallel on pooled browsers"""
+        urls = [build_search_url(self.base_url, self.search_term, self.filters, page)
+                for page in range(1, self.search_pages + 1)]
+        pages = [None] * len(urls)
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            futures = {executor.submit(self.fetch_with_pooled_driver, url): i
+                       for i, url in enumerate(urls) if i > 0}
+            # Page 1 goes through our own browser so check_if_blocked sees it
+            pages[0] = self.load_search_page(self.driver, self.lease, urls[0])
+            for future in as_completed(futures):
+                pages[futures[future]] = future.result()
+        # Pages that could not get a spare browser are loaded on ours afterwards
+        for i, page_html in enumerate(pages):
+            if page_html is None:
+                pages[i] = self.load_search_page(self.driver, self.lease, urls[i])
+        return pages
+
+    def fetch_with_pooled_driver(self, url):
+        try:
+            with self.pool.lease(timeout=SEARCH_LEASE_TIMEOUT) as lease:
+                return self.load_search_page(lease.driver, lease, url)
+        except PoolTimeout:
+            return None
+
+    def load_search_page(self, driver, lease, url):
+        print(f"Loading search page: {url}")
+        try:
+            rate_limiter.acquire(url)
+            driver.get(url)
+            lease.pages += 1
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, '[data-component-type="s-search-result"]'))
+            )
+        except Exception as e:
+            print(f"Search page did not finish loading: {e}")
+        return driver.page_source
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Track one search term; an interrupted run of it is resumed')
+    parser.add_argument('--resume', type=int, metavar='RUN_ID', help='continue this unfinished run')
+    parser.add_argument('--unfinished', action='store_true', help='list runs that can be resumed and exit')
+    parser.add_argument('--fresh', action='store_true', help='start over even if an unfinished run exists')
+    args = parser.parse_args()
+
+    if args.unfinished:
+        for run in db.unfinished_runs():
+            started = datetime.fromtimestamp(run['started_at']).strftime('%d/%m/%Y %H:%M')
+            print(f"{run['run_id']:>6}  {started}  {run['status']:<11} {run['done'] or 0:>3} saved "
+                  f"{run['pending'] or 0:>3} left  {run['term']} ({run['min_price']}-{run['max_price']})")
+        return
+
+    allowed_sellers = ALLOWED_SELLERS if FILTER_BY_SELLER else None
+    if args.resume:
+        checkpoint = db.load_checkpoint(args.resume)
+        if checkpoint is None:
+            parser.error(f"run {args.resume} has no journal")
+        name, filters = checkpoint['term'], {'min': checkpoint['min_price'], 'max': checkpoint['max_price']}
+        amazon = AmazonAPI(name, filters, BASE_URL, CURRENCY, search_only=checkpoint['mode'] == 'cards',
+                           allowed_sellers=allowed_sellers, resume_run_id=args.resume)
+    else:
+        name, filters = NAME, FILTERS
+        amazon = AmazonAPI(name, filters, BASE_URL, CURRENCY, allowed_sellers=allowed_sellers,
+                           resume=not args.fresh)
     data = amazon.run()
-    GenerateReport(NAME, FILTERS, BASE_URL, CURRENCY, data)
+    GenerateReport(name, filters, BASE_URL, CURRENCY, data)
+
+
+if __name__ == "__main__":
+    main()
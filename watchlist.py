@@ -0,0 +1,184 @@
+"""
+Track many search terms at once on a pool of worker processes
+
+Each worker process owns its own browser pool (or Scrapy reactor) and
+only fetches; products come back to the parent, which is the single
+writer for the database and the report history. Requests from all
+workers still share the per-host budget in rate_limit.py.
+
+    python watchlist.py watchlist.jsonl --workers 4
+    python watchlist.py terms.csv --engine scrapy
+
+Entries are JSONL ({"term": "dog food", "min": 200, "max": 2000}) or CSV
+rows of term,min,max; a missing min or max falls back to FILTERS.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
+
+from amazon_config import (FILTERS, BASE_URL, CURRENCY, ALLOWED_SELLERS, FILTER_BY_SELLER, WATCHLIST_FILE,
+                           WATCHLIST_WORKERS, WATCHLIST_BROWSERS, WATCHLIST_ENGINE)
+
+# Per-process state, set up by init_worker
+_worker = {}
+
+
+def parse_entry(row):
+    """(term, min, max) from a JSON object or a CSV row, or None for a blank line or header"""
+    if isinstance(row, dict):
+        term = row.get('term') or row.get('name')
+        low, high = row.get('min', row.get('min_price')), row.get('max', row.get('max_price'))
+    else:
+        row = [cell.strip() for cell in row] + ['', '']
+        term, low, high = row[0], row[1], row[2]
+        if term.lower() in ('term', 'name'):
+            return None
+    if not term:
+        return None
+    return str(term).strip(), str(low or FILTERS['min']), str(high or FILTERS['max'])
+
+
+def load_watchlist(path):
+    """Unique (term, min, max) entries in file order"""
+    entries = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.endswith('.csv'):
+            rows = csv.reader(line for line in f if not line.lstrip().startswith('#'))
+        else:
+            rows = (json.loads(line) for line in f if line.strip() and not line.lstrip().startswith('#'))
+        for row in rows:
+            entry = parse_entry(row)
+            if entry:
+                entries.append(entry)
+    return list(dict.fromkeys(entries))
+
+
+def init_worker(engine, browsers):
+    """Runs once in each worker process: its own browsers or its own Scrapy reactor"""
+    _worker['engine'] = engine
+    if engine == 'scrapy':
+        os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'amazon_scraper.settings')
+        from scrapy.utils.project import get_project_settings
+        from amazon_scraper.crawler_service import CrawlerService
+        settings = get_project_settings()
+        # Items come back to the parent, which does all the writing
+        settings.set('ITEM_PIPELINES', {})
+        _worker['crawler'] = CrawlerService(max_concurrent=1, settings=settings)
+    else:
+        from driver_pool import DriverPool
+        pool = DriverPool(size=browsers)
+        _worker['pool'] = pool
+        # Worker processes skip atexit, but multiprocessing runs its finalizers
+        Finalize(pool, pool.close, exitpriority=10)
+
+
+def fetch_entry(entry):
+    """Scrape one (term, min, max) in a worker; never writes, returns a result dict"""
+    term, low, high = entry
+    started = time.time()
+    result = {'term': term, 'min': low, 'max': high, 'pid': os.getpid(), 'engine': _worker.get('engine'),
+              'products': [], 'error': None}
+    try:
+        if _worker.get('engine') == 'scrapy':
+            products = _worker['crawler'].crawl(search_term=term, min_price=low, max_price=high, max_pages=5)
+        else:
+            from tracker import AmazonAPI
+            # The parent is the one writer, so workers keep no run journal of their own
+            amazon = AmazonAPI(term, {'min': low, 'max': high}, BASE_URL, CURRENCY, pool=_worker['pool'],
+                               allowed_sellers=ALLOWED_SELLERS if FILTER_BY_SELLER else None, checkpoint=False)
+            products = amazon.run()
+        result['products'] = [dict(p) for p in products or []]
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.time() - started
+    return result
+
+
+class WatchlistWriter:
+    """The one place results are written: database run, alerts and report history"""
+
+    def __init__(self, database=None, reports=True):
+        if database is None:
+            from storage import db as database
+            from alerts import alert_engine
+            alert_engine.attach(database)
+        self.db = database
+        self.reports = reports
+
+    def write(self, result):
+        filters = {'min': result['min'], 'max': result['max']}
+        if result['products']:
+            self.db.save_run(result['products'], result['term'], filters, result['engine'])
+        if self.reports:
+            from tracker import GenerateReport
+            GenerateReport(result['term'], filters, BASE_URL, CURRENCY, result['products'])
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct / 100 * len(values)))] if values else 0.0
+
+
+def print_summary(results, elapsed):
+    print(f"\n{'term':<32} {'status':<8} {'products':>8} {'seconds':>8}  pid")
+    for r in sorted(results, key=lambda r: -r['seconds']):
+        status = 'error' if r['error'] else ('ok' if r['products'] else 'empty')
+        print(f"{r['term'][:32]:<32} {status:<8} {len(r['products']):>8} {r['seconds']:>8.1f}  {r['pid']}")
+    ok = [r for r in results if r['products']]
+    latencies = [r['seconds'] for r in results]
+    print(f"\n{len(ok)} of {len(results)} terms succeeded, {sum(len(r['products']) for r in ok)} products | "
+          f"latency p50 {percentile(latencies, 50):.1f}s p95 {percentile(latencies, 95):.1f}s | "
+          f"{elapsed:.1f}s wall, {len(results) / elapsed * 60:.1f} terms/min")
+
+
+def run_watchlist(entries, workers=WATCHLIST_WORKERS, engine=WATCHLIST_ENGINE, browsers=WATCHLIST_BROWSERS,
+                  writer=None, fetch=fetch_entry):
+    """Fan entries out over worker processes and write each result as it arrives; returns the results"""
+    writer = writer or WatchlistWriter()
+    results = []
+    started = time.time()
+    # spawn: the parent holds threads and database connections that must not be forked
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                             initargs=(engine, browsers)) as executor:
+        futures = {executor.submit(fetch, entry): entry for entry in entries}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died
+                term, low, high = futures[future]
+                result = {'term': term, 'min': low, 'max': high, 'pid': None, 'engine': engine, 'products': [],
+                          'error': f"{type(e).__name__}: {e}", 'seconds': time.time() - started}
+            try:
+                writer.write(result)
+            except Exception as e:
+                print(f"Could not save results for '{result['term']}': {e}")
+            results.append(result)
+            note = result['error'] or f"{len(result['products'])} products"
+            print(f"[{len(results)}/{len(entries)}] {result['term']}: {note} in {result['seconds']:.1f}s")
+    print_summary(results, time.time() - started)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape many search terms in parallel worker processes')
+    parser.add_argument('file', nargs='?', default=WATCHLIST_FILE, help='JSONL or CSV watchlist')
+    parser.add_argument('--workers', type=int, default=WATCHLIST_WORKERS)
+    parser.add_argument('--engine', choices=['selenium', 'scrapy'], default=WATCHLIST_ENGINE)
+    parser.add_argument('--browsers', type=int, default=WATCHLIST_BROWSERS, help='browsers per worker')
+    parser.add_argument('--no-reports', action='store_true', help='only write the database')
+    args = parser.parse_args()
+
+    entries = load_watchlist(args.file)
+    print(f"Tracking {len(entries)} terms on {args.workers} {args.engine} workers...")
+    run_watchlist(entries, args.workers, args.engine, args.browsers, WatchlistWriter(reports=not args.no_reports))
+
+
+if __name__ == "__main__":
+    main()
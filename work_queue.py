@@ -0,0 +1,529 @@
+"""
+Durable queue of scrape work shared by any number of worker processes
+
+Producers (/run, scheduler.py) enqueue items of kind 'term' (one search)
+or 'asins' (a refresh batch); workers claim them with a lease:
+
+  - claim hides an item for WORK_QUEUE_LEASE seconds; a worker that dies
+    simply lets the lease run out and the item is claimed again
+  - heartbeats (sent with every progress report) extend the lease
+  - complete/fail only count if the caller still holds the lease token,
+    so a worker that lost its lease cannot overwrite the new owner
+  - failures are retried with exponential backoff; after
+    WORK_QUEUE_MAX_ATTEMPTS the item is dead-lettered for `retry`
+
+SQLiteQueue is the durable backend for processes sharing one disk;
+MemoryQueue is an in-process stand-in with the same behaviour. Other
+backends plug in by implementing WorkQueue.
+
+    python work_queue.py worker [--kinds term,asins]
+    python work_queue.py enqueue term "dog food" --min 200 --max 2000
+    python work_queue.py enqueue asins B07XYZ1234 B08ABC5678
+    python work_queue.py stats | list [--status dead] | retry ID
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from amazon_config import (WORK_QUEUE_BACKEND, WORK_QUEUE_DB, WORK_QUEUE_LEASE, WORK_QUEUE_MAX_ATTEMPTS,
+                           WORK_QUEUE_BACKOFF, WORK_QUEUE_BACKOFF_MAX, WORK_QUEUE_POLL, REFRESH_ENGINE)
+
+STATUSES = ('queued', 'leased', 'done', 'dead')
+ITEM_FIELDS = ['id', 'kind', 'payload', 'status', 'priority', 'attempts', 'max_attempts', 'available_at',
+               'lease_owner', 'lease_token', 'lease_expires', 'progress', 'last_error', 'result', 'created_at',
+               'updated_at']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'leased', 'done', 'dead')),
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    progress TEXT,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_work_items_ready ON work_items(status, priority DESC, available_at);
+CREATE INDEX IF NOT EXISTS idx_work_items_lease ON work_items(status, lease_expires);
+"""
+
+
+class WorkQueue(ABC):
+    """Interface every backend implements; a backend missing a method fails when it is created"""
+
+    def __init__(self, lease_seconds=WORK_QUEUE_LEASE, max_attempts=WORK_QUEUE_MAX_ATTEMPTS,
+                 backoff=WORK_QUEUE_BACKOFF, backoff_max=WORK_QUEUE_BACKOFF_MAX):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    def retry_delay(self, attempts):
+        # Full jitter on the upper half, so failed items from one burst don't retry in lockstep
+        return min(self.backoff * 2 ** (attempts - 1), self.backoff_max) * random.uniform(0.5, 1.0)
+
+    @abstractmethod
+    def enqueue(self, kind, payload, priority=0, delay=0, max_attempts=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, owner, kinds=None, lease_seconds=None):
+        """Lease the next ready item (dict with lease_token), or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self, item_id, token, progress=None, lease_seconds=None):
+        """Extend the lease; False if it is no longer ours"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, item_id, token, result=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, item_id, token, error):
+        """Schedule a retry with backoff, or dead-letter; returns the new status (None if the lease was lost)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, item_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list(self, status=None, limit=50):
+        raise NotImplementedError
+
+    @abstractmethod
+    def retry(self, item_id):
+        """Put a dead (or done) item back in the queue with fresh attempts"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self):
+        raise NotImplementedError
+
+
+class SQLiteQueue(WorkQueue):
+    def __init__(self, path=WORK_QUEUE_DB, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn, now) in one IMMEDIATE transaction, so claims never race"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            value = fn(conn, time.time())
+            conn.execute('COMMIT')
+            return value
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _item(row):
+        if row is None:
+            return None
+        item = dict(zip(ITEM_FIELDS, row))
+        item['payload'] = json.loads(item['payload'])
+        item['result'] = json.loads(item['result']) if item['result'] else None
+        return item
+
+    def enqueue(self, kind, payload, priority=0, delay=0, max_attempts=None):
+        def insert(conn, now):
+            return conn.execute(
+                """INSERT INTO work_items (kind, payload, priority, max_attempts, available_at, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (kind, json.dumps(payload), priority, max_attempts or self.max_attempts, now + delay, now, now)
+            ).lastrowid
+        return self._write(insert)
+
+    def claim(self, owner, kinds=None, lease_seconds=None):
+        lease_seconds = lease_seconds or self.lease_seconds
+        token = uuid.uuid4().hex
+        kind_sql = f" AND kind IN ({', '.join('?' * len(kinds))})" if kinds else ''
+
+        def take(conn, now):
+            # A lease that ran out on the last attempt means the worker died every time: dead-letter it
+            conn.execute(
+                """UPDATE work_items SET status = 'dead', lease_token = NULL, updated_at = ?,
+                          last_error = 'lease expired on attempt ' || attempts
+                   WHERE status = 'leased' AND lease_expires <= ? AND attempts >= max_attempts""",
+                (now, now)
+            )
+            row = conn.execute(
+                f"""UPDATE work_items SET status = 'leased', lease_owner = ?, lease_token = ?, lease_expires = ?,
+                           attempts = attempts + 1, updated_at = ?
+                    WHERE id = (SELECT id FROM work_items
+                                WHERE ((status = 'queued' AND available_at <= ?)
+                                       OR (status = 'leased' AND lease_expires <= ?)){kind_sql}
+                                ORDER BY priority DESC, available_at, id LIMIT 1)
+                    RETURNING {', '.join(ITEM_FIELDS)}""",
+                [owner, token, now + lease_seconds, now, now, now] + list(kinds or [])
+            ).fetchone()
+            return self._item(row)
+        return self._write(take)
+
+    def heartbeat(self, item_id, token, progress=None, lease_seconds=None):
+        lease_seconds = lease_seconds or self.lease_seconds
+
+        def extend(conn, now):
+            return conn.execute(
+                """UPDATE work_items SET lease_expires = ?, progress = IFNULL(?, progress), updated_at = ?
+                   WHERE id = ? AND lease_token = ? AND status = 'leased'""",
+                (now + lease_seconds, progress, now, item_id, token)
+            ).rowcount > 0
+        return self._write(extend)
+
+    def complete(self, item_id, token, result=None):
+        def finish(conn, now):
+            return conn.execute(
+                """UPDATE work_items SET status = 'done', result = ?, lease_token = NULL, updated_at = ?
+                   WHERE id = ? AND lease_token = ? AND status = 'leased'""",
+                (json.dumps(result), now, item_id, token)
+            ).rowcount > 0
+        return self._write(finish)
+
+    def fail(self, item_id, token, error):
+        def reschedule(conn, now):
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM work_items WHERE id = ? AND lease_token = ? AND status = 'leased'",
+                (item_id, token)
+            ).fetchone()
+            if row is None:
+                return None
+            attempts, max_attempts = row
+            status = 'dead' if attempts >= max_attempts else 'queued'
+            conn.execute(
+                """UPDATE work_items SET status = ?, available_at = ?, last_error = ?, lease_token = NULL,
+                          updated_at = ? WHERE id = ?""",
+                (status, now + self.retry_delay(attempts), str(error), now, item_id)
+            )
+            return status
+        return self._write(reschedule)
+
+    def get(self, item_id):
+        row = self._conn().execute(f"SELECT {', '.join(ITEM_FIELDS)} FROM work_items WHERE id = ?",
+                                   (item_id,)).fetchone()
+        return self._item(row)
+
+    def list(self, status=None, limit=50):
+        sql = f"SELECT {', '.join(ITEM_FIELDS)} FROM work_items"
+        params = []
+        if status:
+            sql += ' WHERE status = ?'
+            params.append(status)
+        rows = self._conn().execute(sql + ' ORDER BY id DESC LIMIT ?', params + [limit]).fetchall()
+        return [self._item(row) for row in rows]
+
+    def retry(self, item_id):
+        def requeue(conn, now):
+            return conn.execute(
+                """UPDATE work_items SET status = 'queued', attempts = 0, available_at = ?, lease_token = NULL,
+                          updated_at = ? WHERE id = ? AND status IN ('dead', 'done')""",
+                (now, now, item_id)
+            ).rowcount > 0
+        return self._write(requeue)
+
+    def stats(self):
+        conn = self._conn()
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM work_items GROUP BY status').fetchall())
+        now = time.time()
+        # How long the oldest ready item has been waiting for a worker; backing-off items don't count
+        oldest = conn.execute("SELECT MIN(available_at) FROM work_items WHERE status = 'queued' AND available_at <= ?",
+                              (now,)).fetchone()[0]
+        stats = {status: counts.get(status, 0) for status in STATUSES}
+        stats['oldest_ready_seconds'] = round(now - oldest, 1) if oldest else 0
+        return stats
+
+
+class MemoryQueue(WorkQueue):
+    """In-process stand-in for SQLiteQueue with the same lease semantics"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.items = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def enqueue(self, kind, payload, priority=0, delay=0, max_attempts=None):
+        now = time.time()
+        with self._lock:
+            item_id = self._next_id
+            self._next_id += 1
+            self.items[item_id] = dict(
+                dict.fromkeys(ITEM_FIELDS), id=item_id, kind=kind, payload=json.loads(json.dumps(payload)),
+                status='queued', priority=priority, attempts=0, max_attempts=max_attempts or self.max_attempts,
+                available_at=now + delay, created_at=now, updated_at=now
+            )
+        return item_id
+
+    def claim(self, owner, kinds=None, lease_seconds=None):
+        now = time.time()
+        with self._lock:
+            ready = []
+            for item in self.items.values():
+                expired = item['status'] == 'leased' and item['lease_expires'] <= now
+                if expired and item['attempts'] >= item['max_attempts']:
+                    item.update(status='dead', lease_token=None, updated_at=now,
+                                last_error=f"lease expired on attempt {item['attempts']}")
+                elif (expired or (item['status'] == 'queued' and item['available_at'] <= now)) and \
+                        (not kinds or item['kind'] in kinds):
+                    ready.append(item)
+            if not ready:
+                return None
+            item = min(ready, key=lambda i: (-i['priority'], i['available_at'], i['id']))
+            item.update(status='leased', lease_owner=owner, lease_token=uuid.uuid4().hex, updated_at=now,
+                        lease_expires=now + (lease_seconds or self.lease_seconds), attempts=item['attempts'] + 1)
+            return dict(item)
+
+    def _held(self, item_id, token):
+        item = self.items.get(item_id)
+        return item if item and item['status'] == 'leased' and item['lease_token'] == token else None
+
+    def heartbeat(self, item_id, token, progress=None, lease_seconds=None):
+        now = time.time()
+        with self._lock:
+            item = self._held(item_id, token)
+            if item is None:
+                return False
+            item.update(lease_expires=now + (lease_seconds or self.lease_seconds), updated_at=now)
+            if progress is not None:
+                item['progress'] = progress
+            return True
+
+    def complete(self, item_id, token, result=None):
+        with self._lock:
+            item = self._held(item_id, token)
+            if item is None:
+                return False
+            item.update(status='done', result=json.loads(json.dumps(result)), lease_token=None, updated_at=time.time())
+            return True
+
+    def fail(self, item_id, token, error):
+        now = time.time()
+        with self._lock:
+            item = self._held(item_id, token)
+            if item is None:
+                return None
+            status = 'dead' if item['attempts'] >= item['max_attempts'] else 'queued'
+            item.update(status=status, available_at=now + self.retry_delay(item['attempts']), last_error=str(error),
+                        lease_token=None, updated_at=now)
+            return status
+
+    def get(self, item_id):
+        with self._lock:
+            item = self.items.get(item_id)
+            return dict(item) if item else None
+
+    def list(self, status=None, limit=50):
+        with self._lock:
+            items = [dict(i) for i in self.items.values() if not status or i['status'] == status]
+        return sorted(items, key=lambda i: -i['id'])[:limit]
+
+    def retry(self, item_id):
+        now = time.time()
+        with self._lock:
+            item = self.items.get(item_id)
+            if not item or item['status'] not in ('dead', 'done'):
+                return False
+            item.update(status='queued', attempts=0, available_at=now, lease_token=None, updated_at=now)
+            return True
+
+    def stats(self):
+        with self._lock:
+            items = list(self.items.values())
+        stats = {status: sum(1 for i in items if i['status'] == status) for status in STATUSES}
+        now = time.time()
+        ready = [i['available_at'] for i in items if i['status'] == 'queued' and i['available_at'] <= now]
+        stats['oldest_ready_seconds'] = round(now - min(ready), 1) if ready else 0
+        return stats
+
+
+def make_queue(backend=WORK_QUEUE_BACKEND):
+    if backend == 'memory':
+        return MemoryQueue()
+    if backend == 'sqlite':
+        return SQLiteQueue()
+    raise ValueError(f"Unknown work queue backend: {backend}")
+
+
+class LeaseLost(Exception):
+    """Raised from a worker's progress callback once its lease has expired or been taken"""
+
+
+class QueuedJob:
+    """What the scrape functions expect from a job: its config and a progress callback"""
+
+    def __init__(self, config, report):
+        self.config = config
+        self.report = report
+
+
+def handle_term(payload, report):
+    # The same code path as an in-process /run job
+    from scrape import scrape_term
+    return scrape_term(QueuedJob(payload, report))
+
+
+def handle_asins(payload, report):
+    from refresh import Refresher
+    return Refresher(progress=report).run(payload['asins'], payload.get('term'), payload.get('engine', REFRESH_ENGINE))
+
+
+HANDLERS = {'term': handle_term, 'asins': handle_asins}
+
+
+class QueueWorker:
+    def __init__(self, queue, handlers=None, owner=None, kinds=None, poll=WORK_QUEUE_POLL):
+        self.queue = queue
+        self.handlers = handlers or HANDLERS
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.kinds = kinds or list(self.handlers)
+        self.poll = poll
+        self.stats = {'claimed': 0, 'done': 0, 'failed': 0, 'lost': 0}
+
+    def run_once(self):
+        """Claim and process one item; False if nothing was ready"""
+        item = self.queue.claim(self.owner, self.kinds)
+        if item is None:
+            return False
+        self.stats['claimed'] += 1
+        item_id, token = item['id'], item['lease_token']
+        done = threading.Event()
+        lost = threading.Event()
+
+        def beat(progress=None):
+            if not self.queue.heartbeat(item_id, token, progress):
+                lost.set()
+
+        def report(message, **extra):
+            # Another worker owns the item now; stop rather than scrape and save it twice
+            if lost.is_set():
+                raise LeaseLost(f"Work item {item_id} lease lost")
+            print(f"[work {item_id}] {message}")
+            beat(message)
+
+        def keep_alive():
+            # Covers long stretches without progress reports
+            while not done.wait(self.queue.lease_seconds / 3):
+                beat()
+
+        print(f"[work {item_id}] {item['kind']} attempt {item['attempts']}/{item['max_attempts']}")
+        threading.Thread(target=keep_alive, daemon=True).start()
+        try:
+            result = self.handlers[item['kind']](item['payload'], report)
+        except LeaseLost:
+            done.set()
+            self.stats['lost'] += 1
+            print(f"[work {item_id}] stopped after its lease was lost")
+            return True
+        except Exception as e:
+            done.set()
+            status = self.queue.fail(item_id, token, f"{type(e).__name__}: {e}")
+            self.stats['failed' if status else 'lost'] += 1
+            print(f"[work {item_id}] failed ({e}); now {status or 'owned by another worker'}")
+            return True
+        done.set()
+        if self.queue.complete(item_id, token, result):
+            self.stats['done'] += 1
+        else:
+            self.stats['lost'] += 1
+            print(f"[work {item_id}] finished after its lease was lost; result discarded")
+        return True
+
+    def run_forever(self, stop=None):
+        stop = stop or threading.Event()
+        print(f"Worker {self.owner} taking {', '.join(self.kinds)} work")
+        while not stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                print(f"Worker error: {e}")
+            stop.wait(self.poll)
+
+
+def start_workers(queue, count):
+    """Worker threads in this process, for the memory backend"""
+    threads = []
+    for i in range(count):
+        worker = QueueWorker(queue, owner=f"local-{i}")
+        thread = threading.Thread(target=worker.run_forever, name=f'queue-worker-{i}', daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+# Global queue the producers write to
+work_queue = make_queue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared scrape work queue')
+    sub = parser.add_subparsers(dest='command', required=True)
+    worker = sub.add_parser('worker', help='claim and run work until interrupted')
+    worker.add_argument('--kinds', help='comma-separated kinds to take (default: all)')
+    enqueue = sub.add_parser('enqueue')
+    enqueue.add_argument('kind', choices=list(HANDLERS))
+    enqueue.add_argument('values', nargs='+', help='search term, or ASINs')
+    enqueue.add_argument('--min', default=None)
+    enqueue.add_argument('--max', default=None)
+    enqueue.add_argument('--priority', type=int, default=0)
+    sub.add_parser('stats')
+    listing = sub.add_parser('list')
+    listing.add_argument('--status', choices=STATUSES)
+    listing.add_argument('--limit', type=int, default=20)
+    retry = sub.add_parser('retry')
+    retry.add_argument('id', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        QueueWorker(work_queue, kinds=args.kinds.split(',') if args.kinds else None).run_forever()
+    elif args.command == 'enqueue':
+        if args.kind == 'term':
+            from amazon_config import FILTERS
+            payload = {'name': ' '.join(args.values).replace(' ', '_'), 'min': args.min or FILTERS['min'],
+                       'max': args.max or FILTERS['max']}
+        else:
+            payload = {'asins': args.values}
+        print(f"Enqueued work item {work_queue.enqueue(args.kind, payload, priority=args.priority)}")
+    elif args.command == 'stats':
+        print(json.dumps(work_queue.stats(), indent=2))
+    elif args.command == 'list':
+        for item in work_queue.list(args.status, args.limit):
+            print(f"{item['id']:>6} {item['kind']:<6} {item['status']:<7} attempts {item['attempts']}/{item['max_attempts']} "
+                  f"{json.dumps(item['payload'])[:60]} {item['last_error'] or item['progress'] or ''}")
+    elif args.command == 'retry':
+        print('Requeued' if work_queue.retry(args.id) else 'Only dead or done items can be retried')
+
+
+if __name__ == "__main__":
+    main()